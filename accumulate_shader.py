@@ -0,0 +1,15 @@
+ACCUMULATE_SHADER = """
+#version 330 core
+out vec4 FragColor;
+
+uniform sampler2D sample_color;
+uniform sampler2D history;
+uniform float weight; // 1 / number of samples including this one
+
+void main() {
+    ivec2 pixel = ivec2(gl_FragCoord.xy);
+    vec4 current = texelFetch(sample_color, pixel, 0);
+    vec4 previous = texelFetch(history, pixel, 0);
+    FragColor = mix(previous, current, weight);
+}
+"""
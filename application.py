@@ -1,28 +1,81 @@
 import glfw
 from OpenGL.GL import *
-from OpenGL.GL.shaders import compileProgram, compileShader
-import numpy as np
-from fragment_shader import FRAGMENT_SHADER
-from vertex_shader import VERTEX_SHADER
 from utils import mouse_callback
-from camera import Camera
-from light import Light
+from camera import Camera, MOVEMENT_KEYS
+from light import LightArray
+from scene import create_default_scene, animate_lights
+from gl_renderer import GLRenderer
+from progressive import ProgressiveRenderer
+from dynamic_resolution import DynamicResolution
+from temporal import TemporalReprojection
+from diagnostics import Diagnostics
+from path_tracer import PathTracer
+from profiler import FrameProfiler, NullProfiler, StartupTimer
+from render_target import RenderTarget
+from readback import PixelReader
+from simulation import Simulation
+from scene_file import load_scene, SceneWatcher
 
 class Application:
-    def __init__(self, width=1200, height=800, title=""):
+    def __init__(self, width=1200, height=800, title="", progressive=False, dynamic_resolution=False, target_fps=60.0,
+                 profile=False, trace_path=None, export=None, max_bounces=6, temporal=None, vsync=True,
+                 simulation_rate=60.0, scene=None, diagnostics=False, path_samples=None, started=None):
+        if sum(map(bool, (progressive, dynamic_resolution, temporal, diagnostics, path_samples))) > 1:
+            raise Exception("Progressive rendering, dynamic resolution, temporal reprojection, diagnostics and path "
+                            "tracing cannot be combined")
         self.width = width
         self.height = height
         self.title = title
+        self.progressive = progressive
+        self.dynamic_resolution = dynamic_resolution
+        # trace pattern name ("checkerboard" or "interleaved") to reuse the previous frame
+        self.temporal = temporal
+        # per-pixel cost counters shown as a heatmap, C picks the counter and F2 saves them
+        self.diagnostics = diagnostics
+        # path-traced samples per frame, denoised; a still view keeps adding samples
+        self.path_samples = path_samples
+        self.counter_key_down = False
+        self.save_key_down = False
+        self.saved_counters = 0
+        self.target_fps = target_fps
+        self.profiler = FrameProfiler() if profile or trace_path else NullProfiler()
+        self.trace_path = trace_path
+        # (path, writer) to render a scripted camera path to a sequence instead of running interactively
+        self.export = export
+        # the files the export wrote
+        self.exported = []
+        self.max_bounces = max_bounces
+        # without vsync frames are drawn as fast as the GPU allows, the simulation keeps its own rate
+        self.vsync = vsync
+        self.simulation_rate = simulation_rate
+        # JSON or TOML scene file (see scene_file.py), reloaded whenever it changes
+        self.scene_path = scene
+        self.report_key_down = False
         self.camera = Camera(position=[-0.63, -0.2, -2.6], direction=[-0.4, -0.4,  0.8], yaw=116.0, pitch=-23.0)
         self.lastX = width / 2
         self.lastY = height / 2
         self.first_mouse = True
+        self.pause_key_down = False
+        # time-to-first-frame, measured from `started` (perf_counter) or from here
+        self.startup = StartupTimer(started)
+        self.startup.mark("imports")
 
+        # The window stays hidden until the scene is ready. Once the scene is loaded,
+        # the programs its first frame needs build while the BVH is built.
         self.init_window()
-        self.init_buffers()
-        self.init_shaders()
-        self.init_lights()
-        self.main_loop()
+        self.startup.mark("window")
+        self.init_renderer()
+        self.startup.mark("renderer")
+        self.init_scene()
+        self.renderer.request_variants(self.scene, sparse=bool(self.temporal), diagnostics=self.diagnostics,
+                                       path_trace=bool(self.path_samples))
+        self.scene.bvh()
+        self.startup.mark("scene")
+        glfw.show_window(self.window)
+        if self.export:
+            self.export_loop(*self.export)
+        else:
+            self.main_loop()
 
     def init_window(self):
         if not glfw.init():
@@ -32,6 +85,7 @@ class Application:
         glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, 3)
         glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
         glfw.window_hint(glfw.OPENGL_FORWARD_COMPAT, GL_TRUE)
+        glfw.window_hint(glfw.VISIBLE, glfw.FALSE)
 
         self.window = glfw.create_window(self.width, self.height, self.title, None, None)
         if not self.window:
@@ -39,101 +93,183 @@ class Application:
             raise Exception("Failed to create GLFW window")
 
         glfw.make_context_current(self.window)
+        glfw.swap_interval(1 if self.vsync else 0)
         glfw.set_input_mode(self.window, glfw.CURSOR, glfw.CURSOR_DISABLED)
 
         glfw.set_cursor_pos_callback(self.window, mouse_callback)
         glfw.set_window_user_pointer(self.window, self)
 
-    def init_buffers(self):
-        vertices = np.array([
-            -1.0, -1.0,
-             1.0, -1.0,
-            -1.0,  1.0,
-             1.0,  1.0,
-        ], dtype=np.float32)
-
-        self.vao = glGenVertexArrays(1)
-        glBindVertexArray(self.vao)
-
-        self.vbo = glGenBuffers(1)
-        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
-
-    def init_shaders(self):
-        self.shader = compileProgram(
-            compileShader(VERTEX_SHADER, GL_VERTEX_SHADER),
-            compileShader(FRAGMENT_SHADER, GL_FRAGMENT_SHADER)
-        )
-        glUseProgram(self.shader)
-
-        position = glGetAttribLocation(self.shader, "position")
-        glEnableVertexAttribArray(position)
-        glVertexAttribPointer(position, 2, GL_FLOAT, GL_FALSE, 0, None)
-
-        self.resolution_loc = glGetUniformLocation(self.shader, "resolution")
-        self.time_loc = glGetUniformLocation(self.shader, "time")
-        self.camera_pos_loc = glGetUniformLocation(self.shader, "camera_pos")
-        self.camera_dir_loc = glGetUniformLocation(self.shader, "camera_dir")
-
-        glBindVertexArray(0)
-
-    def init_lights(self):
-        self.lights = [
-            Light(position=[5.0, 5.0, -10.0], color=[0.4, 0.4, 0.4]),
-            Light(position=[-5.0, 100.0, 0.0], color=[0.3, 0.5, 0.5]),
-            Light(position=[0.0, 5.0, 0.0], color=[0.5, 0.5, 0.5]),
-            Light(position=[-5.0, 5.0, 0.0], color=[0.2, 0.2, 0.1]),
-            Light(position=[0.0, 5.0, 0.0], color=[0.3, 0.1, 1.0]),
-        ]
-        self.light_uniforms = []
-        for i in range(len(self.lights)):
-            position_loc = glGetUniformLocation(self.shader, f"lights[{i}].position")
-            color_loc = glGetUniformLocation(self.shader, f"lights[{i}].color")
-            self.light_uniforms.append((position_loc, color_loc))
+    def init_renderer(self):
+        self.renderer = GLRenderer(max_bounces=self.max_bounces, profiler=self.profiler)
+        if isinstance(self.profiler, FrameProfiler):
+            self.renderer.gpu_listeners.append(self.profiler.record_gpu)
+        # optional render paths that draw off-screen and present the result to the window
+        self.render_path = None
+        if self.progressive:
+            self.render_path = ProgressiveRenderer(self.renderer, self.width, self.height)
+        elif self.dynamic_resolution:
+            self.render_path = DynamicResolution(self.renderer, self.width, self.height, self.target_fps)
+        elif self.temporal:
+            self.render_path = TemporalReprojection(self.renderer, self.width, self.height, self.temporal)
+        elif self.diagnostics:
+            self.render_path = Diagnostics(self.renderer, self.width, self.height)
+        elif self.path_samples:
+            self.render_path = PathTracer(self.renderer, self.width, self.height, self.path_samples)
 
-    def main_loop(self):
-        while not glfw.window_should_close(self.window):
-            glfw.poll_events()
-            self.process_input()
+    def init_scene(self):
+        self.scene_watcher = None
+        if self.scene_path:
+            self.scene, camera = load_scene(self.scene_path)
+            if camera is not None:
+                self.camera = camera
+            self.scene_watcher = SceneWatcher(self.scene_path)
+        else:
+            self.scene = create_default_scene()
+        self.lights = self.scene.lights
+        # the simulation steps its own camera and lights, self.camera and the scene's
+        # lights get the interpolated state before every frame
+        camera = Camera(position=self.camera.position, yaw=self.camera.yaw, pitch=self.camera.pitch,
+                        speed=self.camera.speed, sensitivity=self.camera.sensitivity)
+        lights = LightArray.from_data(self.lights.data.copy())
+        # only the built-in scene has an animated light
+        self.animate = None if self.scene_path else animate_lights
+        self.simulation = Simulation(camera, lights, self.animate, self.simulation_rate)
 
-            current_time = glfw.get_time()
-            self.update_lights(current_time)
+    def reload_scene(self):
+        # The new scene replaces the old one, the renderer then uploads the buffers whose
+        # contents changed. Shaders are kept unless the number of lights changes.
+        try:
+            scene, _ = load_scene(self.scene_path)
+        except Exception as e:
+            # a file that is being written or has a mistake in it keeps the current scene
+            print(f"Could not reload {self.scene_path}: {e}")
+            return
+        self.scene = scene
+        self.lights = scene.lights
+        self.simulation.set_lights(LightArray.from_data(self.lights.data.copy()))
 
-            glClear(GL_COLOR_BUFFER_BIT)
-
-            glUseProgram(self.shader)
-            glBindVertexArray(self.vao)
+    def main_loop(self):
+        self.simulation.start()
+        while not glfw.window_should_close(self.window):
+            self.profiler.begin_frame()
+            with self.profiler.section("poll_events"):
+                glfw.poll_events()
+            with self.profiler.section("process_input"):
+                self.process_input()
 
-            glUniform2f(self.resolution_loc, self.width, self.height)
-            glUniform1f(self.time_loc, current_time)
-            glUniform3f(self.camera_pos_loc, *self.camera.position)
-            glUniform3f(self.camera_dir_loc, *self.camera.direction)
+            if self.scene_watcher and self.scene_watcher.changed(glfw.get_time()):
+                with self.profiler.section("reload_scene"):
+                    self.reload_scene()
 
-            for i, light in enumerate(self.lights):
-                pos_loc, col_loc = self.light_uniforms[i]
-                glUniform3f(pos_loc, *light.position)
-                glUniform3f(col_loc, *light.color)
+            with self.profiler.section("interpolate"):
+                current_time = self.simulation.interpolate(self.camera, self.lights)
 
-            glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
-            glBindVertexArray(0)
+            with self.profiler.section("render"):
+                if self.render_path:
+                    self.render_path.draw(self.camera, self.scene, current_time)
+                    self.render_path.present(self.width, self.height)
+                else:
+                    self.renderer.draw(self.camera, self.scene, current_time, self.width, self.height)
 
-            glfw.swap_buffers(self.window)
+            with self.profiler.section("swap_buffers"):
+                glfw.swap_buffers(self.window)
+            self.profiler.end_frame()
+            if self.startup is not None:
+                glFinish()
+                self.startup.mark("first_frame")
+                print(self.startup.format_report())
+                self.startup = None
 
             # debug
             # print(self.camera.position, self.camera.direction, self.camera.yaw, self.camera.pitch)
 
         self.cleanup()
 
+    def export_loop(self, path, writer):
+        # Frames use the path's times, not the clock, so the output only depends on the
+        # path. Each frame is drawn off-screen, queued for readback and shown in the
+        # window; the previous frame's pixels go to the writer's encoder threads.
+        target = RenderTarget(self.width, self.height)
+        reader = PixelReader()
+        reader.start(self.width, self.height, writer.dtype)
+        written = 0
+        try:
+            for camera, time in path:
+                glfw.poll_events()
+                if glfw.window_should_close(self.window):
+                    break
+                self.profiler.begin_frame()
+                self.update_lights(time)
+                with self.profiler.section("render"):
+                    target.bind()
+                    self.renderer.draw(camera, self.scene, time, self.width, self.height)
+                with self.profiler.section("readback"):
+                    pixels = reader.read()
+                if pixels is not None:
+                    writer.write(written, pixels)
+                    written += 1
+
+                glBindFramebuffer(GL_READ_FRAMEBUFFER, target.fbo)
+                glBindFramebuffer(GL_DRAW_FRAMEBUFFER, 0)
+                glBlitFramebuffer(0, 0, self.width, self.height, 0, 0, self.width, self.height, GL_COLOR_BUFFER_BIT, GL_NEAREST)
+                glBindFramebuffer(GL_FRAMEBUFFER, 0)
+                glfw.swap_buffers(self.window)
+                self.profiler.end_frame()
+
+            pixels = reader.flush()
+            if pixels is not None:
+                writer.write(written, pixels)
+        finally:
+            self.exported = writer.close()
+            reader.cleanup()
+            target.cleanup()
+            self.cleanup()
+
     def update_lights(self, time):
-        self.lights[0].position[0] = 5.0 * np.cos(time)
-        self.lights[0].position[2] = 5.0 * np.sin(time)
+        if self.animate is not None:
+            self.animate(self.lights, time)
 
     def process_input(self):
-        self.camera.process_keyboard(self.window)
+        self.simulation.set_keys(key for key in MOVEMENT_KEYS if glfw.get_key(self.window, key) == glfw.PRESS)
         if glfw.get_key(self.window, glfw.KEY_ESCAPE) == glfw.PRESS:
             glfw.set_window_should_close(self.window, True)
 
+        report_key_down = glfw.get_key(self.window, glfw.KEY_F1) == glfw.PRESS
+        if report_key_down and not self.report_key_down and isinstance(self.profiler, FrameProfiler):
+            print(self.profiler.format_report())
+        self.report_key_down = report_key_down
+
+        pause_key_down = glfw.get_key(self.window, glfw.KEY_P) == glfw.PRESS
+        if pause_key_down and not self.pause_key_down:
+            # while paused the scene stays frozen, which lets progressive rendering converge
+            self.simulation.toggle_pause()
+        self.pause_key_down = pause_key_down
+
+        if isinstance(self.render_path, Diagnostics):
+            self.process_diagnostics_input(self.render_path)
+
+    def process_diagnostics_input(self, diagnostics):
+        counter_key_down = glfw.get_key(self.window, glfw.KEY_C) == glfw.PRESS
+        if counter_key_down and not self.counter_key_down:
+            counter = diagnostics.next_counter()
+            print(f"Showing {counter}: {diagnostics.totals().get(counter)}")
+        self.counter_key_down = counter_key_down
+
+        save_key_down = glfw.get_key(self.window, glfw.KEY_F2) == glfw.PRESS
+        if save_key_down and not self.save_key_down and diagnostics.counters:
+            path = f"counters_{self.saved_counters:04d}"
+            diagnostics.save(path)
+            self.saved_counters += 1
+            print(f"Saved {path}.npz and {path}.json")
+        self.save_key_down = save_key_down
+
     def cleanup(self):
-        glDeleteVertexArrays(1, [self.vao])
-        glDeleteBuffers(1, [self.vbo])
+        self.simulation.stop()
+        if isinstance(self.profiler, FrameProfiler):
+            print(self.profiler.format_report())
+            if self.trace_path:
+                self.profiler.dump(self.trace_path)
+        if self.render_path:
+            self.render_path.cleanup()
+        self.renderer.cleanup()
         glfw.terminate()
@@ -0,0 +1,298 @@
+import argparse
+import itertools
+import json
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+from camera_path import PATHS
+from scene import create_default_scene, create_random_scene, default_lights, animate_lights
+
+DEFAULT_SPHERE_COUNT = 27
+
+
+def parse_resolution(value):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def make_scene(num_spheres, num_lights, seed=0):
+    if num_spheres == DEFAULT_SPHERE_COUNT:
+        scene = create_default_scene()
+    else:
+        scene = create_random_scene(num_spheres, num_lights, seed=seed, extent=max(4.0, np.sqrt(num_spheres) * 0.4))
+    lights = default_lights()[:num_lights]
+    if num_lights > len(lights):
+        lights += create_random_scene(0, num_lights - len(lights), seed=seed).lights
+    scene.lights = lights
+    return scene
+
+
+class GLBackend:
+    name = "gl"
+    path_trace = False
+
+    def __init__(self):
+        # must come first so PyOpenGL picks EGL when there is no display
+        from offscreen import OffscreenRenderer
+        from OpenGL.GL import glFinish, glGetString, GL_RENDERER
+        self.offscreen = OffscreenRenderer(64, 64)
+        self.finish = glFinish
+        self.device = glGetString(GL_RENDERER).decode()
+
+    def prepare(self, scene, width, height, bounces):
+        # one renderer serves all cases, the programs of this one build during warmup
+        self.offscreen.resize(width, height)
+        self.offscreen.renderer.max_bounces = bounces
+        self.offscreen.renderer.request_variants(scene, path_trace=self.path_trace)
+        self.scene = scene
+
+    def render(self, camera, time):
+        self.offscreen.target.bind()
+        self.offscreen.renderer.draw(camera, self.scene, time, self.offscreen.width, self.offscreen.height)
+        self.finish()
+        return None
+
+    def cleanup(self):
+        self.offscreen.cleanup()
+
+
+class DeferredGLBackend(GLBackend):
+    name = "gl-deferred"
+
+    def prepare(self, scene, width, height, bounces):
+        self.offscreen.renderer.deferred = True
+        super().prepare(scene, width, height, bounces)
+
+
+class PathTracedGLBackend(GLBackend):
+    # PATH_SAMPLES denoised samples per frame, every frame starts from scratch
+    name = "gl-path"
+    path_trace = True
+
+    def prepare(self, scene, width, height, bounces):
+        from path_tracer import PathTracer
+        super().prepare(scene, width, height, bounces)
+        self.cleanup_path_tracer()
+        self.path_tracer = PathTracer(self.offscreen.renderer, width, height)
+
+    def render(self, camera, time):
+        self.path_tracer.reset()
+        self.path_tracer.draw(camera, self.scene, time)
+        self.finish()
+        return None
+
+    def cleanup_path_tracer(self):
+        if getattr(self, "path_tracer", None) is not None:
+            self.path_tracer.cleanup()
+            self.path_tracer = None
+
+    def cleanup(self):
+        self.cleanup_path_tracer()
+        super().cleanup()
+
+
+class CPUBackend:
+    name = "cpu"
+    device = "numpy"
+
+    def prepare(self, scene, width, height, bounces):
+        from cpu_renderer import CPURenderer
+        self.renderer = CPURenderer(scene, width, height, max_bounces=bounces)
+        self.scene = scene
+        scene.bvh()
+
+    def render(self, camera, time):
+        self.renderer.render(camera)
+        return self.renderer.ray_count
+
+    def cleanup(self):
+        pass
+
+
+class WavefrontBackend(CPUBackend):
+    name = "cpu-wavefront"
+
+    def prepare(self, scene, width, height, bounces):
+        from wavefront import WavefrontRenderer
+        self.renderer = WavefrontRenderer(scene, width, height, max_bounces=bounces)
+        self.scene = scene
+        scene.bvh()
+
+
+class CachedBackend(CPUBackend):
+    name = "cpu-cached"
+
+    def prepare(self, scene, width, height, bounces):
+        from cpu_renderer import CPURenderer
+        from lighting_cache import LightingCache
+        self.renderer = CPURenderer(scene, width, height, max_bounces=bounces)
+        self.cache = LightingCache(self.renderer)
+        self.scene = scene
+        scene.bvh()
+
+    def render(self, camera, time):
+        self.cache.render(camera)
+        return self.renderer.ray_count
+
+
+class PathTracedBackend(CPUBackend):
+    name = "cpu-path"
+
+    def render(self, camera, time):
+        self.renderer.render_path_traced(camera)
+        return self.renderer.ray_count
+
+
+class TiledBackend:
+    name = "cpu-tiled"
+
+    def __init__(self):
+        import os
+        self.device = f"numpy x{os.cpu_count()} processes"
+        self.renderer = None
+
+    def prepare(self, scene, width, height, bounces):
+        from tiled_renderer import TiledRenderer
+        self.cleanup()
+        self.renderer = TiledRenderer(scene, width, height, max_bounces=bounces)
+
+    def render(self, camera, time):
+        self.renderer.render(camera)
+        return self.renderer.ray_count
+
+    def cleanup(self):
+        if self.renderer is not None:
+            self.renderer.cleanup()
+            self.renderer = None
+
+
+BACKENDS = {"gl": GLBackend, "gl-deferred": DeferredGLBackend, "gl-path": PathTracedGLBackend, "cpu": CPUBackend,
+            "cpu-tiled": TiledBackend, "cpu-wavefront": WavefrontBackend, "cpu-cached": CachedBackend,
+            "cpu-path": PathTracedBackend}
+
+
+def case_key(backend, width, height, bounces, lights, spheres, path):
+    return f"{backend}/{width}x{height}/b{bounces}/l{lights}/s{spheres}/{path}"
+
+
+def run_case(backend, width, height, bounces, num_lights, num_spheres, path_name, frames, warmup):
+    scene = make_scene(num_spheres, num_lights)
+    backend.prepare(scene, width, height, bounces)
+    path = PATHS[path_name](frames)
+
+    for camera, t in path[:warmup]:
+        animate_lights(scene.lights, t)
+        backend.render(camera, t)
+
+    frame_ms = []
+    rays = 0
+    for camera, t in path:
+        animate_lights(scene.lights, t)
+        start = time.perf_counter()
+        traced = backend.render(camera, t)
+        frame_ms.append((time.perf_counter() - start) * 1000.0)
+        rays += traced or 0
+
+    frame_ms = np.array(frame_ms)
+    total_s = frame_ms.sum() / 1000.0
+    result = {
+        "key": case_key(backend.name, width, height, bounces, num_lights, num_spheres, path_name),
+        "backend": backend.name,
+        "width": width,
+        "height": height,
+        "bounces": bounces,
+        "lights": num_lights,
+        "spheres": num_spheres,
+        "path": path_name,
+        "frames": len(frame_ms),
+        "ms_per_frame": float(np.median(frame_ms)),
+        "ms_mean": float(frame_ms.mean()),
+        "ms_p95": float(np.percentile(frame_ms, 95)),
+        "fps": len(frame_ms) / total_s,
+        "primary_rays_per_sec": width * height * len(frame_ms) / total_s,
+    }
+    # only the CPU renderer can count secondary and shadow rays
+    if rays:
+        result["rays_per_sec"] = rays / total_s
+    return result
+
+
+def metadata(backends):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "devices": {backend.name: backend.device for backend in backends},
+    }
+
+
+def compare(results, baseline, tolerance):
+    # returns the keys that got slower than baseline * (1 + tolerance)
+    previous = {r["key"]: r for r in baseline["results"]}
+    regressions = []
+    print(f"{'case':<48}{'baseline':>12}{'current':>12}{'change':>10}")
+    for result in results:
+        old = previous.get(result["key"])
+        if old is None:
+            continue
+        change = result["ms_per_frame"] / old["ms_per_frame"] - 1.0
+        flag = ""
+        if change > tolerance:
+            regressions.append(result["key"])
+            flag = "  REGRESSION"
+        print(f"{result['key']:<48}{old['ms_per_frame']:>10.2f}ms{result['ms_per_frame']:>10.2f}ms{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render scripted camera paths headless and report frame times.")
+    parser.add_argument("--backend", nargs="+", default=["gl"], choices=sorted(BACKENDS))
+    parser.add_argument("--resolution", nargs="+", default=["320x200", "640x400"], type=parse_resolution)
+    parser.add_argument("--bounces", nargs="+", default=[1, 6], type=int)
+    parser.add_argument("--lights", nargs="+", default=[1, 5], type=int)
+    parser.add_argument("--spheres", nargs="+", default=[DEFAULT_SPHERE_COUNT, 1000], type=int)
+    parser.add_argument("--path", nargs="+", default=["orbit"], choices=sorted(PATHS))
+    parser.add_argument("--frames", default=10, type=int)
+    parser.add_argument("--warmup", default=2, type=int)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", default=0.1, type=float, help="allowed slowdown before a case counts as a regression")
+    args = parser.parse_args(argv)
+
+    backends = [BACKENDS[name]() for name in args.backend]
+    results = []
+    try:
+        for backend in backends:
+            for (width, height), bounces, lights, spheres, path in itertools.product(
+                    args.resolution, args.bounces, args.lights, args.spheres, args.path):
+                result = run_case(backend, width, height, bounces, lights, spheres, path, args.frames, args.warmup)
+                results.append(result)
+                print(f"{result['key']:<48}{result['ms_per_frame']:>10.2f} ms/frame{result['fps']:>10.1f} fps"
+                      f"{result['primary_rays_per_sec'] / 1e6:>10.2f} Mrays/s")
+    finally:
+        for backend in backends:
+            backend.cleanup()
+
+    report = {"meta": metadata(backends), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
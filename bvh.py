@@ -0,0 +1,255 @@
+import hashlib
+import os
+import numpy as np
+
+MAX_LEAF_SIZE = 8
+# everything intersect(), occluded() and pack() need
+CACHED_ARRAYS = ("node_min", "node_max", "skip", "prim_start", "prim_count", "prim_indices")
+
+
+class BVH:
+    # Flattened in depth-first order: the left child of an interior node is the next
+    # node, and `skip` points past the node's subtree. Following `skip` on a miss (or
+    # after a leaf) walks the tree without a stack; the walk ends at node_count.
+    def __init__(self, bounds_min, bounds_max, leaf_size=4, num_bins=16):
+        self.leaf_size = leaf_size
+        self.num_bins = num_bins
+
+        self.prim_min = np.asarray(bounds_min, dtype=np.float32).reshape(-1, 3)
+        self.prim_max = np.asarray(bounds_max, dtype=np.float32).reshape(-1, 3)
+        self.centroids = (self.prim_min + self.prim_max) * 0.5
+        self.prim_indices = np.arange(len(self.prim_min), dtype=np.int32)
+
+        self._min, self._max, self._skip, self._start, self._count = [], [], [], [], []
+        if len(self.prim_indices):
+            self._build(0, len(self.prim_indices))
+
+        self.node_min = np.array(self._min, dtype=np.float32).reshape(-1, 3)
+        self.node_max = np.array(self._max, dtype=np.float32).reshape(-1, 3)
+        self.skip = np.array(self._skip, dtype=np.int32)
+        self.prim_start = np.array(self._start, dtype=np.int32)
+        self.prim_count = np.array(self._count, dtype=np.int32)
+        del self._min, self._max, self._skip, self._start, self._count, self.centroids
+
+    @classmethod
+    def from_spheres(cls, centers, radii, **kwargs):
+        centers = np.asarray(centers, dtype=np.float32).reshape(-1, 3)
+        radii = np.asarray(radii, dtype=np.float32).reshape(-1, 1)
+        return cls(centers - radii, centers + radii, **kwargs)
+
+    @classmethod
+    def from_arrays(cls, arrays, leaf_size=4, num_bins=16):
+        # a tree built earlier, `arrays` maps the CACHED_ARRAYS names to their contents
+        bvh = cls.__new__(cls)
+        bvh.leaf_size, bvh.num_bins = leaf_size, num_bins
+        for name in CACHED_ARRAYS:
+            setattr(bvh, name, arrays[name])
+        return bvh
+
+    @classmethod
+    def cached(cls, bounds_min, bounds_max, cache_dir, leaf_size=4, num_bins=16):
+        # Building in NumPy takes seconds for large meshes, so the flattened tree is
+        # stored on disk, keyed by the primitive bounds and the build settings
+        bounds_min = np.ascontiguousarray(bounds_min, dtype=np.float32).reshape(-1, 3)
+        bounds_max = np.ascontiguousarray(bounds_max, dtype=np.float32).reshape(-1, 3)
+        digest = hashlib.sha256(bounds_min.tobytes() + bounds_max.tobytes() + f"|{leaf_size}|{num_bins}".encode())
+        path = os.path.join(cache_dir, digest.hexdigest() + ".bvh.npz")
+        if os.path.exists(path):
+            with np.load(path) as arrays:
+                return cls.from_arrays(arrays, leaf_size, num_bins)
+
+        bvh = cls(bounds_min, bounds_max, leaf_size, num_bins)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **{name: getattr(bvh, name) for name in CACHED_ARRAYS})
+        os.replace(tmp_path, path)
+        return bvh
+
+    @property
+    def node_count(self):
+        return len(self.skip)
+
+    def _build(self, start, end):
+        # depth first with an explicit stack, unbalanced splits of large meshes would
+        # run into the recursion limit. A None start marks the end of a node's
+        # subtree, where its skip pointer is known.
+        stack = [(start, end)]
+        while stack:
+            start, end = stack.pop()
+            if start is None:
+                self._skip[end] = len(self._skip)
+                continue
+            node = len(self._skip)
+            prims = self.prim_indices[start:end]
+            self._min.append(self.prim_min[prims].min(axis=0))
+            self._max.append(self.prim_max[prims].max(axis=0))
+            self._skip.append(-1)
+            self._start.append(start)
+            self._count.append(end - start)
+
+            mid = None
+            if end - start > self.leaf_size:
+                mid = self._split(start, end)
+
+            if mid is not None:
+                self._count[node] = 0
+                stack.extend([(None, node), (mid, end), (start, mid)])
+            else:
+                self._skip[node] = len(self._skip)
+
+    def _split(self, start, end):
+        prims = self.prim_indices[start:end]
+        centroids = self.centroids[prims]
+        count = end - start
+        lo, hi = centroids.min(axis=0), centroids.max(axis=0)
+        extent = hi - lo
+
+        parent_area = _surface_area(self._min[-1], self._max[-1])
+        best = (np.inf, None, None)
+        for axis in range(3):
+            if extent[axis] <= 0.0:
+                continue
+            bins = ((centroids[:, axis] - lo[axis]) / extent[axis] * self.num_bins).astype(np.int64)
+            bins = np.clip(bins, 0, self.num_bins - 1)
+            cost, split_bin = self._sah_cost(prims, bins, parent_area)
+            if cost < best[0]:
+                best = (cost, axis, bins < split_bin)
+
+        cost, axis, left = best
+        if axis is None:
+            # all centroids coincide, only a median split can make progress
+            if count <= MAX_LEAF_SIZE:
+                return None
+            left = np.arange(count) < count // 2
+        elif cost >= count and count <= MAX_LEAF_SIZE:
+            return None
+
+        self.prim_indices[start:end] = np.concatenate([prims[left], prims[~left]])
+        return start + int(left.sum())
+
+    def _sah_cost(self, prims, bins, parent_area):
+        order = np.argsort(bins, kind='stable')
+        sorted_bins = bins[order]
+        counts = np.bincount(sorted_bins, minlength=self.num_bins)
+        occupied = np.flatnonzero(counts)
+        offsets = np.searchsorted(sorted_bins, occupied)
+
+        bin_min = np.full((self.num_bins, 3), np.inf, dtype=np.float32)
+        bin_max = np.full((self.num_bins, 3), -np.inf, dtype=np.float32)
+        bin_min[occupied] = np.minimum.reduceat(self.prim_min[prims[order]], offsets)
+        bin_max[occupied] = np.maximum.reduceat(self.prim_max[prims[order]], offsets)
+
+        left_min = np.minimum.accumulate(bin_min[:-1])
+        left_max = np.maximum.accumulate(bin_max[:-1])
+        right_min = np.minimum.accumulate(bin_min[:0:-1])[::-1]
+        right_max = np.maximum.accumulate(bin_max[:0:-1])[::-1]
+        left_count = np.cumsum(counts[:-1])
+        right_count = len(prims) - left_count
+
+        with np.errstate(invalid='ignore'):
+            cost = 1.0 + (_surface_area(left_min, left_max) * left_count
+                          + _surface_area(right_min, right_max) * right_count) / max(parent_area, 1e-12)
+        cost[(left_count == 0) | (right_count == 0)] = np.inf
+        split = int(np.argmin(cost))
+        return cost[split], split + 1
+
+    def intersect(self, ro, rd, hit_test, tests=None):
+        # Nearest hit for every ray. hit_test(prims, ro, rd) returns the hit distance
+        # of each (primitive, ray) pair, or a value <= 0 on a miss. `tests`, if given,
+        # counts the box and primitive tests of every ray.
+        n = len(ro)
+        t_best = np.full(n, np.inf, dtype=np.float32)
+        index = np.full(n, -1, dtype=np.int64)
+        if self.node_count == 0:
+            return t_best, index
+
+        inv_dir = _inverse(rd)
+        node = np.zeros(n, dtype=np.int64)
+        rays = np.arange(n)
+        while len(rays):
+            current = node[rays]
+            if tests is not None:
+                tests[rays] += 1
+            box = _box_hit(ro[rays], inv_dir[rays], self.node_min[current], self.node_max[current], t_best[rays])
+            count = self.prim_count[current]
+            leaf = box & (count > 0)
+            if leaf.any():
+                leaf_rays, leaf_nodes = rays[leaf], current[leaf]
+                for k in range(count[leaf].max()):
+                    valid = k < self.prim_count[leaf_nodes]
+                    r = leaf_rays[valid]
+                    prims = self.prim_indices[self.prim_start[leaf_nodes[valid]] + k]
+                    if tests is not None:
+                        tests[r] += 1
+                    t = hit_test(prims, ro[r], rd[r])
+                    closer = (t > 0.0) & (t < t_best[r])
+                    t_best[r[closer]] = t[closer]
+                    index[r[closer]] = prims[closer]
+            node[rays] = np.where(box & (count == 0), current + 1, self.skip[current])
+            rays = rays[node[rays] < self.node_count]
+        return t_best, index
+
+    def occluded(self, ro, rd, hit_test, t_max=None, tests=None):
+        # Any-hit variant of intersect(): rays stop at the first primitive they hit
+        # closer than t_max (unbounded by default)
+        n = len(ro)
+        blocked = np.zeros(n, dtype=bool)
+        if self.node_count == 0:
+            return blocked
+
+        inv_dir = _inverse(rd)
+        t_max = np.full(n, np.inf, dtype=np.float32) if t_max is None else t_max
+        node = np.zeros(n, dtype=np.int64)
+        rays = np.arange(n)
+        while len(rays):
+            current = node[rays]
+            if tests is not None:
+                tests[rays] += 1
+            box = _box_hit(ro[rays], inv_dir[rays], self.node_min[current], self.node_max[current], t_max[rays])
+            count = self.prim_count[current]
+            leaf = box & (count > 0)
+            if leaf.any():
+                leaf_rays, leaf_nodes = rays[leaf], current[leaf]
+                for k in range(count[leaf].max()):
+                    valid = k < self.prim_count[leaf_nodes]
+                    r = leaf_rays[valid]
+                    prims = self.prim_indices[self.prim_start[leaf_nodes[valid]] + k]
+                    if tests is not None:
+                        tests[r] += 1
+                    t = hit_test(prims, ro[r], rd[r])
+                    blocked[r[(t > 0.0) & (t < t_max[r])]] = True
+            node[rays] = np.where(box & (count == 0), current + 1, self.skip[current])
+            rays = rays[(node[rays] < self.node_count) & ~blocked[rays]]
+        return blocked
+
+    def pack(self):
+        # GPU layout, see fragment_shader.py: bounds as two RGBA32F texels per node,
+        # links as one RGBA32I texel per node and the leaf primitive list as R32I
+        bounds = np.zeros((self.node_count, 2, 4), dtype=np.float32)
+        bounds[:, 0, :3] = self.node_min
+        bounds[:, 1, :3] = self.node_max
+        links = np.zeros((self.node_count, 4), dtype=np.int32)
+        links[:, 0] = self.skip
+        links[:, 1] = self.prim_start
+        links[:, 2] = self.prim_count
+        return bounds, links, self.prim_indices.astype(np.int32)
+
+
+def _surface_area(bmin, bmax):
+    d = np.maximum(bmax - bmin, 0.0)
+    return 2.0 * (d[..., 0] * d[..., 1] + d[..., 1] * d[..., 2] + d[..., 2] * d[..., 0])
+
+
+def _inverse(rd):
+    with np.errstate(divide='ignore'):
+        return np.float32(1.0) / rd
+
+
+def _box_hit(ro, inv_dir, bmin, bmax, t_max):
+    with np.errstate(invalid='ignore'):
+        t0 = (bmin - ro) * inv_dir
+        t1 = (bmax - ro) * inv_dir
+        t_near = np.fmin(t0, t1).max(axis=1)
+        t_far = np.fmax(t0, t1).min(axis=1)
+    return (t_far >= np.maximum(t_near, 0.0)) & (t_near < t_max)
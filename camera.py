@@ -1,7 +1,12 @@
 import numpy as np
-import glfw
+
+# GLFW key codes, spelled out so that headless code does not have to import glfw
+KEY_W, KEY_S, KEY_A, KEY_D, KEY_SPACE, KEY_LEFT_SHIFT = 87, 83, 65, 68, 32, 340
+MOVEMENT_KEYS = (KEY_W, KEY_S, KEY_A, KEY_D, KEY_SPACE, KEY_LEFT_SHIFT)
 
 class Camera:
+    __slots__ = ("position", "yaw", "pitch", "speed", "sensitivity", "direction")
+
     def __init__(self, position, yaw=90.0, pitch=0.0, speed=0.1, sensitivity=0.1, direction=[0.0, 0.0, -1.0]):
         self.position = np.array(position, dtype=np.float32)
         self.yaw = yaw
@@ -18,21 +23,33 @@ class Camera:
         self.direction = np.array([x, y, z], dtype=np.float32)
         self.direction /= np.linalg.norm(self.direction)
 
+    def look_at(self, target):
+        d = np.asarray(target, dtype=np.float32) - self.position
+        d /= np.linalg.norm(d)
+        self.pitch = float(np.degrees(np.arcsin(d[1])))
+        self.yaw = float(np.degrees(np.arctan2(d[2], d[0])))
+        self.update_direction()
+
     def process_keyboard(self, window):
+        import glfw
+        self.move({key for key in MOVEMENT_KEYS if glfw.get_key(window, key) == glfw.PRESS})
+
+    def move(self, keys):
+        # keys: the pressed keys out of MOVEMENT_KEYS, each moves by speed
         right = np.cross(self.direction, [0.0, 1.0, 0.0])
         right /= np.linalg.norm(right)
 
-        if glfw.get_key(window, glfw.KEY_W) == glfw.PRESS:
+        if KEY_W in keys:
             self.position += self.speed * self.direction
-        if glfw.get_key(window, glfw.KEY_S) == glfw.PRESS:
+        if KEY_S in keys:
             self.position -= self.speed * self.direction
-        if glfw.get_key(window, glfw.KEY_A) == glfw.PRESS:
+        if KEY_A in keys:
             self.position -= self.speed * right
-        if glfw.get_key(window, glfw.KEY_D) == glfw.PRESS:
+        if KEY_D in keys:
             self.position += self.speed * right
-        if glfw.get_key(window, glfw.KEY_SPACE) == glfw.PRESS:
+        if KEY_SPACE in keys:
             self.position[1] += self.speed
-        if glfw.get_key(window, glfw.KEY_LEFT_SHIFT) == glfw.PRESS:
+        if KEY_LEFT_SHIFT in keys:
             self.position[1] -= self.speed
 
     def process_mouse_movement(self, xoffset, yoffset):
@@ -0,0 +1,50 @@
+import numpy as np
+from camera import Camera
+
+DEFAULT_POSITION = [-0.63, -0.2, -2.6]
+DEFAULT_YAW = 116.0
+DEFAULT_PITCH = -23.0
+SCENE_CENTER = [0.0, -0.5, 3.5]
+
+# Scripted camera paths as lists of (camera, time). Times advance at a fixed rate so
+# the animated lights end up in the same place on every run.
+
+
+def frame_times(frames, fps=30.0):
+    return [i / fps for i in range(frames)]
+
+
+def static_path(frames, fps=30.0):
+    return [(Camera(position=DEFAULT_POSITION, yaw=DEFAULT_YAW, pitch=DEFAULT_PITCH), t) for t in frame_times(frames, fps)]
+
+
+def orbit_path(frames, fps=30.0, center=SCENE_CENTER, radius=8.0, height=1.5, turns=1.0):
+    path = []
+    for i, t in enumerate(frame_times(frames, fps)):
+        angle = 2.0 * np.pi * turns * i / max(frames, 1)
+        position = [center[0] + radius * np.cos(angle), center[1] + height, center[2] + radius * np.sin(angle)]
+        camera = Camera(position=position)
+        camera.look_at(center)
+        path.append((camera, t))
+    return path
+
+
+def dolly_path(frames, fps=30.0, start=DEFAULT_POSITION, target=(0.0, -0.5, 3.0), closest=1.0):
+    # moves straight towards the small glass sphere, the most expensive view of the default scene
+    start = np.array(start, dtype=np.float32)
+    target = np.array(target, dtype=np.float32)
+    direction = (target - start) / np.linalg.norm(target - start)
+    end = target - direction * closest
+    path = []
+    for i, t in enumerate(frame_times(frames, fps)):
+        camera = Camera(position=start + (end - start) * (i / max(frames - 1, 1)))
+        camera.look_at(target)
+        path.append((camera, t))
+    return path
+
+
+PATHS = {
+    "static": static_path,
+    "orbit": orbit_path,
+    "dolly": dolly_path,
+}
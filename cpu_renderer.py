@@ -0,0 +1,462 @@
+import numpy as np
+from denoise import atrous
+from light import merge_lights, LIGHT_RADIUS
+
+SKY_HORIZON = np.array([0.5, 0.6, 0.8], dtype=np.float32)
+SKY_ZENITH = np.array([0.0, 0.0, 0.3], dtype=np.float32)
+AMBIENT = np.float32(0.05)
+EPSILON = np.float32(0.001)
+
+
+def dot(a, b):
+    return np.einsum('ij,ij->i', a, b)
+
+
+def normalize(v):
+    return v / np.linalg.norm(v, axis=-1, keepdims=True)
+
+
+def reflect(rd, n):
+    return rd - 2.0 * dot(n, rd)[:, None] * n
+
+
+def refract(rd, n, eta):
+    # GLSL refract(): returns a zero vector on total internal reflection
+    cosi = dot(n, rd)
+    k = 1.0 - eta * eta * (1.0 - cosi * cosi)
+    out = eta[:, None] * rd - (eta * cosi + np.sqrt(np.maximum(k, 0.0)))[:, None] * n
+    out[k < 0.0] = 0.0
+    return out
+
+
+def basis(n):
+    # orthonormal t, b perpendicular to the unit vectors n
+    up = np.where((np.abs(n[:, 1]) < 0.99)[:, None], np.float32([0.0, 1.0, 0.0]), np.float32([1.0, 0.0, 0.0]))
+    t = normalize(np.cross(up, n))
+    return t, np.cross(n, t)
+
+
+def cosine_direction(n, rng):
+    # random directions around the normals n with a density proportional to the cosine
+    t, b = basis(n)
+    r = np.sqrt(rng.random(len(n), dtype=np.float32))[:, None]
+    phi = (2.0 * np.pi * rng.random(len(n), dtype=np.float32))[:, None]
+    return t * (r * np.cos(phi)) + b * (r * np.sin(phi)) + n * np.sqrt(np.maximum(0.0, 1.0 - r * r))
+
+
+def sky_color(rd):
+    t = 0.5 * (rd[:, 1:2] + 1.0)
+    return SKY_HORIZON * (1.0 - t) + SKY_ZENITH * t
+
+
+def fresnel_schlick(rd, n, ior_in, ior_out):
+    cosi = np.clip(dot(rd, n), -1.0, 1.0)
+    inside = cosi > 0.0
+    etai = np.where(inside, ior_out, ior_in)
+    etat = np.where(inside, ior_in, ior_out)
+    cosi = np.abs(cosi)
+    sint = etai / etat * np.sqrt(np.maximum(0.0, 1.0 - cosi * cosi))
+    total_internal = sint >= 1.0
+    cost = np.sqrt(np.maximum(0.0, 1.0 - sint * sint))
+    rs = (etat * cosi - etai * cost) / (etat * cosi + etai * cost)
+    rp = (etai * cosi - etat * cost) / (etai * cosi + etat * cost)
+    kr = np.where(total_internal, 1.0, (rs * rs + rp * rp) * 0.5)
+    return kr.astype(np.float32), total_internal
+
+
+def sphere_intersection(ro, rd, centers, radii):
+    # (N, S) matrix of hit distances, -1 where the ray misses
+    oc = ro[:, None, :] - centers[None, :, :]
+    b = np.einsum('nsk,nk->ns', oc, rd)
+    c = np.einsum('nsk,nsk->ns', oc, oc) - radii * radii
+    h = b * b - c
+    t = -b - np.sqrt(np.maximum(h, 0.0))
+    return np.where((h >= 0.0) & (t > 0.0), t, -1.0)
+
+
+def sphere_pair_intersection(ro, rd, centers, radii):
+    # one sphere per ray, the element-wise form used by BVH leaves
+    oc = ro - centers
+    b = dot(oc, rd)
+    c = dot(oc, oc) - radii * radii
+    h = b * b - c
+    t = -b - np.sqrt(np.maximum(h, 0.0))
+    return np.where((h >= 0.0) & (t > 0.0), t, -1.0)
+
+
+def triangle_intersection(ro, rd, v0, e1, e2):
+    # Moller-Trumbore on broadcastable arrays: pass ro[:, None] and rd[:, None] for an
+    # (N, T) matrix or (N, 3) triangles for one triangle per ray; -1 where the ray misses
+    p = np.cross(rd, e2)
+    det = np.sum(e1 * p, axis=-1)
+    s = ro - v0
+    q = np.cross(s, e1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv_det = np.float32(1.0) / det
+        u = np.sum(s * p, axis=-1) * inv_det
+        v = np.sum(rd * q, axis=-1) * inv_det
+        t = np.sum(e2 * q, axis=-1) * inv_det
+        hit = (np.abs(det) > 1e-8) & (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0) & (t > 0.0)
+    return np.where(hit, t, -1.0)
+
+
+def plane_intersection(ro, rd, plane):
+    denom = rd @ plane.normal
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = ((plane.point - ro) @ plane.normal) / denom
+    return np.where((np.abs(denom) > 0.0001) & (t > 0.0), t, -1.0)
+
+
+# below this many primitives testing all of them beats walking the BVH in NumPy
+BVH_THRESHOLD = 64
+# per-pixel counters of render_counters(), in the channel order of the shader's
+# DIAGNOSTICS output: bounces after the primary hit, intersection tests (BVH nodes,
+# spheres, triangles and the plane), shadow rays and reflection rays of transparent
+# surfaces (computeReflectionColor() in the shader)
+COUNTERS = ("bounces", "intersection_tests", "shadow_rays", "reflection_rays")
+# path tracing: samples per pixel by default and length of the random diffuse paths,
+# see PATH_TRACE in fragment_shader.py
+PATH_SAMPLES = 4
+DIFFUSE_BOUNCES = 2
+
+
+class CPURenderer:
+    def __init__(self, scene, width=1200, height=800, max_bounces=6, fov=45.0, chunk_size=16384, use_bvh=None,
+                 shadows=True, refraction=True, light_radius=LIGHT_RADIUS):
+        self.scene = scene
+        self.width = width
+        self.height = height
+        self.max_bounces = max_bounces
+        self.focal = np.float32(np.tan(np.radians(fov) / 2.0))
+        self.chunk_size = chunk_size
+        self.use_bvh = use_bvh
+        # same switches as the ENABLE_SHADOWS / ENABLE_REFRACTION shader variants
+        self.shadows = shadows
+        self.refraction = refraction
+        # rays traced by the last render(), shadow rays included
+        self.ray_count = 0
+        # list that collects (pixels, weight, position, normal) for every shaded hit
+        # while set, see lighting_cache.py
+        self.vertices = None
+        # name -> per-pixel int64 array while render_counters() runs; rays index it
+        # from counter_offset, the first pixel of the chunk being traced
+        self.counters = None
+        self.counter_offset = 0
+        # random generator of the sample being path traced, None for the deterministic tracer
+        self.rng = None
+        self.light_radius = light_radius
+
+    def render(self, camera, lights=None):
+        lights = self.scene.lights if lights is None else lights
+        self.prepare(lights)
+        self.ray_count = 0
+        return self.render_tile(camera, 0, 0, self.width, self.height)
+
+    def render_counters(self, camera, lights=None):
+        # the image and a (height, width) array per entry of COUNTERS
+        self.counters = {name: np.zeros(self.width * self.height, dtype=np.int64) for name in COUNTERS}
+        try:
+            image = self.render(camera, lights)
+            counters = {name: values.reshape(self.height, self.width) for name, values in self.counters.items()}
+        finally:
+            self.counters = None
+        return image, counters
+
+    def render_path_traced(self, camera, samples=PATH_SAMPLES, lights=None, denoise=True, seed=0):
+        # Monte Carlo version of render(): the average of `samples` samples with area
+        # lights and gathered ambient light (see PATH_TRACE in fragment_shader.py),
+        # denoised by the a-trous filter of denoise.py
+        lights = self.scene.lights if lights is None else lights
+        self.prepare(lights)
+        self.ray_count = 0
+        color = np.zeros((self.width * self.height, 3), dtype=np.float32)
+        try:
+            for sample in range(samples):
+                self.rng = np.random.default_rng((seed, sample))
+                # the first sample goes through the pixel centres, the others anywhere in the pixel
+                jitter = (0.0, 0.0) if sample == 0 else self.rng.uniform(-0.5, 0.5, (2, len(color))).astype(np.float32)
+                color += self.trace_batch(*self.primary_rays(camera, jitter=jitter))
+        finally:
+            self.rng = None
+        image = (color / samples).reshape(self.height, self.width, 3)
+        if not denoise:
+            return image
+        position, normal = self.first_hits(camera)
+        return atrous(image, position, normal, samples)
+
+    def first_hits(self, camera):
+        # (H, W, 4) position and distance (-1 for the sky) and (H, W, 3) normal of the
+        # hits through the pixel centres, the G-buffer pass of the shader
+        ro, rd = self.primary_rays(camera)
+        position = np.empty((len(rd), 4), dtype=np.float32)
+        normal = np.empty_like(rd)
+        for start in range(0, len(rd), self.chunk_size):
+            end = start + self.chunk_size
+            t, index, position[start:end, :3], normal[start:end] = self.nearest_hit(ro[start:end], rd[start:end])
+            position[start:end, 3] = np.where(index < 0, -1.0, t)
+        return position.reshape(self.height, self.width, 4), normal.reshape(self.height, self.width, 3)
+
+    def count(self, name, pixels, amount=1):
+        if self.counters is not None and pixels is not None:
+            np.add.at(self.counters[name], pixels + self.counter_offset, amount)
+
+    def render_tile(self, camera, x0, y0, x1, y1):
+        # pixels [y0, y1) x [x0, x1) with rows counted from the top, needs prepare()
+        y, x = np.mgrid[self.height - 1 - y0:self.height - 1 - y1:-1, x0:x1]
+        ro, rd = self.primary_rays(camera, x, y)
+        return self.trace_batch(ro, rd).reshape(y1 - y0, x1 - x0, 3)
+
+    def trace_batch(self, ro, rd):
+        # chunked so the (rays x spheres) intersection matrices stay small
+        color = np.empty_like(rd)
+        for start in range(0, len(rd), self.chunk_size):
+            end = start + self.chunk_size
+            first = len(self.vertices) if self.vertices is not None else 0
+            self.counter_offset = start
+            color[start:end] = self.trace(ro[start:end], rd[start:end])
+            if self.vertices is not None:
+                # trace() numbers the rays of its chunk from zero
+                for vertex in self.vertices[first:]:
+                    vertex[0] += start
+        self.counter_offset = 0
+        return color
+
+    def prepare(self, lights):
+        self.centers, self.radii = self.scene.sphere_arrays()
+        self.tri_v0, self.tri_e1, self.tri_e2, self.tri_normals, self.tri_material = self.scene.triangle_arrays()
+        self.colors, self.reflectivity, self.transparency, self.ior, self.absorption = self.scene.material_arrays()
+        # hit indices are material rows: spheres, then one row per mesh, then the plane
+        self.num_spheres = len(self.radii)
+        self.plane_index = len(self.colors) - 1
+        num_primitives = self.num_spheres + len(self.tri_v0)
+        use_bvh = self.use_bvh if self.use_bvh is not None else num_primitives > BVH_THRESHOLD
+        self.bvh = self.scene.bvh() if use_bvh else None
+        lights = merge_lights(lights)
+        self.light_positions, self.light_colors = lights[:, 0], lights[:, 1]
+
+    def primary_rays(self, camera, x=None, y=None, jitter=(0.0, 0.0)):
+        # pixel centres in gl_FragCoord convention, rows ordered top to bottom; jitter
+        # offsets them by (x, y) pixels, one offset for all rays or one per ray
+        if x is None:
+            y, x = np.mgrid[self.height - 1:-1:-1, 0:self.width]
+        u = ((x.ravel() + 0.5 + jitter[0]) / self.width * 2.0 - 1.0) * (self.width / self.height)
+        v = (y.ravel() + 0.5 + jitter[1]) / self.height * 2.0 - 1.0
+        offset = np.stack([u, v, np.zeros_like(u)], axis=-1).astype(np.float32) * self.focal
+        rd = normalize(np.asarray(camera.direction, dtype=np.float32) + offset)
+        ro = np.broadcast_to(np.asarray(camera.position, dtype=np.float32), rd.shape).copy()
+        return ro, rd
+
+    def primitive_hit(self, prims, ro, rd):
+        # BVH primitives are the spheres followed by the triangles
+        if len(self.tri_v0) == 0:
+            return sphere_pair_intersection(ro, rd, self.centers[prims], self.radii[prims])
+        t = np.empty(len(prims), dtype=np.float32)
+        sphere = prims < self.num_spheres
+        t[sphere] = sphere_pair_intersection(ro[sphere], rd[sphere], self.centers[prims[sphere]], self.radii[prims[sphere]])
+        tri = prims[~sphere] - self.num_spheres
+        t[~sphere] = triangle_intersection(ro[~sphere], rd[~sphere], self.tri_v0[tri], self.tri_e1[tri], self.tri_e2[tri])
+        return t
+
+    def primitive_matrix(self, ro, rd):
+        # (N, spheres + triangles) hit distances for the brute force path
+        t = sphere_intersection(ro, rd, self.centers, self.radii)
+        if len(self.tri_v0) == 0:
+            return t
+        return np.concatenate([t, triangle_intersection(ro[:, None], rd[:, None], self.tri_v0, self.tri_e1, self.tri_e2)], axis=1)
+
+    def nearest_primitive(self, ro, rd, tests=None):
+        # tests: per-ray counts of the intersection tests, incremented when given
+        if self.bvh is not None:
+            return self.bvh.intersect(ro, rd, self.primitive_hit, tests)
+        t = self.primitive_matrix(ro, rd)
+        if tests is not None:
+            tests += t.shape[1]
+        if t.shape[1] == 0:
+            return np.full(len(ro), np.inf, dtype=np.float32), np.full(len(ro), -1)
+        t = np.where(t > 0.0, t, np.inf)
+        index = np.argmin(t, axis=1)
+        return t[np.arange(len(ro)), index], index
+
+    def nearest_hit(self, ro, rd, pixels=None):
+        # pixels: the pixel of every ray, for the counters
+        self.ray_count += len(ro)
+        # starts at one for the plane
+        tests = np.ones(len(ro), dtype=np.int64) if self.counters is not None and pixels is not None else None
+        t, prim = self.nearest_primitive(ro, rd, tests)
+        self.count("intersection_tests", pixels, tests)
+        # triangles shade with the material row of their mesh
+        on_triangle = prim >= self.num_spheres
+        tri = np.where(on_triangle, prim - self.num_spheres, 0)
+        index = np.where(on_triangle, self.tri_material[tri] if len(self.tri_material) else -1, prim)
+
+        t_plane = plane_intersection(ro, rd, self.scene.plane)
+        hit_plane = (t_plane > 0.0) & (t_plane < t)
+        t = np.where(hit_plane, t_plane, t)
+        index = np.where(hit_plane, self.plane_index, index)
+        index = np.where(np.isinf(t), -1, index)
+
+        hit_pos = ro + rd * np.where(np.isinf(t), 0.0, t)[:, None]
+        normal = np.empty_like(rd)
+        normal[:] = self.scene.plane.normal
+        on_sphere = (index >= 0) & (index < self.num_spheres)
+        normal[on_sphere] = normalize(hit_pos[on_sphere] - self.centers[index[on_sphere]])
+        on_triangle = (index >= self.num_spheres) & (index < self.plane_index)
+        normal[on_triangle] = self.tri_normals[tri[on_triangle]]
+        return t.astype(np.float32), index, hit_pos, normal
+
+    def occluded(self, origin, direction, t_max, pixels=None):
+        # only occluders between the origin and t_max (the light) cast shadows
+        self.ray_count += len(origin)
+        self.count("shadow_rays", pixels)
+        tests = np.ones(len(origin), dtype=np.int64) if self.counters is not None and pixels is not None else None
+        if self.bvh is not None:
+            blocked = self.bvh.occluded(origin, direction, self.primitive_hit, t_max, tests)
+        else:
+            t = self.primitive_matrix(origin, direction)
+            blocked = ((t > 0.0) & (t < t_max[:, None])).any(axis=1)
+            if tests is not None:
+                tests += t.shape[1]
+        self.count("intersection_tests", pixels, tests)
+        t_plane = plane_intersection(origin, direction, self.scene.plane)
+        return blocked | ((t_plane > 0.0) & (t_plane < t_max))
+
+    def light_point(self, position, hit_pos):
+        # the light's position, or when path tracing a random point of the disk of the
+        # light sphere that faces each hit, like lightPoint() in the shader
+        if self.rng is None:
+            return position
+        t, b = basis(normalize(position - hit_pos))
+        r = (self.light_radius * np.sqrt(self.rng.random(len(hit_pos), dtype=np.float32)))[:, None]
+        phi = (2.0 * np.pi * self.rng.random(len(hit_pos), dtype=np.float32))[:, None]
+        return position + (t * np.cos(phi) + b * np.sin(phi)) * r
+
+    def light_sum(self, hit_pos, normal, pixels=None):
+        # diffuse light arriving from all lights, shadows included
+        total = np.zeros_like(hit_pos)
+        for position, color in zip(self.light_positions, self.light_colors):
+            to_light = self.light_point(position, hit_pos) - hit_pos
+            light_dist = np.linalg.norm(to_light, axis=-1)
+            light_dir = to_light / light_dist[:, None]
+            diff = np.maximum(dot(normal, light_dir), 0.0)
+            # shadow rays only for points the light can reach
+            lit = diff > 0.0
+            if self.shadows and lit.any():
+                shadow_pixels = pixels[lit] if pixels is not None else None
+                lit[lit] = ~self.occluded(hit_pos[lit] + normal[lit] * EPSILON, light_dir[lit], light_dist[lit], shadow_pixels)
+                diff *= lit
+            total += diff[:, None] * color
+        return total
+
+    def direct_lighting(self, hit_pos, normal, index, pixels=None, rd=None):
+        return self.light_sum(hit_pos, normal, pixels) * self.colors[index] + self.ambient_light(hit_pos, normal, index, pixels, rd)
+
+    def ambient_light(self, hit_pos, normal, index, pixels=None, rd=None):
+        # AMBIENT, or when path tracing the light gathered by a random diffuse path
+        if self.rng is None:
+            return AMBIENT
+        if rd is not None:
+            normal = np.where((dot(rd, normal) > 0.0)[:, None], -normal, normal)
+        return self.indirect_diffuse(hit_pos, normal, pixels) * self.colors[index]
+
+    def indirect_diffuse(self, hit_pos, normal, pixels=None):
+        # light arriving from the sky and the other surfaces along one path of
+        # DIFFUSE_BOUNCES cosine-weighted bounces, indirectDiffuse() in the shader
+        radiance = np.zeros_like(hit_pos)
+        throughput = np.ones_like(hit_pos)
+        rays = np.arange(len(hit_pos))
+        for bounce in range(DIFFUSE_BOUNCES):
+            if len(rays) == 0:
+                break
+            rd = cosine_direction(normal, self.rng)
+            ro = hit_pos + normal * EPSILON
+            ray_pixels = pixels[rays] if pixels is not None else None
+            t, index, hit_pos, normal = self.nearest_hit(ro, rd, ray_pixels)
+            miss = index < 0
+            radiance[rays[miss]] += throughput[miss] * sky_color(rd[miss])
+            hit = ~miss
+            rays, rd, throughput = rays[hit], rd[hit], throughput[hit]
+            hit_pos, normal, index = hit_pos[hit], normal[hit], index[hit]
+            normal = np.where((dot(rd, normal) > 0.0)[:, None], -normal, normal)
+            throughput = throughput * self.colors[index]
+            radiance[rays] += throughput * self.light_sum(hit_pos, normal, ray_pixels[hit] if pixels is not None else None)
+        return radiance
+
+    def add_lighting(self, color, rays, weight, hit_pos, normal, index, rd=None):
+        # the image depends on the lights only through these calls, so recording
+        # them is enough to relight the frame later
+        if self.vertices is not None:
+            self.vertices.append([rays.copy(), weight * self.colors[index], hit_pos, normal])
+        color[rays] += weight * self.direct_lighting(hit_pos, normal, index, rays, rd)
+
+    def add_reflection(self, color, rays, weight, ro, rd):
+        # one-level reflection lookup, like computeReflectionColor() in the shader
+        self.count("reflection_rays", rays)
+        t, index, hit_pos, normal = self.nearest_hit(ro, rd, rays)
+        miss = index < 0
+        color[rays[miss]] += weight[miss] * sky_color(rd[miss])
+        hit = ~miss
+        if hit.any():
+            self.add_lighting(color, rays[hit], weight[hit], hit_pos[hit], normal[hit], index[hit], rd[hit])
+
+    def trace(self, ro, rd):
+        color = np.zeros_like(rd)
+        attenuation = np.ones_like(rd)
+        rays = np.arange(len(rd))
+
+        for bounce in range(self.max_bounces):
+            if len(rays) == 0:
+                break
+            if bounce > 0:
+                self.count("bounces", rays)
+
+            t, index, hit_pos, normal = self.nearest_hit(ro, rd, rays)
+
+            # If we didn't hit anything, add sky color & end
+            miss = index < 0
+            color[rays[miss]] += attenuation[miss] * sky_color(rd[miss])
+            hit = ~miss
+            rays, ro, rd, attenuation = rays[hit], ro[hit], rd[hit], attenuation[hit]
+            t, index, hit_pos, normal = t[hit], index[hit], hit_pos[hit], normal[hit]
+
+            self.add_lighting(color, rays, attenuation, hit_pos, normal, index, rd)
+
+            reflectivity = self.reflectivity[index]
+            transparency = self.transparency[index]
+            ior = self.ior[index]
+            kr, total_internal = fresnel_schlick(rd, normal, np.float32(1.0), ior)
+            # without refraction transparent objects are shaded like opaque ones
+            transparent = (transparency > 0.0) & self.refraction
+
+            # partial reflection off transparent surfaces
+            partial = transparent & ~total_internal & (kr > 0.0)
+            if partial.any():
+                reflect_dir = reflect(rd[partial], normal[partial])
+                weight = attenuation[partial] * (kr[partial] * reflectivity[partial])[:, None]
+                self.add_reflection(color, rays[partial], weight, hit_pos[partial] + reflect_dir * EPSILON, reflect_dir)
+            kr = np.where(transparent & total_internal, np.float32(1.0), kr)
+
+            # Refraction with Beer-Lambert absorption
+            refracting = transparent & (kr < 1.0)
+            reflecting = (transparent & ~refracting) | (~transparent & (reflectivity > 0.0))
+
+            next_dir = rd.copy()
+            if refracting.any():
+                n = normal[refracting]
+                cosi = dot(rd[refracting], n)
+                entering = cosi <= 0.0
+                n = np.where(entering[:, None], n, -n)
+                eta = np.where(entering, 1.0 / ior[refracting], ior[refracting]).astype(np.float32)
+                next_dir[refracting] = refract(rd[refracting], n, eta)
+                absorb = np.exp(-self.absorption[index[refracting]] * t[refracting][:, None])
+                attenuation[refracting] *= absorb * ((1.0 - kr[refracting]) * transparency[refracting])[:, None]
+            if reflecting.any():
+                attenuation[reflecting] *= reflectivity[reflecting][:, None]
+                next_dir[reflecting] = reflect(rd[reflecting], normal[reflecting])
+
+            # Opaque and not reflective => no further bounces
+            alive = refracting | reflecting
+            rays, attenuation = rays[alive], attenuation[alive]
+            rd = next_dir[alive]
+            ro = hit_pos[alive] + rd * EPSILON
+
+        return color
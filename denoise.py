@@ -0,0 +1,59 @@
+import numpy as np
+
+# Edge-avoiding a-trous wavelet filter (Dammertz et al. 2010) for path-traced images.
+# Each iteration blurs with a 5x5 B3-spline kernel whose taps are `step` pixels apart,
+# step doubling from 1, so five iterations cover 61x61 pixels with 25 taps each. A
+# tap's weight drops where the first hits differ: normals that point elsewhere, points
+# off the tangent plane of the centre (a depth edge) or a color far from the centre
+# (a shadow edge the geometry does not show). The sky is noise-free and left alone.
+# The GL version is ATROUS_SHADER in denoise_shader.py.
+
+KERNEL = np.array([1.0 / 16.0, 1.0 / 4.0, 3.0 / 8.0, 1.0 / 4.0, 1.0 / 16.0], dtype=np.float32)
+ATROUS_ITERATIONS = 5
+# exponent of the normal weight max(dot(n_p, n_q), 0)^NORMAL_POWER
+NORMAL_POWER = 64.0
+# distance of a tap from the centre's tangent plane that costs a factor e, relative
+# to the hit distance of the centre
+PLANE_SIGMA = 0.02
+# color difference that costs a factor e at one sample per pixel, halved every iteration
+COLOR_SIGMA = 0.5
+
+
+def color_sigma(samples):
+    # noise falls with the square root of the sample count, the color edge-stop with it
+    return COLOR_SIGMA / np.sqrt(max(samples, 1))
+
+
+def atrous(color, position, normal, samples=1, iterations=ATROUS_ITERATIONS):
+    # color (H, W, 3), position (H, W, 4) first hit and its distance (negative where
+    # the ray escapes), normal (H, W, 3) at the first hit; returns the filtered color
+    height, width, _ = color.shape
+    color = np.array(color, dtype=np.float32)
+    point, distance = position[..., :3], position[..., 3]
+    geometry = distance > 0.0
+    sigma = color_sigma(samples)
+
+    for iteration in range(iterations):
+        step = 1 << iteration
+        total = np.zeros((height, width), dtype=np.float32)
+        result = np.zeros_like(color)
+        for dy in range(-2, 3):
+            for dx in range(-2, 3):
+                oy, ox = dy * step, dx * step
+                if abs(oy) >= height or abs(ox) >= width:
+                    continue
+                # centre pixels p whose tap q = p + offset lies inside the image
+                p = (slice(max(0, -oy), min(height, height - oy)), slice(max(0, -ox), min(width, width - ox)))
+                q = (slice(max(0, oy), min(height, height + oy)), slice(max(0, ox), min(width, width + ox)))
+                n = normal[p]
+                w = KERNEL[dy + 2] * KERNEL[dx + 2] * geometry[q]
+                w = w * np.maximum(np.sum(n * normal[q], axis=-1), 0.0) ** NORMAL_POWER
+                off_plane = np.abs(np.sum(n * (point[q] - point[p]), axis=-1))
+                w = w * np.exp(-off_plane / (PLANE_SIGMA * np.maximum(distance[p], 1e-6)))
+                difference = color[q] - color[p]
+                w = w * np.exp(-np.sum(difference * difference, axis=-1) / (sigma * sigma))
+                total[p] += w
+                result[p] += w[..., None] * color[q]
+        color = np.where(geometry[..., None], result / np.maximum(total, 1e-12)[..., None], color)
+        sigma *= 0.5
+    return color
@@ -0,0 +1,52 @@
+ATROUS_SHADER = """
+#version 330 core
+out vec4 FragColor;
+
+// one iteration of atrous() in denoise.py
+uniform sampler2D color;
+uniform sampler2D gbuffer_position; // first hit, t (-1 where the ray escapes)
+uniform sampler2D gbuffer_normal;
+uniform int step;           // tap spacing in pixels
+uniform float color_sigma;
+uniform float normal_power; // NORMAL_POWER
+uniform float plane_sigma;  // PLANE_SIGMA
+
+const float kernel[5] = float[](1.0 / 16.0, 1.0 / 4.0, 3.0 / 8.0, 1.0 / 4.0, 1.0 / 16.0);
+
+void main() {
+    ivec2 pixel = ivec2(gl_FragCoord.xy);
+    vec4 center = texelFetch(color, pixel, 0);
+    vec4 position = texelFetch(gbuffer_position, pixel, 0);
+    if (position.w <= 0.0) {
+        FragColor = center;
+        return;
+    }
+    vec3 normal = texelFetch(gbuffer_normal, pixel, 0).xyz;
+    ivec2 size = textureSize(color, 0);
+
+    vec3 sum = vec3(0.0);
+    float total = 0.0;
+    for (int dy = -2; dy <= 2; dy++) {
+        for (int dx = -2; dx <= 2; dx++) {
+            ivec2 q = pixel + ivec2(dx, dy) * step;
+            if (any(lessThan(q, ivec2(0))) || any(greaterThanEqual(q, size))) {
+                continue;
+            }
+            vec4 qPosition = texelFetch(gbuffer_position, q, 0);
+            if (qPosition.w <= 0.0) {
+                continue;
+            }
+            vec3 qColor = texelFetch(color, q, 0).rgb;
+            vec3 qNormal = texelFetch(gbuffer_normal, q, 0).xyz;
+            vec3 difference = qColor - center.rgb;
+            float w = kernel[dx + 2] * kernel[dy + 2]
+                * pow(max(dot(normal, qNormal), 0.0), normal_power)
+                * exp(-abs(dot(normal, qPosition.xyz - position.xyz)) / (plane_sigma * position.w))
+                * exp(-dot(difference, difference) / (color_sigma * color_sigma));
+            sum += qColor * w;
+            total += w;
+        }
+    }
+    FragColor = vec4(sum / max(total, 1e-12), center.a);
+}
+"""
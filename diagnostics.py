@@ -0,0 +1,122 @@
+import json
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.GL.shaders import compileProgram, compileShader
+from cpu_renderer import COUNTERS
+from heatmap_shader import HEATMAP_SHADER
+from vertex_shader import VERTEX_SHADER
+from render_target import RenderTarget
+
+# false-color ramp from no work (black) to the most expensive pixels (white)
+HEAT_COLORS = np.array([
+    [0.0, 0.0, 0.0],
+    [0.25, 0.0, 0.55],
+    [0.85, 0.15, 0.35],
+    [1.0, 0.65, 0.0],
+    [1.0, 1.0, 0.85],
+], dtype=np.float32)
+
+
+def heatmap(values, scale=None):
+    # (..., 3) false colors, `scale` (the maximum by default) maps to the top of the ramp
+    values = np.asarray(values, dtype=np.float32)
+    scale = float(values.max()) if scale is None else scale
+    f = np.clip(values / max(scale, 1.0), 0.0, 1.0) * (len(HEAT_COLORS) - 1)
+    i = np.minimum(f.astype(np.int64), len(HEAT_COLORS) - 2)
+    w = (f - i)[..., None]
+    return HEAT_COLORS[i] * (1.0 - w) + HEAT_COLORS[i + 1] * w
+
+
+def counter_totals(counters):
+    totals = {}
+    for name, values in counters.items():
+        totals[name] = {"total": int(values.sum()), "per_pixel": float(values.mean()), "max": int(values.max())}
+    return totals
+
+
+def save_counters(path, counters):
+    # per-pixel arrays (rows from the top) in path.npz, their totals in path.json
+    np.savez_compressed(path + ".npz", **counters)
+    with open(path + ".json", "w") as f:
+        json.dump(counter_totals(counters), f, indent=2)
+
+
+class Diagnostics:
+    # Renders the image and the per-pixel counters of the same frame (see COUNTERS)
+    # and shows one counter as a false-color overlay, scaled to the frame's maximum.
+    # The counters are read back every frame, so this path is slower than the others.
+    def __init__(self, renderer, width, height, counter="intersection_tests", opacity=0.75):
+        self.renderer = renderer
+        self.width = width
+        self.height = height
+        self.counter = counter
+        self.opacity = opacity
+
+        self.color_target = RenderTarget(width, height)
+        self.counter_target = RenderTarget(width, height, internal_format=GL_RGBA32I)
+        self.target = RenderTarget(width, height)
+        self.init_shader()
+        # name -> (height, width) int32 array of the last frame, rows from the top
+        self.counters = None
+
+    def init_shader(self):
+        self.shader = compileProgram(
+            compileShader(VERTEX_SHADER, GL_VERTEX_SHADER),
+            compileShader(HEATMAP_SHADER, GL_FRAGMENT_SHADER)
+        )
+        glUseProgram(self.shader)
+        glUniform1i(glGetUniformLocation(self.shader, "color"), 0)
+        glUniform1i(glGetUniformLocation(self.shader, "counters"), 1)
+        glUniform3fv(glGetUniformLocation(self.shader, "ramp"), len(HEAT_COLORS), HEAT_COLORS)
+        self.locs = {name: glGetUniformLocation(self.shader, name) for name in ("channel", "scale", "opacity")}
+
+    def resize(self, width, height):
+        self.width = width
+        self.height = height
+        for target in (self.color_target, self.counter_target, self.target):
+            target.resize(width, height)
+
+    def next_counter(self):
+        self.counter = COUNTERS[(COUNTERS.index(self.counter) + 1) % len(COUNTERS)]
+        return self.counter
+
+    def totals(self):
+        return counter_totals(self.counters) if self.counters else {}
+
+    def save(self, path):
+        save_counters(path, self.counters)
+
+    def draw(self, camera, scene, time):
+        self.color_target.bind()
+        self.renderer.draw(camera, scene, time, self.width, self.height)
+        self.counter_target.bind()
+        self.renderer.draw(camera, scene, time, self.width, self.height, diagnostics=True)
+
+        data = glReadPixels(0, 0, self.width, self.height, GL_RGBA_INTEGER, GL_INT)
+        values = np.frombuffer(data, dtype=np.int32).reshape(self.height, self.width, 4)[::-1]
+        self.counters = {name: values[..., i] for i, name in enumerate(COUNTERS)}
+
+        self.target.bind()
+        glUseProgram(self.shader)
+        glUniform1i(self.locs["channel"], COUNTERS.index(self.counter))
+        glUniform1f(self.locs["scale"], max(float(self.counters[self.counter].max()), 1.0))
+        glUniform1f(self.locs["opacity"], self.opacity)
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D, self.color_target.texture)
+        glActiveTexture(GL_TEXTURE1)
+        glBindTexture(GL_TEXTURE_2D, self.counter_target.texture)
+        glBindVertexArray(self.renderer.vao)
+        glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+        glBindVertexArray(0)
+        return self.target
+
+    def present(self, width, height):
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.target.fbo)
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, 0)
+        glBlitFramebuffer(0, 0, self.width, self.height, 0, 0, width, height, GL_COLOR_BUFFER_BIT, GL_LINEAR)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+    def cleanup(self):
+        for target in (self.color_target, self.counter_target, self.target):
+            target.cleanup()
+        glDeleteProgram(self.shader)
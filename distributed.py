@@ -0,0 +1,321 @@
+import argparse
+import copy
+import ipaddress
+import os
+import pickle
+import queue
+import socket
+import threading
+import time
+import traceback
+from collections import deque
+from multiprocessing import Process
+from multiprocessing.connection import Client, Listener, wait
+import numpy as np
+from cpu_renderer import CPURenderer
+from tiled_renderer import split_tiles
+from scene import animate_lights
+
+DEFAULT_ADDRESS = ("localhost", 6150)
+
+# Protocol, every message is a pickled tuple:
+#   worker -> coordinator: ("result", frame, tile, pixels, rays), ("error", frame, tile, text)
+#   coordinator -> worker: ("frame", frame, state), ("tile", frame, tile), ("done", frame), ("stop",)
+# A worker always gets the frame state (scene, camera, lights) before its first tile
+# of that frame, keeps it until the frame is done and holds one tile at a time.
+#
+# Both sides unpickle what they receive, so anyone who can connect with the authkey
+# can run code on the other side. There is no default key: workers always need the
+# coordinator's key, and a coordinator without one only listens on loopback, with a
+# random key that it hands to its local workers.
+
+
+def is_loopback(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+def read_authkey(path=None):
+    # the key from a file or RAYTRACER_AUTHKEY, None if neither is set
+    if path:
+        with open(path, "rb") as f:
+            key = f.read().strip()
+        if not key:
+            raise Exception(f"Authkey file {path} is empty")
+        return key
+    return os.environ.get("RAYTRACER_AUTHKEY", "").encode() or None
+
+
+def run_worker(address=DEFAULT_ADDRESS, authkey=None, **options):
+    if not authkey:
+        raise Exception("Workers need the coordinator's authkey, set RAYTRACER_AUTHKEY or use --authkey-file")
+    conn = Client(address, authkey=authkey)
+    frames = {}
+    try:
+        while True:
+            message = conn.recv()
+            if message[0] == "stop":
+                break
+            if message[0] == "frame":
+                _, frame, state = message
+                scene, camera, lights, width, height = pickle.loads(state)
+                renderer = CPURenderer(scene, width, height, **options)
+                renderer.prepare(lights)
+                frames[frame] = (renderer, camera)
+            elif message[0] == "done":
+                frames.pop(message[1], None)
+            elif message[0] == "tile":
+                _, frame, tile = message
+                try:
+                    renderer, camera = frames[frame]
+                    renderer.ray_count = 0
+                    pixels = renderer.render_tile(camera, *tile)
+                    conn.send(("result", frame, tile, pixels, renderer.ray_count))
+                except Exception:
+                    conn.send(("error", frame, tile, traceback.format_exc()))
+    except (EOFError, ConnectionError):
+        pass
+    finally:
+        conn.close()
+
+
+class WorkerState:
+    def __init__(self, conn):
+        self.conn = conn
+        self.frames = set()
+        self.job = None
+        self.started = 0.0
+
+
+class Coordinator:
+    # Hands out (frame, tile) jobs to workers connected through
+    # multiprocessing.connection and assembles the returned tiles into frames.
+    # Jobs of lost or failing workers are retried; idle workers duplicate tiles that
+    # take much longer than usual, whichever copy finishes first wins.
+    def __init__(self, scene, path, width=1200, height=800, tile_size=128, address=DEFAULT_ADDRESS,
+                 authkey=None, max_retries=3, steal_factor=2.0, worker_timeout=30.0, animate=animate_lights):
+        if not authkey:
+            if not is_loopback(address[0]):
+                raise Exception(f"Refusing to listen on {address[0]} without an authkey, set RAYTRACER_AUTHKEY "
+                                "or use --authkey-file")
+            authkey = os.urandom(32)
+        self.scene = scene
+        self.path = path
+        self.width = width
+        self.height = height
+        self.tiles = split_tiles(width, height, tile_size)
+        self.max_retries = max_retries
+        self.steal_factor = steal_factor
+        self.worker_timeout = worker_timeout
+        self.animate = animate
+        self.authkey = authkey
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        self.ray_count = 0
+
+    def frame_state(self, frame):
+        camera, t = self.path[frame]
+        # lights are animated on a copy so frames can be packed in any order
+        lights = copy.deepcopy(self.scene.lights)
+        self.animate(lights, t)
+        return pickle.dumps((self.scene, camera, lights, self.width, self.height), protocol=pickle.HIGHEST_PROTOCOL)
+
+    def accept_loop(self, connections):
+        while True:
+            try:
+                connections.put(self.listener.accept())
+            except OSError:
+                # listener closed
+                break
+
+    def run(self, on_frame):
+        # on_frame(frame, image) is called as soon as all tiles of a frame arrived
+        self.scene.bvh()
+        pending = deque((frame, tile) for frame in range(len(self.path)) for tile in self.tiles)
+        tiles_left = {frame: len(self.tiles) for frame in range(len(self.path))}
+        images = {}
+        states = {}
+        attempts = {}
+        running = {}
+        durations = []
+        workers = {}
+        connections = queue.Queue()
+        threading.Thread(target=self.accept_loop, args=(connections,), daemon=True).start()
+        last_worker_seen = time.perf_counter()
+
+        def lose(worker):
+            del workers[worker.conn]
+            worker.conn.close()
+            if worker.job in running:
+                fail(worker.job, worker)
+
+        def fail(job, worker):
+            running[job].discard(worker)
+            if running[job]:
+                return
+            del running[job]
+            attempts[job] = attempts.get(job, 0) + 1
+            if attempts[job] > self.max_retries:
+                raise Exception(f"Tile {job[1]} of frame {job[0]} failed {attempts[job]} times")
+            pending.appendleft(job)
+
+        def assign(worker, job):
+            frame, tile = job
+            if frame not in worker.frames:
+                if frame not in states:
+                    states[frame] = self.frame_state(frame)
+                worker.conn.send(("frame", frame, states[frame]))
+                worker.frames.add(frame)
+            worker.conn.send(("tile", frame, tile))
+            worker.job = job
+            worker.started = time.perf_counter()
+            running.setdefault(job, set()).add(worker)
+
+        def steal():
+            # the longest running job nobody else is working on, if it is overdue
+            if not durations:
+                return None
+            limit = self.steal_factor * float(np.median(durations[-64:]))
+            now = time.perf_counter()
+            overdue = [
+                (now - next(iter(owners)).started, job) for job, owners in running.items()
+                if len(owners) == 1 and now - next(iter(owners)).started > limit
+            ]
+            return max(overdue)[1] if overdue else None
+
+        try:
+            while tiles_left:
+                while not connections.empty():
+                    conn = connections.get()
+                    workers[conn] = WorkerState(conn)
+
+                for conn in wait(list(workers), timeout=0.05):
+                    worker = workers[conn]
+                    try:
+                        message = conn.recv()
+                    except (EOFError, ConnectionError):
+                        lose(worker)
+                        continue
+
+                    if message[0] == "result":
+                        _, frame, tile, pixels, rays = message
+                        job = (frame, tile)
+                        worker.job = None
+                        durations.append(time.perf_counter() - worker.started)
+                        if job not in running:
+                            # a duplicate that lost the race
+                            continue
+                        # a slower copy keeps its worker busy until it returns, then gets dropped here
+                        del running[job]
+                        self.ray_count += rays
+                        x0, y0, x1, y1 = tile
+                        if frame not in images:
+                            images[frame] = np.empty((self.height, self.width, 3), dtype=np.float32)
+                        images[frame][y0:y1, x0:x1] = pixels
+                        tiles_left[frame] -= 1
+                        if tiles_left[frame] == 0:
+                            del tiles_left[frame]
+                            states.pop(frame, None)
+                            for other in workers.values():
+                                if frame in other.frames:
+                                    other.frames.discard(frame)
+                                    other.conn.send(("done", frame))
+                            on_frame(frame, images.pop(frame))
+                    elif message[0] == "error":
+                        _, frame, tile, text = message
+                        print(f"Worker failed on tile {tile} of frame {frame}:\n{text}")
+                        worker.job = None
+                        if (frame, tile) in running:
+                            fail((frame, tile), worker)
+
+                for worker in list(workers.values()):
+                    if worker.job is not None:
+                        continue
+                    job = pending.popleft() if pending else steal()
+                    if job is None:
+                        break
+                    try:
+                        assign(worker, job)
+                    except (EOFError, ConnectionError):
+                        if job not in running:
+                            pending.appendleft(job)
+                        lose(worker)
+
+                if workers:
+                    last_worker_seen = time.perf_counter()
+                elif time.perf_counter() - last_worker_seen > self.worker_timeout:
+                    raise Exception(f"No workers connected for {self.worker_timeout:.0f} s")
+        finally:
+            for worker in workers.values():
+                try:
+                    worker.conn.send(("stop",))
+                except (EOFError, ConnectionError):
+                    pass
+                worker.conn.close()
+
+    def close(self):
+        self.listener.close()
+
+
+def spawn_local_workers(count, address, authkey, **options):
+    processes = [Process(target=run_worker, args=(address, authkey), kwargs=options, daemon=True) for _ in range(count)]
+    for process in processes:
+        process.start()
+    return processes
+
+
+def parse_address(value):
+    host, port = value.rsplit(":", 1)
+    return host, int(port)
+
+
+def main(argv=None):
+    from camera_path import PATHS
+    from scene import create_default_scene
+    from image_io import save_image
+
+    parser = argparse.ArgumentParser(description="Render camera path sequences on a pool of worker processes.")
+    sub = parser.add_subparsers(dest="mode", required=True)
+    coordinator = sub.add_parser("coordinator")
+    coordinator.add_argument("--address", default=DEFAULT_ADDRESS, type=parse_address)
+    coordinator.add_argument("--local-workers", default=0, type=int, help="start this many workers on this machine")
+    coordinator.add_argument("--path", default="orbit", choices=sorted(PATHS))
+    coordinator.add_argument("--frames", default=24, type=int)
+    coordinator.add_argument("--resolution", default="640x400")
+    coordinator.add_argument("--tile-size", default=128, type=int)
+    coordinator.add_argument("--output", default="frames/frame_{:04d}.png")
+    worker = sub.add_parser("worker")
+    worker.add_argument("--address", default=DEFAULT_ADDRESS, type=parse_address)
+    for p in (coordinator, worker):
+        p.add_argument("--bounces", default=6, type=int)
+        p.add_argument("--authkey-file", help="file holding the shared secret, instead of RAYTRACER_AUTHKEY")
+    args = parser.parse_args(argv)
+    authkey = read_authkey(args.authkey_file)
+
+    if args.mode == "worker":
+        run_worker(args.address, authkey, max_bounces=args.bounces)
+        return 0
+
+    width, height = (int(v) for v in args.resolution.lower().split("x"))
+    coordinator = Coordinator(create_default_scene(), PATHS[args.path](args.frames), width, height,
+                              args.tile_size, args.address, authkey)
+    spawn_local_workers(args.local_workers, coordinator.address, coordinator.authkey, max_bounces=args.bounces)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+
+    def write(frame, image):
+        save_image(args.output.format(frame), image)
+        print(f"frame {frame} done")
+
+    start = time.perf_counter()
+    try:
+        coordinator.run(write)
+    finally:
+        coordinator.close()
+    print(f"{args.frames} frames in {time.perf_counter() - start:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,76 @@
+from collections import deque
+import numpy as np
+from OpenGL.GL import *
+from render_target import RenderTarget
+
+
+class ResolutionController:
+    # Picks a render scale so that the measured GPU time fits into the frame budget.
+    # Shading cost is proportional to the pixel count, i.e. to scale squared.
+    def __init__(self, target_fps=60.0, min_scale=0.25, max_scale=1.0, step=0.05, window=8):
+        self.budget_ms = 1000.0 / target_fps
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.step = step
+        # the median over a short window ignores one-off spikes (and the bogus
+        # first query some drivers report) without lagging behind real changes
+        self.samples = deque(maxlen=window)
+        self.scale = max_scale
+
+    @property
+    def frame_ms(self):
+        return float(np.median(self.samples)) if self.samples else None
+
+    def update(self, gpu_ms):
+        self.samples.append(gpu_ms)
+        if len(self.samples) < self.samples.maxlen:
+            return self.scale
+
+        ideal = self.scale * np.sqrt(self.budget_ms / max(self.frame_ms, 1e-3))
+        if abs(ideal - self.scale) < self.step:
+            return self.scale
+
+        scale = round(round(ideal / self.step) * self.step, 4)
+        scale = float(min(self.max_scale, max(self.min_scale, scale)))
+        if scale != self.scale:
+            self.scale = scale
+            # measurements taken at the old scale say nothing about the new one
+            self.samples.clear()
+        return self.scale
+
+
+class DynamicResolution:
+    def __init__(self, renderer, width, height, target_fps=60.0, min_scale=0.25, max_scale=1.0):
+        self.renderer = renderer
+        self.width = width
+        self.height = height
+        self.controller = ResolutionController(target_fps, min_scale, max_scale)
+        self.renderer.gpu_listeners.append(self.on_gpu_time)
+        self.target = RenderTarget(*self.scaled_size(), filtering=GL_LINEAR)
+
+    def scaled_size(self):
+        scale = self.controller.scale
+        return max(1, int(self.width * scale)), max(1, int(self.height * scale))
+
+    def on_gpu_time(self, frame, elapsed):
+        self.controller.update(elapsed)
+
+    def draw(self, camera, scene, time):
+        self.renderer.poll_gpu_times()
+        size = self.scaled_size()
+        if size != (self.target.width, self.target.height):
+            self.target.resize(*size)
+
+        self.target.bind()
+        self.renderer.draw(camera, scene, time, self.target.width, self.target.height)
+        return self.target
+
+    def present(self, width, height):
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.target.fbo)
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, 0)
+        glBlitFramebuffer(0, 0, self.target.width, self.target.height, 0, 0, width, height, GL_COLOR_BUFFER_BIT, GL_LINEAR)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+    def cleanup(self):
+        self.renderer.gpu_listeners.remove(self.on_gpu_time)
+        self.target.cleanup()
@@ -0,0 +1,23 @@
+# Properties that read and write slices of an object's `data` array. Scene objects
+# keep their values in one small float32 block, which becomes a view into the scene's
+# shared buffer once the object is added to a scene.
+
+
+def vector_field(row, start=0):
+    def get(self):
+        return self.data[row, start:start + 3]
+
+    def set(self, value):
+        self.data[row, start:start + 3] = value
+
+    return property(get, set)
+
+
+def scalar_field(row, col):
+    def get(self):
+        return float(self.data[row, col])
+
+    def set(self, value):
+        self.data[row, col] = value
+
+    return property(get, set)
@@ -1,28 +1,96 @@
 FRAGMENT_SHADER = """
 #version 330 core
+// Compile-time options, shader_cache.py injects #defines for them right after the
+// #version line. The defaults reproduce the original scene settings.
+#ifndef NUM_LIGHTS
+#define NUM_LIGHTS 5
+#endif
+#ifndef MAX_BOUNCES
+#define MAX_BOUNCES 6
+#endif
+#ifndef ENABLE_SHADOWS
+#define ENABLE_SHADOWS 1
+#endif
+#ifndef ENABLE_REFRACTION
+#define ENABLE_REFRACTION 1
+#endif
+
+// RENDER_PASS selects what main() does. The forward pass traces every pixel in one
+// go. The deferred mode (gbuffer.py) splits it: the G-buffer pass casts the primary
+// rays, the shade pass lights the hits that end there (sky and opaque diffuse
+// surfaces) and the bounce pass continues the paths of reflective and transparent
+// hits. A depth value written by the G-buffer pass keeps each of the last two passes
+// to its own pixels.
+#define PASS_FORWARD 0
+#define PASS_GBUFFER 1
+#define PASS_SHADE 2
+#define PASS_BOUNCE 3
+#ifndef RENDER_PASS
+#define RENDER_PASS PASS_FORWARD
+#endif
+// Sparse tracing for temporal reprojection (temporal.py): the target is smaller
+// than the image and each fragment traces one pixel of a trace_stride block, see
+// pixelCoord(). The alpha channel carries the primary hit distance.
+#ifndef SPARSE_TRACE
+#define SPARSE_TRACE 0
+#endif
+// Diagnostics (diagnostics.py): the forward pass writes per-pixel counters to an
+// integer target instead of the color, in the order of COUNTERS in cpu_renderer.py
+#ifndef DIAGNOSTICS
+#define DIAGNOSTICS 0
+#endif
+// Monte Carlo path tracing (path_tracer.py): lights are spheres sampled at a random
+// point and the constant ambient term becomes the light gathered from the sky and the
+// other surfaces along a random diffuse path, see ambientLight(). Mirror and glass
+// paths branch as in the deterministic tracer, so their reflections stay noise-free.
+#ifndef PATH_TRACE
+#define PATH_TRACE 0
+#endif
+// cosine-weighted bounces of the diffuse path
+#define DIFFUSE_BOUNCES 2
+
+#if RENDER_PASS == PASS_GBUFFER
+layout(location = 0) out vec4 gPosition; // hit position, t (-1 where the ray escapes)
+layout(location = 1) out vec4 gNormal;   // normal, material (-1 for the plane)
+#elif DIAGNOSTICS
+out ivec4 FragColor;
+#else
 out vec4 FragColor;
+#endif
+
+#if DIAGNOSTICS
+#define BOUNCES 0
+#define INTERSECTION_TESTS 1
+#define SHADOW_RAYS 2
+#define REFLECTION_RAYS 3
+ivec4 counters = ivec4(0);
+#define COUNT(counter) counters[counter]++
+#else
+#define COUNT(counter)
+#endif
 
 uniform vec2 resolution;
 uniform float time;
 uniform vec3 camera_pos;
 uniform vec3 camera_dir;
-
-const int NUM_LIGHTS = 5;
-const int NUM_SPHERES = 27;
+uniform vec2 jitter; // subpixel offset of the sample, in pixels
+uniform ivec2 trace_stride;
+uniform ivec2 trace_offset;
+uniform int trace_row_shift; // x offset added per row, 1 for a checkerboard
+uniform int sample_index; // seeds the random numbers of a path-traced sample
+uniform float light_radius;
 
 float fov = 45.0; // in degrees
 float focal = tan(radians(fov) / 2.0);
 
-struct Light {
-    vec3 position;
-    vec3 color;
-};
-
-uniform Light lights[NUM_LIGHTS];
+// (position, color) pairs, uploaded from LightArray.data in one call
+#if NUM_LIGHTS > 0
+uniform vec3 light_data[2 * NUM_LIGHTS];
+#else
+uniform vec3 light_data[2];
+#endif
 
-struct Sphere {
-    vec3 center;
-    float radius;
+struct Material {
     vec3 color;
     float reflectivity;
     float transparency;
@@ -37,37 +105,220 @@ struct Plane {
     float reflectivity;
 };
 
-// Scene data (spheres and plane)
-Sphere spheres[NUM_SPHERES];
-Plane plane;
-int maxBounces = 6;
+// Scene data, uploaded from scene.py. Every sphere occupies four texels:
+// (center, radius), (color, reflectivity), (absorption, transparency), (ior, -, -, -)
+// and is followed by one block per mesh that only uses the material texels.
+uniform samplerBuffer sphere_data;
+uniform int num_spheres;
+
+// Triangles of all meshes: (v0, v1, v2, material block in sphere_data) per triangle,
+// indexing (x, y, z, -) vertices
+uniform samplerBuffer mesh_vertices;
+uniform isamplerBuffer mesh_triangles;
+
+// BVH over all primitives built by bvh.py, flattened in depth-first order. An
+// interior node's left child is the next node, `skip` jumps past its subtree, and
+// the walk ends at num_nodes, so traversal needs no stack.
+uniform samplerBuffer bvh_bounds;  // (min, -), (max, -) per node
+uniform isamplerBuffer bvh_nodes;  // (skip, first primitive, primitive count, -)
+uniform isamplerBuffer bvh_prims;  // primitives in leaf order: spheres, then num_spheres + triangle
+uniform int num_nodes;
+uniform Plane plane;
+
+// Screen tiles for primary rays (tile_culling.py): the BVH subtrees that can be
+// seen through each tile, nearest first. tile_grid is (0, 0) when culling is off.
+uniform isamplerBuffer tile_ranges; // (first, count) in tile_nodes per tile
+uniform isamplerBuffer tile_nodes;
+uniform ivec2 tile_grid;
+uniform int tile_size;
+
+// G-buffer read by the shade and bounce passes
+uniform sampler2D gbuffer_position;
+uniform sampler2D gbuffer_normal;
 
 // Basic ambient
 vec3 ambient = vec3(0.05);
 
+#if PATH_TRACE
+#define PI 3.14159265358979
+uint rngState;
+
+// PCG hash, used both to seed and to advance the generator
+uint pcg(uint v) {
+    uint state = v * 747796405u + 2891336453u;
+    uint word = ((state >> ((state >> 28u) + 4u)) ^ state) * 277803737u;
+    return (word >> 22u) ^ word;
+}
+
+float random() {
+    rngState = pcg(rngState);
+    return float(rngState) * (1.0 / 4294967296.0);
+}
+
+// Orthonormal t, b perpendicular to the unit vector n
+void basis(vec3 n, out vec3 t, out vec3 b) {
+    t = normalize(cross(abs(n.y) < 0.99 ? vec3(0.0, 1.0, 0.0) : vec3(1.0, 0.0, 0.0), n));
+    b = cross(n, t);
+}
+#endif
+
 
 vec3 getSkyColor(vec3 rd) {
     float t = 0.5 * (rd.y + 1.0);
     return mix(vec3(0.5, 0.6, 0.8), vec3(0.0, 0.0, 0.3), t);
 }
 
+// xyz = center, w = radius
+vec4 getSphereBounds(int i) {
+    return texelFetch(sphere_data, i * 4);
+}
+
+// material block i of sphere_data, -1 is the plane
+Material getMaterial(int i) {
+    if (i < 0) {
+        return Material(plane.color, plane.reflectivity, 0.0, 1.0, vec3(0.0));
+    }
+    vec4 color = texelFetch(sphere_data, i * 4 + 1);
+    vec4 absorption = texelFetch(sphere_data, i * 4 + 2);
+    vec4 ior = texelFetch(sphere_data, i * 4 + 3);
+    return Material(color.rgb, color.a, absorption.a, ior.x, absorption.rgb);
+}
+
 // ro = ray origin, rd = ray direction
-float sphereIntersection(vec3 ro, vec3 rd, Sphere sphere, out vec3 hitNormal) {
-    vec3 oc = ro - sphere.center;
+float sphereIntersection(vec3 ro, vec3 rd, vec4 sphere, out vec3 hitNormal) {
+    vec3 oc = ro - sphere.xyz;
     float b = dot(oc, rd);
-    float c = dot(oc, oc) - sphere.radius * sphere.radius;
+    float c = dot(oc, oc) - sphere.w * sphere.w;
     float h = b * b - c;
     if (h < 0.0) return -1.0;
     float t = -b - sqrt(h);
     if (t > 0.0) {
         vec3 hitPos = ro + rd * t;
-        hitNormal = normalize(hitPos - sphere.center);
+        hitNormal = normalize(hitPos - sphere.xyz);
+        return t;
+    }
+    return -1.0;
+}
+
+// Moller-Trumbore, hits from both sides; the normal follows the winding order
+float triangleIntersection(vec3 ro, vec3 rd, ivec4 tri, out vec3 hitNormal) {
+    vec3 v0 = texelFetch(mesh_vertices, tri.x).xyz;
+    vec3 e1 = texelFetch(mesh_vertices, tri.y).xyz - v0;
+    vec3 e2 = texelFetch(mesh_vertices, tri.z).xyz - v0;
+    vec3 p = cross(rd, e2);
+    float det = dot(e1, p);
+    if (abs(det) <= 1e-8) return -1.0;
+    float invDet = 1.0 / det;
+    vec3 s = ro - v0;
+    float u = dot(s, p) * invDet;
+    if (u < 0.0 || u > 1.0) return -1.0;
+    vec3 q = cross(s, e1);
+    float v = dot(rd, q) * invDet;
+    if (v < 0.0 || u + v > 1.0) return -1.0;
+    float t = dot(e2, q) * invDet;
+    if (t > 0.0) {
+        hitNormal = normalize(cross(e1, e2));
         return t;
     }
     return -1.0;
 }
 
+// Hit distance of BVH primitive i, material is set to its block in sphere_data
+float primitiveIntersection(vec3 ro, vec3 rd, int i, out vec3 hitNormal, out int material) {
+    COUNT(INTERSECTION_TESTS);
+    if (i < num_spheres) {
+        material = i;
+        return sphereIntersection(ro, rd, getSphereBounds(i), hitNormal);
+    }
+    ivec4 tri = texelFetch(mesh_triangles, i - num_spheres);
+    material = tri.w;
+    return triangleIntersection(ro, rd, tri, hitNormal);
+}
+
+bool boxIntersection(vec3 ro, vec3 invDir, int node, float tMax) {
+    COUNT(INTERSECTION_TESTS);
+    vec3 t0 = (texelFetch(bvh_bounds, node * 2).xyz - ro) * invDir;
+    vec3 t1 = (texelFetch(bvh_bounds, node * 2 + 1).xyz - ro) * invDir;
+    vec3 tSmall = min(t0, t1);
+    vec3 tBig = max(t0, t1);
+    float tNear = max(max(tSmall.x, tSmall.y), tSmall.z);
+    float tFar = min(min(tBig.x, tBig.y), tBig.z);
+    return tFar >= max(tNear, 0.0) && tNear < tMax;
+}
+
+// Nearest sphere or triangle in the BVH nodes [node, end), then in each subtree listed
+// in tile_nodes[next, last); hitIndex is the material block of the object. Leaves
+// nearestT, hitNormal and hitIndex untouched on a miss.
+void intersectNodes(vec3 ro, vec3 rd, int node, int end, int next, int last, inout float nearestT, inout vec3 hitNormal, inout int hitIndex) {
+    vec3 invDir = 1.0 / rd;
+    // a single loop over all subtrees, nesting the traversal in a loop over the list
+    // is far slower on llvmpipe
+    while (node < end || next < last) {
+        if (node >= end) {
+            node = texelFetch(tile_nodes, next++).x;
+            end = texelFetch(bvh_nodes, node).x;
+        }
+        ivec4 info = texelFetch(bvh_nodes, node);
+        if (boxIntersection(ro, invDir, node, nearestT < 0.0 ? 1e30 : nearestT)) {
+            for (int k = 0; k < info.z; k++) {
+                vec3 n;
+                int material;
+                float t = primitiveIntersection(ro, rd, texelFetch(bvh_prims, info.y + k).x, n, material);
+                if (t > 0.0 && (t < nearestT || nearestT < 0.0)) {
+                    nearestT = t;
+                    hitNormal = n;
+                    hitIndex = material;
+                }
+            }
+            node = (info.z > 0) ? info.x : node + 1;
+        } else {
+            node = info.x;
+        }
+    }
+}
+
+void intersectObjects(vec3 ro, vec3 rd, inout float nearestT, inout vec3 hitNormal, inout int hitIndex) {
+    intersectNodes(ro, rd, 0, num_nodes, 0, 0, nearestT, hitNormal, hitIndex);
+}
+
+// Camera rays through a pixel only need the subtrees listed for its tile
+void intersectTile(vec3 ro, vec3 rd, vec2 pixel, inout float nearestT, inout vec3 hitNormal, inout int hitIndex) {
+    // the whole tree when culling is off, one call site keeps the shader small
+    int end = num_nodes;
+    ivec2 range = ivec2(0);
+    if (tile_grid.x > 0) {
+        ivec2 tile = min(ivec2(pixel) / tile_size, tile_grid - 1);
+        range = texelFetch(tile_ranges, tile.y * tile_grid.x + tile.x).xy;
+        end = 0;
+    }
+    intersectNodes(ro, rd, 0, end, range.x, range.x + range.y, nearestT, hitNormal, hitIndex);
+}
+
+// Any-hit query for shadow rays, stops at the first object it finds closer than tMax
+bool objectsOccluded(vec3 ro, vec3 rd, float tMax) {
+    vec3 invDir = 1.0 / rd;
+    int node = 0;
+    while (node < num_nodes) {
+        ivec4 info = texelFetch(bvh_nodes, node);
+        if (boxIntersection(ro, invDir, node, tMax)) {
+            for (int k = 0; k < info.z; k++) {
+                vec3 n;
+                int material;
+                float t = primitiveIntersection(ro, rd, texelFetch(bvh_prims, info.y + k).x, n, material);
+                if (t > 0.0 && t < tMax) {
+                    return true;
+                }
+            }
+            node = (info.z > 0) ? info.x : node + 1;
+        } else {
+            node = info.x;
+        }
+    }
+    return false;
+}
+
 float planeIntersection(vec3 ro, vec3 rd, Plane pl, out vec3 hitNormal) {
+    COUNT(INTERSECTION_TESTS);
     float denom = dot(rd, pl.normal);
     if (abs(denom) > 0.0001) {
         float t = dot(pl.point - ro, pl.normal) / denom;
@@ -79,6 +330,51 @@ float planeIntersection(vec3 ro, vec3 rd, Plane pl, out vec3 hitNormal) {
     return -1.0;
 }
 
+// Position of light l as seen from hitPos. Path-traced lights are spheres, a random
+// point of their disk facing hitPos gives one sample of the soft shadow.
+vec3 lightPoint(int l, vec3 hitPos) {
+    vec3 center = light_data[2 * l];
+#if PATH_TRACE
+    vec3 t, b;
+    basis(normalize(center - hitPos), t, b);
+    float r = light_radius * sqrt(random());
+    float phi = 2.0 * PI * random();
+    return center + (t * cos(phi) + b * sin(phi)) * r;
+#else
+    return center;
+#endif
+}
+
+// Diffuse light arriving at a surface point. Lights that cannot contribute (facing
+// away or black) are skipped before a shadow ray is traced, and occluders only count
+// between the surface and the light.
+vec3 directLighting(vec3 hitPos, vec3 hitNormal) {
+    vec3 totalDiffuse = vec3(0.0);
+    for (int l = 0; l < NUM_LIGHTS; l++) {
+        vec3 toLight = lightPoint(l, hitPos) - hitPos;
+        float lightDist = length(toLight);
+        vec3 lightDir = normalize(toLight);
+        vec3 contribution = max(dot(hitNormal, lightDir), 0.0) * light_data[2 * l + 1];
+        if (all(equal(contribution, vec3(0.0)))) {
+            continue;
+        }
+#if ENABLE_SHADOWS
+        COUNT(SHADOW_RAYS);
+        vec3 shadowOrigin = hitPos + hitNormal * 0.001;
+        if (objectsOccluded(shadowOrigin, lightDir, lightDist)) {
+            continue;
+        }
+        vec3 tn;
+        float tShadowPlane = planeIntersection(shadowOrigin, lightDir, plane, tn);
+        if (tShadowPlane > 0.0 && tShadowPlane < lightDist) {
+            continue;
+        }
+#endif
+        totalDiffuse += contribution;
+    }
+    return totalDiffuse;
+}
+
 
 // This returns the fraction of light that is reflected at the interface.
 // totalInternal is set to true if we have total internal reflection.
@@ -110,40 +406,82 @@ float fresnelSchlick(vec3 rd, vec3 n, float iorIn, float iorOut, out bool totalI
     }
 }
 
-// This is a simple reflection function that does a single bounce.
-vec3 computeReflectionColor(vec3 ro, vec3 rd) {
-    // Find the nearest object.
-    float nearestT = -1.0;
-    vec3 hitNormal = vec3(0.0);
-    vec3 hitColor  = vec3(0.0);
-    int hitObject  = -1; // 0= Sphere, 1= Plane
-    int hitIndex   = -1;
-
-    // Spheres
-    for (int i = 0; i < NUM_SPHERES; i++) {
-        vec3 n;
-        float t = sphereIntersection(ro, rd, spheres[i], n);
-        if (t > 0.0 && (t < nearestT || nearestT < 0.0)) {
-            nearestT = t;
-            hitNormal = n;
-            hitColor = spheres[i].color;
-            hitObject = 0;
-            hitIndex = i;
-        }
+void intersectScenePlane(vec3 ro, vec3 rd, inout float nearestT, inout vec3 hitNormal, inout int material) {
+    vec3 n;
+    float t = planeIntersection(ro, rd, plane, n);
+    if (t > 0.0 && (t < nearestT || nearestT < 0.0)) {
+        nearestT = t;
+        hitNormal = n;
+        material = -1;
     }
+}
+
+// Nearest hit of the scene. Returns t, or -1 if the ray escapes; material is the
+// object's block in sphere_data or -1 for the plane.
+float nearestHit(vec3 ro, vec3 rd, out vec3 hitNormal, out int material) {
+    float nearestT = -1.0;
+    hitNormal = vec3(0.0);
+    material = -1;
+    intersectObjects(ro, rd, nearestT, hitNormal, material);
+    intersectScenePlane(ro, rd, nearestT, hitNormal, material);
+    return nearestT;
+}
 
-    // Plane
-    {
-        vec3 n;
-        float t = planeIntersection(ro, rd, plane, n);
-        if (t > 0.0 && (t < nearestT || nearestT < 0.0)) {
-            nearestT = t;
-            hitNormal = n;
-            hitColor = plane.color;
-            hitObject = 1;
-            hitIndex = -1;
+// nearestHit() for the camera ray through pixel
+float primaryHit(vec3 ro, vec3 rd, vec2 pixel, out vec3 hitNormal, out int material) {
+    float nearestT = -1.0;
+    hitNormal = vec3(0.0);
+    material = -1;
+    intersectTile(ro, rd, pixel, nearestT, hitNormal, material);
+    intersectScenePlane(ro, rd, nearestT, hitNormal, material);
+    return nearestT;
+}
+
+#if PATH_TRACE
+// Light arriving at a surface point from the sky and the other surfaces, one random
+// path of cosine-weighted bounces that treats every surface as diffuse
+vec3 indirectDiffuse(vec3 hitPos, vec3 n) {
+    vec3 radiance = vec3(0.0);
+    vec3 throughput = vec3(1.0);
+    for (int bounce = 0; bounce < DIFFUSE_BOUNCES; bounce++) {
+        vec3 t, b;
+        basis(n, t, b);
+        float r = sqrt(random());
+        float phi = 2.0 * PI * random();
+        vec3 rd = t * (r * cos(phi)) + b * (r * sin(phi)) + n * sqrt(max(0.0, 1.0 - r * r));
+        vec3 ro = hitPos + n * 0.001;
+        vec3 hitNormal;
+        int material;
+        float nearestT = nearestHit(ro, rd, hitNormal, material);
+        if (nearestT < 0.0) {
+            radiance += throughput * getSkyColor(rd);
+            break;
         }
+        hitPos = ro + rd * nearestT;
+        n = dot(rd, hitNormal) > 0.0 ? -hitNormal : hitNormal;
+        throughput *= getMaterial(material).color;
+        radiance += throughput * directLighting(hitPos, n);
     }
+    return radiance;
+}
+#endif
+
+// Light that does not come straight from a light source: a constant in the
+// deterministic tracer, gathered by a random diffuse path when path tracing
+vec3 ambientLight(vec3 hitPos, vec3 hitNormal, vec3 rd, vec3 color) {
+#if PATH_TRACE
+    return indirectDiffuse(hitPos, dot(rd, hitNormal) > 0.0 ? -hitNormal : hitNormal) * color;
+#else
+    return ambient;
+#endif
+}
+
+// This is a simple reflection function that does a single bounce.
+vec3 computeReflectionColor(vec3 ro, vec3 rd) {
+    COUNT(REFLECTION_RAYS);
+    vec3 hitNormal;
+    int material;
+    float nearestT = nearestHit(ro, rd, hitNormal, material);
 
     if (nearestT < 0.0) {
         // no intersection: return sky color
@@ -154,81 +492,35 @@ vec3 computeReflectionColor(vec3 ro, vec3 rd) {
     vec3 hitPos = ro + rd * nearestT;
 
     // Simple direct lighting.
-    vec3 totalDiffuse = vec3(0.0);
-    for (int l = 0; l < NUM_LIGHTS; l++) {
-        vec3 lightDir = normalize(lights[l].position - hitPos);
-        // check shadow
-        float shadow = 1.0;
-        // sphere shadow check
-        for (int j = 0; j < NUM_SPHERES; j++) {
-            vec3 tn;
-            float ts = sphereIntersection(hitPos + hitNormal * 0.001, lightDir, spheres[j], tn);
-            if (ts > 0.0) {
-                shadow = 0.0;
-                break;
-            }
-        }
-        // plane shadow check
-        {
-            vec3 tn;
-            float ts = planeIntersection(hitPos + hitNormal * 0.001, lightDir, plane, tn);
-            if (ts > 0.0) {
-                shadow = 0.0;
-            }
-        }
-        float diff = max(dot(hitNormal, lightDir), 0.0) * shadow;
-        totalDiffuse += diff * lights[l].color;
-    }
+    vec3 totalDiffuse = directLighting(hitPos, hitNormal);
 
-    vec3 surfaceColor = (totalDiffuse * hitColor) + ambient;
+    vec3 color = getMaterial(material).color;
+    vec3 surfaceColor = (totalDiffuse * color) + ambientLight(hitPos, hitNormal, rd, color);
     return surfaceColor;
 }
 
+// Whether a path continues after hitting this material (see traceRay)
+bool needsBounces(Material m) {
+#if ENABLE_REFRACTION
+    // the partial reflection is traced even on the last bounce
+    if (m.transparency > 0.0) {
+        return true;
+    }
+#endif
+    return MAX_BOUNCES > 1 && m.reflectivity > 0.0;
+}
+
 
-// This function traces a single ray and returns the accumulated color.
-vec3 traceRay(vec3 ro, vec3 rd) {
+// This function traces a single ray and returns the accumulated color. The first
+// hit (nearestT, hitNormal, material as returned by nearestHit) is passed in.
+vec3 traceRay(vec3 ro, vec3 rd, float nearestT, vec3 hitNormal, int material) {
     vec3 colorAccum = vec3(0.0);
     vec3 attenuation = vec3(1.0);
 
-    for (int bounce = 0; bounce < maxBounces; bounce++) {
-        float nearestT = -1.0;
-        vec3 hitNormal = vec3(0.0);
-        vec3 hitColor = vec3(0.0);
-        float hitReflect = 0.0;
-        float hitTransp  = 0.0;
-        float hitIOR     = 1.0;
-        int hitObjectType = -1; // 0 = sphere, 1 = plane
-        int hitIndex     = -1;
-
-        // Intersect with spheres
-        for (int i = 0; i < NUM_SPHERES; i++) {
-            vec3 n;
-            float t = sphereIntersection(ro, rd, spheres[i], n);
-            if (t > 0.0 && (t < nearestT || nearestT < 0.0)) {
-                nearestT = t;
-                hitNormal = n;
-                hitColor = spheres[i].color;
-                hitReflect = spheres[i].reflectivity;
-                hitTransp  = spheres[i].transparency;
-                hitIOR     = spheres[i].ior;
-                hitObjectType = 0;
-                hitIndex   = i;
-            }
-        }
-        // Intersect with plane
-        {
-            vec3 n;
-            float t = planeIntersection(ro, rd, plane, n);
-            if (t > 0.0 && (t < nearestT || nearestT < 0.0)) {
-                nearestT = t;
-                hitNormal = n;
-                hitColor = plane.color;
-                hitReflect = plane.reflectivity;
-                hitTransp  = 0.0;
-                hitIOR     = 1.0;
-                hitObjectType = 1;
-                hitIndex   = -1;
-            }
+    for (int bounce = 0; bounce < MAX_BOUNCES; bounce++) {
+        if (bounce > 0) {
+            COUNT(BOUNCES);
+            nearestT = nearestHit(ro, rd, hitNormal, material);
         }
 
         // If we didn't hit anything, add sky color & end
@@ -239,43 +531,23 @@ vec3 traceRay(vec3 ro, vec3 rd) {
         }
 
         // We hit something
+        Material m = getMaterial(material);
         vec3 hitPos = ro + rd * nearestT;
 
         // Direct lighting at the hit
         {
-            vec3 totalDiffuse = vec3(0.0);
-            for (int l = 0; l < NUM_LIGHTS; l++) {
-                vec3 lightDir = normalize(lights[l].position - hitPos);
-                float shadow = 1.0;
-                // check shadow
-                for (int j = 0; j < NUM_SPHERES; j++) {
-                    vec3 tn;
-                    float tShadow = sphereIntersection(hitPos + hitNormal * 0.001, lightDir, spheres[j], tn);
-                    if (tShadow > 0.0) {
-                        shadow = 0.0;
-                        break;
-                    }
-                }
-                {
-                    vec3 tn;
-                    float tShadowPlane = planeIntersection(hitPos + hitNormal * 0.001, lightDir, plane, tn);
-                    if (tShadowPlane > 0.0) {
-                        shadow = 0.0;
-                    }
-                }
-                float diff = max(dot(hitNormal, lightDir), 0.0) * shadow;
-                totalDiffuse += diff * lights[l].color;
-            }
-            vec3 lighting = totalDiffuse * hitColor + ambient;
+            vec3 totalDiffuse = directLighting(hitPos, hitNormal);
+            vec3 lighting = totalDiffuse * m.color + ambientLight(hitPos, hitNormal, rd, m.color);
             colorAccum += attenuation * lighting; // add direct lighting
         }
 
         // Reflection / Refraction logic
         bool totalInternal = false;
-        float kr = fresnelSchlick(rd, hitNormal, 1.0, hitIOR, totalInternal);
+        float kr = fresnelSchlick(rd, hitNormal, 1.0, m.ior, totalInternal);
 
+#if ENABLE_REFRACTION
         // If object is transparent
-        if (hitTransp > 0.0) {
+        if (m.transparency > 0.0) {
             // partial reflection
             if (!totalInternal && kr > 0.0) {
                 vec3 reflectDir = reflect(rd, hitNormal);
@@ -283,7 +555,7 @@ vec3 traceRay(vec3 ro, vec3 rd) {
                 vec3 reflectionColor = computeReflectionColor(reflectOrigin, reflectDir);
 
                 // Weighted add
-                colorAccum += attenuation * reflectionColor * kr * hitReflect;
+                colorAccum += attenuation * reflectionColor * kr * m.reflectivity;
             } else if (totalInternal) {
                 // If total internal reflection, reflection is effectively 100%
                 kr = 1.0;
@@ -293,21 +565,17 @@ vec3 traceRay(vec3 ro, vec3 rd) {
             if (kr < 1.0) {
                 // Beer–Lambert
                 float distInMedium = nearestT; // approximate
-                vec3 absorb = vec3(0.0);
-                if (hitObjectType == 0 && hitIndex >= 0) {
-                    absorb = spheres[hitIndex].absorption;
-                }
-                attenuation *= exp(-absorb * distInMedium);
+                attenuation *= exp(-m.absorption * distInMedium);
 
                 // scale attenuation by (1-kr)*transparency
-                attenuation *= (1.0 - kr) * hitTransp;
+                attenuation *= (1.0 - kr) * m.transparency;
 
                 // Refract
                 vec3 n = hitNormal;
                 float cosi = dot(rd, n);
                 if (cosi > 0.0) n = -n;
 
-                float eta = (cosi > 0.0) ? (hitIOR / 1.0) : (1.0 / hitIOR);
+                float eta = (cosi > 0.0) ? (m.ior / 1.0) : (1.0 / m.ior);
                 vec3 refractDir = refract(rd, n, eta);
 
                 ro = hitPos + refractDir * 0.001;
@@ -315,15 +583,18 @@ vec3 traceRay(vec3 ro, vec3 rd) {
             } else {
                 // total internal reflection or near total reflection
                 // reflect the main ray
-                attenuation *= hitReflect;
+                attenuation *= m.reflectivity;
                 vec3 reflectDir = reflect(rd, hitNormal);
                 ro = hitPos + reflectDir * 0.001;
                 rd = reflectDir;
             }
         }
-        else if (hitReflect > 0.0) {
+        else
+#endif
+        // without refraction transparent objects are shaded like opaque ones
+        if (m.reflectivity > 0.0) {
             // Opaque + reflective
-            attenuation *= hitReflect;
+            attenuation *= m.reflectivity;
             vec3 reflectDir = reflect(rd, hitNormal);
             ro = hitPos + reflectDir * 0.001;
             rd = reflectDir;
@@ -338,99 +609,31 @@ vec3 traceRay(vec3 ro, vec3 rd) {
 }
 
 
-void initScene() {
-    // Spheres
-    spheres[0] = Sphere(
-        vec3(-1.5, 0.0, 5.0), // center
-        1.0,                  // radius
-        vec3(1.0, 0.0, 0.0),  // color
-        0.2,                  // reflectivity
-        0.0,                  // transparency
-        1.0,                  // ior
-        vec3(0.0)            // absorption
-    );
-    spheres[1] = Sphere(
-        vec3(1.5, 0.0, 6.0), // center
-        1.0,                // radius
-        vec3(0.0, 0.0, 1.0),  // color
-        0.8,  // reflectivity
-        0.0,  // transparency
-        1.0,  // ior
-        vec3(0.02) // absorption
-    );
-    spheres[2] = Sphere(
-        vec3(0.0, -0.5, 3.0), // center
-        0.5,                 // radius
-        vec3(0.9, 0.9, 0.9), // color
-        0.9,  // reflectivity
-        0.95, // transparency
-        0.87,  // ior
-        vec3(0.0) // absorption
-    );
-    spheres[3] = Sphere(
-        vec3(2.0, -0.3, 3.0),
-        0.7,
-        vec3(0.7, 0.6, 0.5),
-        0.9,  // reflectivity
-        0.95, // transparency
-        0.87,  // ior
-        vec3(0.0)
-    );
-
-
-    // Random spheres on a circle
-    float ringRadius = 3.5;
-    int ringCount = 23;
-    for(int i = 0; i < ringCount; i++){
-        int sIndex = 4 + i;
-
-        // angle around circle
-        float angle = 2.0 * 3.14159 * float(i) / float(ringCount); 
-
-        // position on circle
-        float xPos = ringRadius * cos(angle);
-        float zPos = 3.5 + ringRadius * sin(angle);
-
-        // slightly vary radius between 0.15 and 0.20
-        float rad = (i % 2 == 0) ? 0.20 : 0.15;
-        float yPos = -1.0 + rad;  // sits on plane
-
-        vec3 col = vec3(
-            0.3 + 0.7 * fract(sin(float(i)*12.345)*9876.543), // randomish red
-            0.3 + 0.7 * fract(sin(float(i)*3.217)*5432.123),  // randomish green
-            0.3 + 0.7 * fract(sin(float(i)*5.789)*6543.234)   // randomish blue
-        );
-
-        // reflectivity or transparency also randomish
-        float refl = 0.1 + 0.4*fract(sin(float(i)*1.111)*777.0);   // between 0.1..0.5
-        float transp = 0.2 * fract(sin(float(i)*2.222)*123.0);     // between 0..0.2
-        float iorVal = 1.0 + 0.5*fract(sin(float(i)*4.444)*987.0); // between 1..1.5
-
-        spheres[sIndex] = Sphere(
-            vec3(xPos, yPos, zPos),
-            rad,
-            col,
-            refl,
-            transp,
-            iorVal,
-            vec3(0.0) // no absorption for now
-        );
-    }
+// Image pixel (centre) traced by this fragment
+vec2 pixelCoord() {
+#if SPARSE_TRACE
+    ivec2 fragment = ivec2(gl_FragCoord.xy);
+    int x = (trace_offset.x + trace_row_shift * fragment.y) % trace_stride.x;
+    return vec2(fragment * trace_stride + ivec2(x, trace_offset.y)) + 0.5;
+#else
+    return gl_FragCoord.xy;
+#endif
+}
 
-    // Plane
-    plane = Plane(
-        vec3(0.0, -1.0, 0.0), // point
-        vec3(0.0, 1.0, 0.0),  // normal
-        vec3(0.32, 0.18, 0.26), // color
-        0.4 // reflectivity
-    );
+// Output alpha, the hit distance when tracing sparsely (the sky is far away)
+float outputAlpha(float nearestT) {
+#if SPARSE_TRACE
+    return nearestT > 0.0 ? nearestT : 1e6;
+#else
+    return 1.0;
+#endif
 }
 
-void main(){
-    initScene();
 
+void main(){
     // Compute normalized screen coords
-    vec2 uv = (gl_FragCoord.xy / resolution.xy) * 2.0 - 1.0;
+    vec2 pixel = pixelCoord();
+    vec2 uv = ((pixel + jitter) / resolution.xy) * 2.0 - 1.0;
     uv.x *= resolution.x / resolution.y;
 
     // Build initial ray
@@ -440,8 +643,48 @@ void main(){
     uv *= focal;
     vec3 rd = normalize(camera_dir + vec3(uv, 0.0));
 
+#if RENDER_PASS == PASS_FORWARD
     // Trace
-    vec3 finalColor = traceRay(ro, rd);
-    FragColor = vec4(finalColor, 1.0);
+    vec3 hitNormal;
+    int material;
+    float nearestT = primaryHit(ro, rd, pixel, hitNormal, material);
+#if PATH_TRACE
+    rngState = pcg(pcg(uint(pixel.x) + pcg(uint(pixel.y))) + uint(sample_index));
+#endif
+    vec3 finalColor = traceRay(ro, rd, nearestT, hitNormal, material);
+#if DIAGNOSTICS
+    FragColor = counters;
+#else
+    FragColor = vec4(finalColor, outputAlpha(nearestT));
+#endif
+#elif RENDER_PASS == PASS_GBUFFER
+    vec3 hitNormal;
+    int material;
+    float nearestT = primaryHit(ro, rd, pixel, hitNormal, material);
+    gPosition = vec4(ro + rd * max(nearestT, 0.0), nearestT);
+    gNormal = vec4(hitNormal, float(material));
+    // near for paths that continue, far for the rest
+    gl_FragDepth = (nearestT > 0.0 && needsBounces(getMaterial(material))) ? 0.0 : 1.0;
+#else
+    ivec2 texel = ivec2(gl_FragCoord.xy);
+    vec4 position = texelFetch(gbuffer_position, texel, 0);
+    vec4 normal = texelFetch(gbuffer_normal, texel, 0);
+    float nearestT = position.w;
+    int material = int(normal.w);
+#if RENDER_PASS == PASS_SHADE
+    // the path ends at the first hit, this is the first iteration of traceRay()
+    vec3 finalColor = vec3(0.0);
+    if (MAX_BOUNCES > 0) {
+        if (nearestT < 0.0) {
+            finalColor = getSkyColor(rd);
+        } else {
+            finalColor = directLighting(position.xyz, normal.xyz) * getMaterial(material).color + ambient;
+        }
+    }
+#else
+    vec3 finalColor = traceRay(ro, rd, nearestT, normal.xyz, material);
+#endif
+    FragColor = vec4(finalColor, outputAlpha(nearestT));
+#endif
 }
 """
\ No newline at end of file
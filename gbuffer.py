@@ -0,0 +1,66 @@
+from OpenGL.GL import *
+
+# sampler name -> texture unit, the units after the scene textures
+GBUFFER_TEXTURES = {
+    "gbuffer_position": 6,
+    "gbuffer_normal": 7,
+}
+
+
+class GBuffer:
+    # Targets of the deferred mode: the primary hits in two RGBA32F textures, a depth
+    # buffer that marks the pixels whose paths continue, and the color written by the
+    # shade and bounce passes, which test against that depth buffer.
+    def __init__(self, width, height):
+        self.position, self.normal, self.color = glGenTextures(3)
+        self.depth = glGenRenderbuffers(1)
+        self.gbuffer_fbo, self.shading_fbo = glGenFramebuffers(2)
+        self.resize(width, height)
+
+    def resize(self, width, height):
+        self.width = width
+        self.height = height
+
+        for texture in (self.position, self.normal, self.color):
+            glBindTexture(GL_TEXTURE_2D, texture)
+            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA32F, width, height, 0, GL_RGBA, GL_FLOAT, None)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.depth)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, width, height)
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self.gbuffer_fbo)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.position, 0)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT1, GL_TEXTURE_2D, self.normal, 0)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self.depth)
+        glDrawBuffers(2, [GL_COLOR_ATTACHMENT0, GL_COLOR_ATTACHMENT1])
+        self.check()
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self.shading_fbo)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.color, 0)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self.depth)
+        self.check()
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+    def check(self):
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+            raise Exception("G-buffer framebuffer is incomplete")
+
+    def bind_gbuffer(self):
+        glBindFramebuffer(GL_FRAMEBUFFER, self.gbuffer_fbo)
+        glViewport(0, 0, self.width, self.height)
+
+    def bind_shading(self):
+        glBindFramebuffer(GL_FRAMEBUFFER, self.shading_fbo)
+        glViewport(0, 0, self.width, self.height)
+        glActiveTexture(GL_TEXTURE0 + GBUFFER_TEXTURES["gbuffer_position"])
+        glBindTexture(GL_TEXTURE_2D, self.position)
+        glActiveTexture(GL_TEXTURE0 + GBUFFER_TEXTURES["gbuffer_normal"])
+        glBindTexture(GL_TEXTURE_2D, self.normal)
+
+    def cleanup(self):
+        glDeleteFramebuffers(2, [self.gbuffer_fbo, self.shading_fbo])
+        glDeleteRenderbuffers(1, [self.depth])
+        glDeleteTextures(3, [self.position, self.normal, self.color])
@@ -0,0 +1,292 @@
+from OpenGL.GL import *
+import numpy as np
+from fragment_shader import FRAGMENT_SHADER
+from vertex_shader import VERTEX_SHADER
+from scene_buffers import SceneBuffers, SCENE_TEXTURES
+from shader_cache import ShaderCache, DEFAULT_CACHE_DIR
+from profiler import NullProfiler
+from gpu_timer import GPUTimer
+from light import merge_lights, LIGHT_RADIUS
+from gbuffer import GBuffer, GBUFFER_TEXTURES
+from tile_culling import TileCuller, TILE_TEXTURES
+
+# values of the RENDER_PASS define, see fragment_shader.py
+PASS_FORWARD = 0
+PASS_GBUFFER = 1
+PASS_SHADE = 2
+PASS_BOUNCE = 3
+
+def sparse_size(width, height, pattern):
+    # size of the target a sparse trace pattern renders into
+    if pattern is None:
+        return width, height
+    (stride_x, stride_y), _, _ = pattern
+    return -(-width // stride_x), -(-height // stride_y)
+
+
+class ShaderVariant:
+    def __init__(self, program):
+        self.program = program
+        self.scene_state = None
+        glUseProgram(program)
+
+        self.resolution_loc = glGetUniformLocation(program, "resolution")
+        self.time_loc = glGetUniformLocation(program, "time")
+        self.camera_pos_loc = glGetUniformLocation(program, "camera_pos")
+        self.camera_dir_loc = glGetUniformLocation(program, "camera_dir")
+        self.jitter_loc = glGetUniformLocation(program, "jitter")
+        self.sample_index_loc = glGetUniformLocation(program, "sample_index")
+        self.light_radius_loc = glGetUniformLocation(program, "light_radius")
+        self.num_nodes_loc = glGetUniformLocation(program, "num_nodes")
+        self.num_spheres_loc = glGetUniformLocation(program, "num_spheres")
+        self.tile_grid_loc = glGetUniformLocation(program, "tile_grid")
+        self.tile_size_loc = glGetUniformLocation(program, "tile_size")
+        self.trace_pattern_locs = [
+            glGetUniformLocation(program, name) for name in ("trace_stride", "trace_offset", "trace_row_shift")
+        ]
+        for name, (unit, _) in SCENE_TEXTURES.items():
+            glUniform1i(glGetUniformLocation(program, name), unit)
+        for name, unit in GBUFFER_TEXTURES.items():
+            glUniform1i(glGetUniformLocation(program, name), unit)
+        for name, (unit, _) in TILE_TEXTURES.items():
+            glUniform1i(glGetUniformLocation(program, name), unit)
+
+        self.plane_uniforms = [
+            glGetUniformLocation(program, f"plane.{name}")
+            for name in ("point", "normal", "color", "reflectivity")
+        ]
+        self.light_data_loc = glGetUniformLocation(program, "light_data")
+
+
+class GLRenderer:
+    def __init__(self, max_bounces=6, shadows=True, refraction=True, deferred=False, profiler=None,
+                 shader_cache_dir=DEFAULT_CACHE_DIR, tile_culling=True, light_radius=LIGHT_RADIUS):
+        self.max_bounces = max_bounces
+        self.shadows = shadows
+        self.refraction = refraction
+        # two-pass mode: primary hits go to a G-buffer first and only pixels whose
+        # paths continue run the bounce loop
+        self.deferred = deferred
+        self.gbuffer = None
+        # size of the area lights of path-traced samples
+        self.light_radius = light_radius
+        self.profiler = profiler or NullProfiler()
+        self.init_buffers()
+        self.init_shaders(shader_cache_dir)
+        self.scene_buffers = SceneBuffers()
+        # primary rays only walk the BVH subtrees projected onto their screen tile
+        self.tile_culling = tile_culling
+        self.tile_culler = TileCuller()
+
+        # callbacks receiving (frame, milliseconds) for every timed draw; draws are
+        # only timed while somebody listens
+        self.gpu_listeners = []
+        self.gpu_timer = GPUTimer()
+
+    def init_buffers(self):
+        vertices = np.array([
+            -1.0, -1.0,
+             1.0, -1.0,
+            -1.0,  1.0,
+             1.0,  1.0,
+        ], dtype=np.float32)
+
+        self.vao = glGenVertexArrays(1)
+        glBindVertexArray(self.vao)
+
+        self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+
+        # `position` is bound to location 0 in the vertex shader
+        glEnableVertexAttribArray(0)
+        glVertexAttribPointer(0, 2, GL_FLOAT, GL_FALSE, 0, None)
+        glBindVertexArray(0)
+
+    def init_shaders(self, cache_dir):
+        self.shader_cache = ShaderCache(VERTEX_SHADER, FRAGMENT_SHADER, cache_dir)
+        self.variants = {}
+        # nothing is built until request_variants() or the first draw
+        self.variant = None
+        self.shader = None
+
+    def defines(self, num_lights, render_pass=PASS_FORWARD, sparse=False, diagnostics=False, path_trace=False):
+        return {
+            "NUM_LIGHTS": num_lights,
+            "MAX_BOUNCES": self.max_bounces,
+            "ENABLE_SHADOWS": self.shadows,
+            "ENABLE_REFRACTION": self.refraction,
+            "RENDER_PASS": render_pass,
+            "SPARSE_TRACE": sparse,
+            "DIAGNOSTICS": diagnostics,
+            "PATH_TRACE": path_trace,
+        }
+
+    def request_variant(self, num_lights, render_pass=PASS_FORWARD, sparse=False, diagnostics=False, path_trace=False):
+        self.shader_cache.request(self.defines(num_lights, render_pass, sparse, diagnostics, path_trace))
+
+    def request_variants(self, scene, sparse=False, diagnostics=False, path_trace=False):
+        # Starts building the programs that draws of `scene` will pick with these
+        # options (sparse: a trace pattern, diagnostics: the counter overlay as well,
+        # path_trace: samples and their G-buffer), so they compile while the caller
+        # does other work. The first draw waits for them.
+        num_lights = len(merge_lights(scene.lights))
+        if path_trace:
+            self.request_variant(num_lights, PASS_GBUFFER)
+            self.request_variant(num_lights, PASS_FORWARD, path_trace=True)
+            return
+        for render_pass in (PASS_GBUFFER, PASS_SHADE, PASS_BOUNCE) if self.deferred else (PASS_FORWARD,):
+            self.request_variant(num_lights, render_pass, sparse)
+        if diagnostics:
+            self.request_variant(num_lights, PASS_FORWARD, diagnostics=True)
+
+    def select_variant(self, num_lights, render_pass=PASS_FORWARD, sparse=False, diagnostics=False, path_trace=False):
+        # settings are compile-time constants, every combination is its own program
+        program = self.shader_cache.get(self.defines(num_lights, render_pass, sparse, diagnostics, path_trace))
+        if program not in self.variants:
+            self.variants[program] = ShaderVariant(program)
+        return self.variants[program]
+
+    def upload_scene(self, scene):
+        updated = self.scene_buffers.update(scene)
+        # uniforms are per program, a variant that has not seen this scene yet needs them too
+        state = (self.scene_buffers.scene, self.scene_buffers.version)
+        if not updated and self.variant.scene_state == state:
+            return
+        self.variant.scene_state = state
+        point_loc, normal_loc, color_loc, reflectivity_loc = self.variant.plane_uniforms
+        glUniform3f(point_loc, *scene.plane.point)
+        glUniform3f(normal_loc, *scene.plane.normal)
+        glUniform3f(color_loc, *scene.plane.color)
+        glUniform1f(reflectivity_loc, scene.plane.reflectivity)
+        glUniform1i(self.variant.num_nodes_loc, self.scene_buffers.num_nodes)
+        glUniform1i(self.variant.num_spheres_loc, self.scene_buffers.num_spheres)
+
+    def poll_gpu_times(self):
+        for frame, elapsed in self.gpu_timer.collect():
+            for listener in self.gpu_listeners:
+                listener(frame, elapsed)
+
+    def use_variant(self, render_pass, camera, scene, lights, time, width, height, jitter, pattern, diagnostics=False,
+                    sample=None):
+        self.variant = self.select_variant(len(lights), render_pass, pattern is not None, diagnostics, sample is not None)
+        self.shader = self.variant.program
+        glUseProgram(self.shader)
+
+        with self.profiler.section("uniforms"):
+            self.upload_scene(scene)
+            self.scene_buffers.bind()
+            self.tile_culler.bind()
+
+            variant = self.variant
+            glUniform2i(variant.tile_grid_loc, *self.tile_culler.grid)
+            glUniform1i(variant.tile_size_loc, self.tile_culler.tile_size)
+            glUniform2f(variant.resolution_loc, width, height)
+            glUniform1f(variant.time_loc, time)
+            glUniform3f(variant.camera_pos_loc, *camera.position)
+            glUniform3f(variant.camera_dir_loc, *camera.direction)
+            glUniform2f(variant.jitter_loc, *jitter)
+            if len(lights):
+                glUniform3fv(variant.light_data_loc, 2 * len(lights), lights)
+            if pattern is not None:
+                (stride_x, stride_y), (offset_x, offset_y), row_shift = pattern
+                stride_loc, offset_loc, row_shift_loc = variant.trace_pattern_locs
+                glUniform2i(stride_loc, stride_x, stride_y)
+                glUniform2i(offset_loc, offset_x, offset_y)
+                glUniform1i(row_shift_loc, row_shift)
+            if sample is not None:
+                glUniform1i(variant.sample_index_loc, sample)
+                glUniform1f(variant.light_radius_loc, self.light_radius)
+
+    def update_tiles(self, camera, scene, width, height):
+        with self.profiler.section("tile_culling"):
+            if self.tile_culling:
+                self.tile_culler.update(camera, scene, width, height)
+            else:
+                self.tile_culler.grid = (0, 0)
+
+    def draw(self, camera, scene, time, width, height, jitter=(0.0, 0.0), pattern=None, diagnostics=False, sample=None):
+        # pattern = ((stride x, y), (offset x, y), row shift) traces one pixel per
+        # stride block of the width x height image into a target of the reduced size,
+        # with the hit distance in alpha; see SPARSE_TRACE in fragment_shader.py.
+        # diagnostics draws the per-pixel counters of a forward pass instead of the
+        # color, the bound target has to be RGBA32I. sample draws path-traced sample
+        # number `sample` (see PATH_TRACE) instead of the deterministic image.
+        self.poll_gpu_times()
+        lights = merge_lights(scene.lights)
+        glBindVertexArray(self.vao)
+        frame = (camera, scene, lights, time, width, height, jitter, pattern)
+        viewport = sparse_size(width, height, pattern)
+        self.update_tiles(camera, scene, width, height)
+
+        timed = bool(self.gpu_listeners)
+        if timed:
+            self.gpu_timer.begin(self.profiler.current_frame())
+        if self.deferred and not diagnostics and sample is None:
+            self.draw_deferred(frame, viewport)
+        else:
+            glViewport(0, 0, *viewport)
+            if not diagnostics:
+                # integer targets cannot be cleared this way, the quad covers them anyway
+                glClear(GL_COLOR_BUFFER_BIT)
+            self.use_variant(PASS_FORWARD, *frame, diagnostics, sample)
+            glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+        if timed:
+            self.gpu_timer.end()
+        glBindVertexArray(0)
+
+    def draw_gbuffer(self, camera, scene, time, gbuffer):
+        # only the primary hits of the pixel centres, e.g. to guide a denoiser
+        lights = merge_lights(scene.lights)
+        glBindVertexArray(self.vao)
+        self.update_tiles(camera, scene, gbuffer.width, gbuffer.height)
+        gbuffer.bind_gbuffer()
+        self.use_variant(PASS_GBUFFER, camera, scene, lights, time, gbuffer.width, gbuffer.height, (0.0, 0.0), None)
+        glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+        glBindVertexArray(0)
+
+    def draw_deferred(self, frame, viewport):
+        # the result is copied into the framebuffer that was bound by the caller
+        width, height = viewport
+        target = glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING)
+        if self.gbuffer is None:
+            self.gbuffer = GBuffer(width, height)
+        elif (self.gbuffer.width, self.gbuffer.height) != (width, height):
+            self.gbuffer.resize(width, height)
+
+        # primary hits, depth 0 where the path continues and 1 where it ends
+        self.gbuffer.bind_gbuffer()
+        glEnable(GL_DEPTH_TEST)
+        glDepthFunc(GL_ALWAYS)
+        self.use_variant(PASS_GBUFFER, *frame)
+        glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+
+        # the quad lies at depth 0.5, so the depth test sends every pixel to exactly
+        # one of the two shading passes and the bounce pass skips all others
+        self.gbuffer.bind_shading()
+        glDepthMask(GL_FALSE)
+        glDepthFunc(GL_LESS)
+        self.use_variant(PASS_SHADE, *frame)
+        glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+        glDepthFunc(GL_GREATER)
+        self.use_variant(PASS_BOUNCE, *frame)
+        glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+        glDepthMask(GL_TRUE)
+        glDepthFunc(GL_LESS)
+        glDisable(GL_DEPTH_TEST)
+
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.gbuffer.shading_fbo)
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, target)
+        glBlitFramebuffer(0, 0, width, height, 0, 0, width, height, GL_COLOR_BUFFER_BIT, GL_NEAREST)
+        glBindFramebuffer(GL_FRAMEBUFFER, target)
+        glViewport(0, 0, width, height)
+
+    def cleanup(self):
+        self.gpu_timer.cleanup()
+        if self.gbuffer is not None:
+            self.gbuffer.cleanup()
+        self.scene_buffers.cleanup()
+        self.tile_culler.cleanup()
+        self.shader_cache.cleanup()
+        glDeleteVertexArrays(1, [self.vao])
+        glDeleteBuffers(1, [self.vbo])
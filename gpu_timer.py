@@ -0,0 +1,42 @@
+import ctypes
+from collections import deque
+from OpenGL.GL import *
+from OpenGL.raw.GL.VERSION.GL_3_3 import glGetQueryObjectui64v
+
+
+class GPUTimer:
+    # GL_TIME_ELAPSED queries in a small ring. Results are collected a few frames
+    # later once the GPU has caught up, so timing never stalls the pipeline.
+    def __init__(self, latency=4):
+        self.queries = list(glGenQueries(latency))
+        self.free = deque(self.queries)
+        self.pending = deque()
+        self.finished = []
+
+    def begin(self, tag=None):
+        if not self.free:
+            # every query is still in flight, wait for the oldest one
+            self.read_oldest()
+        query = self.free.popleft()
+        self.pending.append((query, tag))
+        glBeginQuery(GL_TIME_ELAPSED, query)
+
+    def end(self):
+        glEndQuery(GL_TIME_ELAPSED)
+
+    def read_oldest(self):
+        query, tag = self.pending.popleft()
+        elapsed = ctypes.c_uint64()
+        glGetQueryObjectui64v(query, GL_QUERY_RESULT, ctypes.byref(elapsed))
+        self.finished.append((tag, elapsed.value / 1e6))
+        self.free.append(query)
+
+    def collect(self):
+        # (tag, elapsed milliseconds) of every query finished since the last call, oldest first
+        while self.pending and glGetQueryObjectiv(self.pending[0][0], GL_QUERY_RESULT_AVAILABLE):
+            self.read_oldest()
+        results, self.finished = self.finished, []
+        return results
+
+    def cleanup(self):
+        glDeleteQueries(len(self.queries), self.queries)
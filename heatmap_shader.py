@@ -0,0 +1,24 @@
+HEATMAP_SHADER = """
+#version 330 core
+out vec4 FragColor;
+
+uniform sampler2D color;
+uniform isampler2D counters;
+uniform int channel;      // index into COUNTERS
+uniform float scale;      // counter value shown at the top of the ramp
+uniform float opacity;    // of the overlay
+uniform vec3 ramp[5];     // HEAT_COLORS in diagnostics.py
+
+vec3 heat(float x) {
+    float f = clamp(x, 0.0, 1.0) * 4.0;
+    int i = min(int(f), 3);
+    return mix(ramp[i], ramp[i + 1], f - float(i));
+}
+
+void main() {
+    ivec2 pixel = ivec2(gl_FragCoord.xy);
+    vec3 base = texelFetch(color, pixel, 0).rgb;
+    float value = float(texelFetch(counters, pixel, 0)[channel]);
+    FragColor = vec4(mix(base, heat(value / scale), opacity), 1.0);
+}
+"""
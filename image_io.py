@@ -0,0 +1,81 @@
+import os
+import struct
+import zlib
+import numpy as np
+
+
+def to_uint8(pixels):
+    if pixels.dtype == np.uint8:
+        return pixels
+    return (np.clip(pixels, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+
+
+def _png_chunk(tag, data):
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+
+def write_png(path, pixels, compression=6):
+    pixels = to_uint8(np.asarray(pixels))
+    height, width, channels = pixels.shape
+    color_type = {1: 0, 3: 2, 4: 6}[channels]
+    # every scanline is prefixed with filter type 0 (none)
+    raw = np.zeros((height, width * channels + 1), dtype=np.uint8)
+    raw[:, 1:] = pixels.reshape(height, -1)
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(_png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)))
+        f.write(_png_chunk(b"IDAT", zlib.compress(raw.tobytes(), compression)))
+        f.write(_png_chunk(b"IEND", b""))
+
+
+def _exr_attribute(name, kind, value):
+    return name.encode() + b"\0" + kind.encode() + b"\0" + struct.pack("<i", len(value)) + value
+
+
+def write_exr(path, pixels):
+    # uncompressed scanline OpenEXR with half float R, G, B channels
+    pixels = np.asarray(pixels)
+    if pixels.dtype == np.uint8:
+        pixels = pixels / np.float32(255.0)
+    height, width = pixels.shape[:2]
+    channels = b"".join(name + b"\0" + struct.pack("<iB3xii", 1, 0, 1, 1) for name in (b"B", b"G", b"R")) + b"\0"
+    window = struct.pack("<iiii", 0, 0, width - 1, height - 1)
+    header = b"".join([
+        struct.pack("<ii", 20000630, 2),
+        _exr_attribute("channels", "chlist", channels),
+        _exr_attribute("compression", "compression", b"\0"),
+        _exr_attribute("dataWindow", "box2i", window),
+        _exr_attribute("displayWindow", "box2i", window),
+        _exr_attribute("lineOrder", "lineOrder", b"\0"),
+        _exr_attribute("pixelAspectRatio", "float", struct.pack("<f", 1.0)),
+        _exr_attribute("screenWindowCenter", "v2f", struct.pack("<ff", 0.0, 0.0)),
+        _exr_attribute("screenWindowWidth", "float", struct.pack("<f", 1.0)),
+        b"\0",
+    ])
+
+    # one block per scanline: y, byte count, then the B, G and R rows
+    row_bytes = width * 3 * 2
+    block_size = 8 + row_bytes
+    first_block = len(header) + 8 * height
+    offsets = first_block + block_size * np.arange(height, dtype=np.uint64)
+    blocks = np.zeros((height, block_size), dtype=np.uint8)
+    blocks[:, :8] = np.stack([np.arange(height, dtype=np.int32),
+                              np.full(height, row_bytes, dtype=np.int32)], axis=1).astype("<i4").view(np.uint8)
+    rows = pixels[:, :, 2::-1].astype("<f2").transpose(0, 2, 1)
+    blocks[:, 8:] = np.ascontiguousarray(rows).view(np.uint8).reshape(height, row_bytes)
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(offsets.astype("<u8").tobytes())
+        f.write(blocks.tobytes())
+
+
+def save_image(path, pixels):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".png":
+        write_png(path, pixels)
+    elif ext == ".exr":
+        write_exr(path, pixels)
+    elif ext == ".npy":
+        np.save(path, pixels)
+    else:
+        raise Exception(f"Unsupported image format: {ext}")
@@ -1,6 +1,92 @@
 import numpy as np
+from fields import vector_field
+
+# Lights are points, except in path-traced mode where they are spheres of this
+# radius and cast soft shadows
+LIGHT_RADIUS = 0.5
 
 class Light:
+    # (position, color) rows, a view into the scene's LightArray once it is part of one
+    __slots__ = ("data",)
+
+    position = vector_field(0)
+    color = vector_field(1)
+
     def __init__(self, position, color):
-        self.position = np.array(position, dtype=np.float32)
-        self.color = np.array(color, dtype=np.float32)
+        self.data = np.array([position, color], dtype=np.float32)
+
+    @classmethod
+    def view(cls, data):
+        light = cls.__new__(cls)
+        light.data = data
+        return light
+
+    def __reduce__(self):
+        return Light, (self.position.copy(), self.color.copy())
+
+
+class LightArray:
+    # All lights in one contiguous (N, 2, 3) float32 buffer, the layout of the
+    # shader's light_data uniform. Indexing and iterating yields Light views.
+    __slots__ = ("data", "lights")
+
+    def __init__(self, lights=()):
+        lights = list(lights)
+        self.data = np.zeros((len(lights), 2, 3), dtype=np.float32)
+        for i, light in enumerate(lights):
+            self.data[i] = light.data
+            light.data = self.data[i]
+        self.lights = lights
+
+    @classmethod
+    def from_data(cls, data):
+        array = cls.__new__(cls)
+        array.data = np.array(data, dtype=np.float32).reshape(-1, 2, 3)
+        array.lights = [Light.view(row) for row in array.data]
+        return array
+
+    @property
+    def positions(self):
+        return self.data[:, 0]
+
+    @property
+    def colors(self):
+        return self.data[:, 1]
+
+    def __len__(self):
+        return len(self.lights)
+
+    def __getitem__(self, index):
+        return self.lights[index]
+
+    def __iter__(self):
+        return iter(self.lights)
+
+    def __reduce__(self):
+        return LightArray.from_data, (self.data,)
+
+
+def light_data(lights):
+    if isinstance(lights, LightArray):
+        return lights.data
+    if isinstance(lights, np.ndarray):
+        return lights.reshape(-1, 2, 3)
+    return np.array([light.data for light in lights], dtype=np.float32).reshape(-1, 2, 3)
+
+
+def merge_lights(lights):
+    # Lights at the same position light every point identically, so their colors can
+    # be summed into one light and one shadow ray. Black lights are dropped. Returns an
+    # (N, 2, 3) buffer, the input buffer itself when there is nothing to merge.
+    data = light_data(lights)
+    lit = data[:, 1].any(axis=1)
+    _, first, inverse = np.unique(data[:, 0], axis=0, return_index=True, return_inverse=True)
+    if lit.all() and len(first) == len(data):
+        return data
+
+    merged = np.zeros((len(first), 2, 3), dtype=np.float32)
+    merged[:, 0] = data[first, 0]
+    np.add.at(merged[:, 1], inverse.reshape(-1)[lit], data[lit, 1])
+    # keep the order in which the lights first appear
+    merged = merged[np.argsort(first)]
+    return merged[merged[:, 1].any(axis=1)]
@@ -0,0 +1,82 @@
+import numpy as np
+from light import light_data, merge_lights
+
+
+class LightingCache:
+    # Caches a CPU renderer's frame for the static lights. The image is linear in the
+    # light colors and, for a fixed camera and geometry, every path hits the same points
+    # each frame. So one render records the shaded points with their path weights,
+    # bakes the static lights into an image, and later frames only trace shadow rays
+    # for the lights that move.
+    # A light counts as dynamic once it changed between two frames. The cache is rebuilt
+    # when the camera, the geometry, the render settings or the set of static lights
+    # change.
+    def __init__(self, renderer):
+        self.renderer = renderer
+        self.key = None
+        self.previous = None
+        self.dynamic = None
+        self.rebuilds = 0
+
+    def state_key(self, camera, static):
+        r = self.renderer
+        return (camera.position.tobytes(), camera.direction.tobytes(), id(r.scene), r.scene.version,
+                r.width, r.height, r.max_bounces, r.shadows, r.refraction, static.tobytes())
+
+    def render(self, camera, lights=None):
+        r = self.renderer
+        data = light_data(r.scene.lights if lights is None else lights)
+        if self.previous is None or self.previous.shape != data.shape:
+            self.dynamic = np.zeros(len(data), dtype=bool)
+        else:
+            self.dynamic |= (data != self.previous).any(axis=(1, 2))
+        self.previous = data.copy()
+
+        r.ray_count = 0
+        try:
+            static = data[~self.dynamic]
+            key = self.state_key(camera, static)
+            if key != self.key:
+                self.rebuild(camera, static)
+                self.key = key
+
+            image = self.static_image.copy()
+            dynamic = merge_lights(data[self.dynamic])
+            if len(dynamic) and len(self.pixels):
+                r.light_positions, r.light_colors = dynamic[:, 0], dynamic[:, 1]
+                flat = image.reshape(-1, 3)
+                for start in range(0, len(self.pixels), r.chunk_size):
+                    end = start + r.chunk_size
+                    light = self.weights[start:end] * r.light_sum(self.positions[start:end], self.normals[start:end])
+                    # pixels are sorted, so a chunk only covers the range [lo, hi]
+                    pixels = self.pixels[start:end]
+                    lo, hi = pixels[0], pixels[-1] + 1
+                    for c in range(3):
+                        flat[lo:hi, c] += np.bincount(pixels - lo, light[:, c], minlength=hi - lo).astype(np.float32)
+        finally:
+            # rebuild() prepares the static lights and the loop above swaps in the
+            # dynamic ones; leave the renderer set up for all of this frame's lights,
+            # as render() would
+            lights = merge_lights(data)
+            r.light_positions, r.light_colors = lights[:, 0], lights[:, 1]
+        return image
+
+    def rebuild(self, camera, static):
+        r = self.renderer
+        r.prepare(static)
+        r.vertices = []
+        try:
+            self.static_image = r.render_tile(camera, 0, 0, r.width, r.height)
+            vertices = r.vertices
+        finally:
+            r.vertices = None
+        self.rebuilds += 1
+
+        if vertices:
+            pixels, weights, positions, normals = (np.concatenate(v) for v in zip(*vertices))
+        else:
+            pixels, weights, positions, normals = np.zeros(0, dtype=np.int64), *(np.zeros((0, 3), dtype=np.float32),) * 3
+        # grouped by pixel so the per-frame accumulation walks memory in order
+        order = np.argsort(pixels, kind='stable')
+        self.pixels, self.weights = pixels[order], weights[order]
+        self.positions, self.normals = positions[order], normals[order]
@@ -1,4 +1,170 @@
-from application import Application
+import time
+
+# time-to-first-frame is measured from here
+STARTED = time.perf_counter()
+
+import argparse
+import os
+import sys
+
+# Command line entry point. Only argparse is imported up front: GL, GLFW and the
+# renderers are imported by the command that needs them, so `render --backend cpu`
+# and `bench --backend cpu` never load OpenGL and `--help` returns immediately.
+#
+#   python main.py                      # same as `interactive`
+#   python main.py interactive --progressive
+#   python main.py render --scene scenes/demo.toml --output demo.png
+#   python main.py render --path orbit --frames 120 --output out/frame_{:04d}.png
+#   python main.py bench --backend gl cpu --resolution 320x200
+
+
+def parse_resolution(value):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def set_release_mode(debug):
+    # PyOpenGL calls glGetError after every GL call unless this is off. The flag is
+    # read when OpenGL is imported, so it has to be set before anything imports it.
+    # An explicit PYOPENGL_ERROR_CHECKING in the environment wins over release mode.
+    if debug:
+        os.environ["PYOPENGL_ERROR_CHECKING"] = "1"
+    else:
+        os.environ.setdefault("PYOPENGL_ERROR_CHECKING", "0")
+
+
+def interactive(args):
+    from application import Application
+    width, height = args.resolution
+    Application(width, height, progressive=args.progressive, dynamic_resolution=args.dynamic_resolution,
+                target_fps=args.target_fps, profile=args.profile, trace_path=args.trace, max_bounces=args.bounces,
+                temporal=args.temporal, vsync=not args.no_vsync, scene=args.scene, diagnostics=args.diagnostics,
+                path_samples=args.path_samples, started=STARTED)
+    return 0
+
+
+def render_frames(args, scene, path, dtype, startup):
+    # yields the frames in order, GL frames are read back while the next one is drawn
+    from scene import animate_lights
+    width, height = args.resolution
+    # only the built-in scene has an animated light
+    animate = None if args.scene else animate_lights
+    if args.backend == "cpu":
+        from cpu_renderer import CPURenderer
+        startup.mark("imports")
+        renderer = CPURenderer(scene, width, height, max_bounces=args.bounces)
+        for camera, frame_time in path:
+            if animate is not None:
+                animate(scene.lights, frame_time)
+            yield renderer.render(camera)
+        return
+
+    from offscreen import OffscreenRenderer
+    startup.mark("imports")
+    # the context comes first and starts the shader build, the shaders then compile
+    # while the scene's BVH is built
+    offscreen = OffscreenRenderer(width, height, scene, animate=animate, max_bounces=args.bounces)
+    startup.mark("renderer")
+    scene.bvh()
+    startup.mark("scene")
+    try:
+        cameras, times = zip(*path)
+        yield from offscreen.render_frames(cameras, times, dtype)
+    finally:
+        offscreen.cleanup()
+
+
+def render(args):
+    from camera_path import PATHS
+    from profiler import StartupTimer
+    from scene import create_default_scene
+    from scene_file import load_scene
+    from sequence import open_writer
+
+    startup = StartupTimer(STARTED)
+    camera = None
+    if args.scene:
+        scene, camera = load_scene(args.scene)
+    else:
+        scene = create_default_scene()
+    if args.path:
+        if args.path not in PATHS:
+            raise Exception(f"Unknown camera path {args.path}, choose from {', '.join(sorted(PATHS))}")
+        path = PATHS[args.path](args.frames, fps=args.fps)
+    else:
+        path = [(camera, 0.0)] if camera is not None else PATHS["static"](1)
+
+    width, height = args.resolution
+    writer = open_writer(args.output, width, height, args.fps, args.workers)
+    written = 0
+    try:
+        for pixels in render_frames(args, scene, path, writer.dtype, startup):
+            writer.write(written, pixels)
+            if written == 0:
+                startup.mark("first_frame")
+                print(startup.format_report())
+            written += 1
+    finally:
+        paths = writer.close()
+    if len(paths) > 1:
+        print(f"wrote {written} frames to {paths[0]} ... {paths[-1]}")
+    elif paths:
+        print(f"wrote {written} frame{'s' if written != 1 else ''} to {paths[0]}")
+    return 0
+
+
+def bench(args):
+    import benchmark
+    return benchmark.main(args.benchmark_args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ray tracer: interactive viewer, batch renders and benchmarks.")
+    parser.add_argument("--debug", action="store_true", help="keep PyOpenGL's error checking after every GL call")
+    commands = parser.add_subparsers(dest="command")
+
+    viewer = commands.add_parser("interactive", help="open the interactive viewer (the default)")
+    viewer.add_argument("--resolution", default=(1200, 800), type=parse_resolution)
+    viewer.add_argument("--bounces", default=6, type=int)
+    viewer.add_argument("--scene", help="JSON or TOML scene file, reloaded when it changes")
+    viewer.add_argument("--progressive", action="store_true")
+    viewer.add_argument("--dynamic-resolution", action="store_true")
+    viewer.add_argument("--target-fps", default=60.0, type=float)
+    viewer.add_argument("--temporal", choices=("checkerboard", "interleaved"))
+    viewer.add_argument("--diagnostics", action="store_true")
+    viewer.add_argument("--path-samples", type=int, help="path-traced samples per frame")
+    viewer.add_argument("--no-vsync", action="store_true")
+    viewer.add_argument("--profile", action="store_true")
+    viewer.add_argument("--trace", help="write the frame profile to this file on exit")
+    viewer.set_defaults(run=interactive)
+
+    batch = commands.add_parser("render", help="render a still or a camera path without a window")
+    batch.add_argument("--backend", default="gl", choices=("gl", "cpu"))
+    batch.add_argument("--resolution", default=(1200, 800), type=parse_resolution)
+    batch.add_argument("--bounces", default=6, type=int)
+    batch.add_argument("--scene", help="JSON or TOML scene file; its camera is used for stills")
+    batch.add_argument("--path", help="camera path (see camera_path.py) instead of a still")
+    batch.add_argument("--frames", default=120, type=int)
+    batch.add_argument("--fps", default=30.0, type=float)
+    batch.add_argument("--output", default="render.png",
+                       help="image file, file pattern like frames/frame_{:04d}.png or a video file")
+    batch.add_argument("--workers", default=4, type=int, help="encoder threads")
+    batch.set_defaults(run=render)
+
+    # everything after `bench`, including --help, goes to benchmark.py
+    benchmarks = commands.add_parser("bench", help="run benchmark.py with the remaining arguments", add_help=False)
+    benchmarks.set_defaults(run=bench)
+
+    args, rest = parser.parse_known_args(argv)
+    if args.command == "bench":
+        args.benchmark_args = rest
+    elif rest:
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+    set_release_mode(args.debug)
+    if args.command is None:
+        args = viewer.parse_args([], namespace=args)
+    return args.run(args)
+
 
 if __name__ == '__main__':
-    Application()
\ No newline at end of file
+    sys.exit(main())
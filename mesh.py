@@ -0,0 +1,213 @@
+import hashlib
+import os
+import numpy as np
+from fields import vector_field, scalar_field
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "simple_raytracer", "meshes")
+
+
+class Mesh:
+    # Triangle mesh with a single material. `vertices` is (V, 3) float32 and `indices`
+    # (T, 3) int32, both may be memory-mapped from the mesh cache. `data` holds the
+    # material in the sphere texel layout, the first texel is unused:
+    # (-), (color, reflectivity), (absorption, transparency), (ior, 0, 0, 0)
+    __slots__ = ("data", "vertices", "indices")
+
+    color = vector_field(1)
+    reflectivity = scalar_field(1, 3)
+    absorption = vector_field(2)
+    transparency = scalar_field(2, 3)
+    ior = scalar_field(3, 0)
+
+    def __init__(self, vertices, indices, color, reflectivity=0.0, transparency=0.0, ior=1.0, absorption=[0.0, 0.0, 0.0]):
+        self.data = np.zeros((4, 4), dtype=np.float32)
+        self.vertices = np.asarray(vertices, dtype=np.float32).reshape(-1, 3)
+        self.indices = np.asarray(indices, dtype=np.int32).reshape(-1, 3)
+        if len(self.indices) and (self.indices.min() < 0 or self.indices.max() >= len(self.vertices)):
+            raise Exception("Mesh indices out of range")
+        self.color = color
+        self.reflectivity = reflectivity
+        self.transparency = transparency
+        self.ior = ior
+        self.absorption = absorption
+
+    @classmethod
+    def load(cls, path, position=(0.0, 0.0, 0.0), scale=1.0, cache_dir=DEFAULT_CACHE_DIR, **material):
+        vertices, indices = load_mesh(path, cache_dir)
+        if scale != 1.0 or any(position):
+            vertices = vertices * np.float32(scale) + np.asarray(position, dtype=np.float32)
+        return cls(vertices, indices, **material)
+
+
+def triangulate(faces):
+    # fan triangulation of polygons given as index lists
+    triangles = []
+    for face in faces:
+        for k in range(1, len(face) - 1):
+            triangles.append((face[0], face[k], face[k + 1]))
+    return triangles
+
+
+def load_obj(path):
+    # positions and faces only, normals and texture coordinates are ignored
+    vertices = []
+    faces = []
+    with open(path, "r") as f:
+        for line in f:
+            if line.startswith("v "):
+                vertices.append(line.split()[1:4])
+            elif line.startswith("f "):
+                face = []
+                for item in line.split()[1:]:
+                    index = int(item.split("/", 1)[0])
+                    # 1-based, negative values count back from the last vertex so far
+                    face.append(index - 1 if index > 0 else len(vertices) + index)
+                faces.append(face)
+    return np.array(vertices, dtype=np.float32).reshape(-1, 3), np.array(triangulate(faces), dtype=np.int32).reshape(-1, 3)
+
+
+PLY_TYPES = {
+    "char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2", "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4", "double": "f8", "float64": "f8",
+}
+
+
+def _read_ply_header(f):
+    if f.readline().strip() != b"ply":
+        raise Exception("Not a PLY file")
+    fmt = None
+    elements = []  # (name, count, [(property name, type, list count type or None)])
+    while True:
+        line = f.readline()
+        if not line:
+            raise Exception("Unexpected end of PLY header")
+        words = line.decode("ascii").split()
+        if not words or words[0] in ("comment", "obj_info"):
+            continue
+        if words[0] == "end_header":
+            break
+        if words[0] == "format":
+            fmt = words[1]
+        elif words[0] == "element":
+            elements.append((words[1], int(words[2]), []))
+        elif words[0] == "property":
+            if words[1] == "list":
+                elements[-1][2].append((words[4], PLY_TYPES[words[3]], PLY_TYPES[words[2]]))
+            else:
+                elements[-1][2].append((words[2], PLY_TYPES[words[1]], None))
+    if fmt not in ("ascii", "binary_little_endian", "binary_big_endian"):
+        raise Exception(f"Unsupported PLY format {fmt}")
+    return fmt, elements
+
+
+def _read_ply_ascii(f, count, properties):
+    rows = []
+    for _ in range(count):
+        values = f.readline().split()
+        row = []
+        for _, _, list_type in properties:
+            if list_type:
+                n = int(values[0])
+                row.append([int(v) for v in values[1:1 + n]])
+                values = values[1 + n:]
+            else:
+                row.append(float(values[0]))
+                values = values[1:]
+        rows.append(row)
+    return rows
+
+
+def _read_ply_binary(f, count, properties, order):
+    if not any(list_type for _, _, list_type in properties):
+        dtype = np.dtype([(name, order + t) for name, t, _ in properties])
+        return np.frombuffer(f.read(dtype.itemsize * count), dtype=dtype, count=count)
+
+    if len(properties) == 1:
+        # a face element with only the index list, almost always all triangles:
+        # try reading it as fixed-size records first
+        _, index_type, count_type = properties[0]
+        dtype = np.dtype([("n", order + count_type), ("i", order + index_type, 3)])
+        start = f.tell()
+        records = np.frombuffer(f.read(dtype.itemsize * count), dtype=dtype)
+        if len(records) == count and (records["n"] == 3).all():
+            return records
+        f.seek(start)
+
+    rows = []
+    for _ in range(count):
+        row = []
+        for _, t, list_type in properties:
+            if list_type:
+                n = int(np.frombuffer(f.read(np.dtype(list_type).itemsize), dtype=order + list_type)[0])
+                row.append(np.frombuffer(f.read(np.dtype(t).itemsize * n), dtype=order + t).tolist())
+            else:
+                row.append(float(np.frombuffer(f.read(np.dtype(t).itemsize), dtype=order + t)[0]))
+        rows.append(row)
+    return rows
+
+
+def load_ply(path):
+    vertices = None
+    triangles = None
+    with open(path, "rb") as f:
+        fmt, elements = _read_ply_header(f)
+        order = "<" if fmt == "binary_little_endian" else ">"
+        for name, count, properties in elements:
+            if fmt == "ascii":
+                data = _read_ply_ascii(f, count, properties)
+            else:
+                data = _read_ply_binary(f, count, properties, order)
+            names = [p[0] for p in properties]
+
+            if name == "vertex":
+                if isinstance(data, np.ndarray):
+                    vertices = np.stack([data["x"], data["y"], data["z"]], axis=-1)
+                else:
+                    columns = [names.index(axis) for axis in ("x", "y", "z")]
+                    vertices = np.array([[row[c] for c in columns] for row in data]).reshape(-1, 3)
+            elif name == "face":
+                if isinstance(data, np.ndarray) and "i" in data.dtype.names:
+                    triangles = data["i"]
+                else:
+                    column = [i for i, p in enumerate(properties) if p[2]][0]
+                    triangles = np.array(triangulate(row[column] for row in data)).reshape(-1, 3)
+    if vertices is None or triangles is None:
+        raise Exception(f"{path} has no vertex or face element")
+    return vertices.astype(np.float32), triangles.astype(np.int32)
+
+
+LOADERS = {".obj": load_obj, ".ply": load_ply}
+
+
+def load_mesh(path, cache_dir=DEFAULT_CACHE_DIR):
+    # Parsing text meshes is slow, so the parsed arrays are kept as .npy files keyed
+    # by the file's path, size and modification time. Later loads memory-map them.
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in LOADERS:
+        raise Exception(f"Unsupported mesh format {extension}")
+
+    if cache_dir:
+        stat = os.stat(path)
+        key = hashlib.sha256(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode()).hexdigest()
+        vertices_path = os.path.join(cache_dir, key + ".vertices.npy")
+        indices_path = os.path.join(cache_dir, key + ".indices.npy")
+        if os.path.exists(vertices_path) and os.path.exists(indices_path):
+            return np.load(vertices_path, mmap_mode="r"), np.load(indices_path, mmap_mode="r")
+
+    vertices, indices = LOADERS[extension](path)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        # the vertices go last, a complete pair is only found once both are written
+        for target, array in ((indices_path, indices), (vertices_path, vertices)):
+            save_atomic(target, array)
+    return vertices, indices
+
+
+def save_atomic(path, array):
+    # written under a temporary name and renamed so readers never see a partial file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
@@ -0,0 +1,155 @@
+import os
+
+# Without a display PyOpenGL has to be pointed at EGL before OpenGL is imported anywhere
+if not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")):
+    os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+
+import ctypes
+import numpy as np
+from OpenGL.GL import *
+from gl_renderer import GLRenderer
+from render_target import RenderTarget
+from scene import create_default_scene, animate_lights
+from image_io import save_image
+from readback import PixelReader
+
+EGL_PLATFORM_SURFACELESS_MESA = 0x31DD
+
+
+def initialize_egl_display(EGL, get_display):
+    # with PyOpenGL error checking on failures raise, with it off they return false
+    try:
+        display = get_display()
+        if display and EGL.eglInitialize(display, None, None):
+            return display
+    except EGL.EGLError:
+        pass
+    return None
+
+
+def create_egl_context():
+    from OpenGL.raw.EGL import _errors
+    if not hasattr(_errors, "_error_checker"):
+        # PyOpenGL 3.1.7 leaves this undefined when OpenGL.ERROR_CHECKING is off,
+        # which breaks importing OpenGL.EGL
+        _errors._error_checker = None
+    from OpenGL import EGL
+
+    display = initialize_egl_display(
+        EGL, lambda: EGL.eglGetPlatformDisplay(EGL_PLATFORM_SURFACELESS_MESA, EGL.EGL_DEFAULT_DISPLAY, None))
+    if display is None:
+        display = initialize_egl_display(EGL, lambda: EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY))
+    if display is None:
+        raise Exception("EGL initialization failed")
+
+    config_attribs = (EGL.EGLint * 5)(
+        EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+        EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+        EGL.EGL_NONE,
+    )
+    config = EGL.EGLConfig()
+    num_configs = EGL.EGLint()
+    if not EGL.eglChooseConfig(display, config_attribs, ctypes.pointer(config), 1, ctypes.pointer(num_configs)) or num_configs.value == 0:
+        raise Exception("No suitable EGL config found")
+
+    EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+    context_attribs = (EGL.EGLint * 7)(
+        EGL.EGL_CONTEXT_MAJOR_VERSION, 3,
+        EGL.EGL_CONTEXT_MINOR_VERSION, 3,
+        EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK, EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT,
+        EGL.EGL_NONE,
+    )
+    context = EGL.eglCreateContext(display, config, EGL.EGL_NO_CONTEXT, context_attribs)
+    if not context:
+        raise Exception("Failed to create EGL context")
+    EGL.eglMakeCurrent(display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, context)
+    return display, context
+
+
+def create_hidden_window(width, height):
+    import glfw
+
+    if not glfw.init():
+        raise Exception("GLFW initialization failed")
+
+    glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, 3)
+    glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, 3)
+    glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
+    glfw.window_hint(glfw.OPENGL_FORWARD_COMPAT, GL_TRUE)
+    glfw.window_hint(glfw.VISIBLE, glfw.FALSE)
+
+    window = glfw.create_window(width, height, "", None, None)
+    if not window:
+        glfw.terminate()
+        raise Exception("Failed to create GLFW window")
+    glfw.make_context_current(window)
+    return window
+
+
+class OffscreenRenderer:
+    def __init__(self, width=1200, height=800, scene=None, backend=None, animate=animate_lights, max_bounces=6):
+        self.width = width
+        self.height = height
+        self.backend = backend or ("egl" if os.environ.get("PYOPENGL_PLATFORM") == "egl" else "glfw")
+
+        self.init_context()
+        self.renderer = GLRenderer(max_bounces=max_bounces)
+        self.target = RenderTarget(width, height)
+        self.scene = scene or create_default_scene()
+        # the scene's program compiles while the caller sets up the rest
+        self.renderer.request_variants(self.scene)
+        # moves the lights to the time of each frame, None keeps them where they are
+        self.animate = animate
+        self.reader = PixelReader()
+
+    def init_context(self):
+        if self.backend == "egl":
+            self.display, self.context = create_egl_context()
+        elif self.backend == "glfw":
+            self.window = create_hidden_window(self.width, self.height)
+        else:
+            raise Exception(f"Unknown offscreen backend: {self.backend}")
+
+    def resize(self, width, height):
+        self.width = width
+        self.height = height
+        self.target.resize(width, height)
+
+    def render_frames(self, cameras, times, dtype=np.uint8):
+        # frame i is read back while frame i + 1 is drawn, see PixelReader
+        self.reader.start(self.width, self.height, dtype)
+        for camera, time in zip(cameras, times):
+            if self.animate is not None:
+                self.animate(self.scene.lights, time)
+            self.target.bind()
+            self.renderer.draw(camera, self.scene, time, self.width, self.height)
+            pixels = self.reader.read()
+            if pixels is not None:
+                yield pixels
+
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        pixels = self.reader.flush()
+        if pixels is not None:
+            yield pixels
+
+    def render_to_files(self, cameras, times, pattern="frame_{:04d}.png"):
+        dtype = np.float32 if pattern.endswith(".npy") else np.uint8
+        paths = []
+        for i, pixels in enumerate(self.render_frames(cameras, times, dtype)):
+            path = pattern.format(i)
+            save_image(path, pixels)
+            paths.append(path)
+        return paths
+
+    def cleanup(self):
+        self.reader.cleanup()
+        self.target.cleanup()
+        self.renderer.cleanup()
+        if self.backend == "egl":
+            from OpenGL import EGL
+            EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+            EGL.eglDestroyContext(self.display, self.context)
+        else:
+            import glfw
+            glfw.destroy_window(self.window)
+            glfw.terminate()
@@ -0,0 +1,110 @@
+from OpenGL.GL import *
+from OpenGL.GL.shaders import compileProgram, compileShader
+from cpu_renderer import PATH_SAMPLES
+from denoise import ATROUS_ITERATIONS, NORMAL_POWER, PLANE_SIGMA, color_sigma
+from denoise_shader import ATROUS_SHADER
+from gbuffer import GBuffer, GBUFFER_TEXTURES
+from progressive import ProgressiveRenderer
+from render_target import RenderTarget
+from vertex_shader import VERTEX_SHADER
+
+
+class PathTracer(ProgressiveRenderer):
+    # Monte Carlo render path. Every frame adds `samples` path-traced samples (see
+    # PATH_TRACE in fragment_shader.py) to the float average of ProgressiveRenderer,
+    # so a still view keeps converging up to max_samples, and runs the a-trous filter
+    # of denoise.py over the average. The filter is guided by a G-buffer of the pixel
+    # centres and gets weaker as samples add up.
+    def __init__(self, renderer, width, height, samples=PATH_SAMPLES, max_samples=1024, denoise=True,
+                 iterations=ATROUS_ITERATIONS):
+        super().__init__(renderer, width, height, max_samples)
+        self.samples = samples
+        self.denoise = denoise
+        self.iterations = iterations
+        self.gbuffer = GBuffer(width, height)
+        self.filtered = [RenderTarget(width, height), RenderTarget(width, height)]
+        self.init_denoise_shader()
+        # sample count of the last filtered image, and that image
+        self.filtered_count = 0
+        self.output = None
+
+    def init_denoise_shader(self):
+        self.denoise_shader = compileProgram(
+            compileShader(VERTEX_SHADER, GL_VERTEX_SHADER),
+            compileShader(ATROUS_SHADER, GL_FRAGMENT_SHADER)
+        )
+        glUseProgram(self.denoise_shader)
+        glUniform1i(glGetUniformLocation(self.denoise_shader, "color"), 0)
+        for name, unit in GBUFFER_TEXTURES.items():
+            glUniform1i(glGetUniformLocation(self.denoise_shader, name), unit)
+        glUniform1f(glGetUniformLocation(self.denoise_shader, "normal_power"), NORMAL_POWER)
+        glUniform1f(glGetUniformLocation(self.denoise_shader, "plane_sigma"), PLANE_SIGMA)
+        self.step_loc = glGetUniformLocation(self.denoise_shader, "step")
+        self.color_sigma_loc = glGetUniformLocation(self.denoise_shader, "color_sigma")
+
+    def resize(self, width, height):
+        self.gbuffer.resize(width, height)
+        for target in self.filtered:
+            target.resize(width, height)
+        super().resize(width, height)
+
+    def reset(self):
+        super().reset()
+        self.filtered_count = 0
+
+    def draw_sample(self, camera, scene, time, jitter):
+        self.renderer.draw(camera, scene, time, self.width, self.height, jitter, sample=self.sample_count)
+
+    def draw(self, camera, scene, time):
+        state = self.state_key(camera, scene)
+        if state != self.state:
+            self.state = state
+            self.reset()
+        if self.sample_count == 0 and self.denoise:
+            self.renderer.draw_gbuffer(camera, scene, time, self.gbuffer)
+        for _ in range(self.samples):
+            if self.converged:
+                break
+            self.add_sample(camera, scene, time)
+
+        if not self.denoise:
+            self.output = self.result
+        elif self.filtered_count != self.sample_count:
+            self.filter()
+            self.filtered_count = self.sample_count
+        return self.output
+
+    def filter(self):
+        glUseProgram(self.denoise_shader)
+        glActiveTexture(GL_TEXTURE0 + GBUFFER_TEXTURES["gbuffer_position"])
+        glBindTexture(GL_TEXTURE_2D, self.gbuffer.position)
+        glActiveTexture(GL_TEXTURE0 + GBUFFER_TEXTURES["gbuffer_normal"])
+        glBindTexture(GL_TEXTURE_2D, self.gbuffer.normal)
+        glBindVertexArray(self.renderer.vao)
+        source = self.result
+        sigma = color_sigma(self.sample_count)
+        for iteration in range(self.iterations):
+            target = self.filtered[iteration % 2]
+            target.bind()
+            glUniform1i(self.step_loc, 1 << iteration)
+            glUniform1f(self.color_sigma_loc, sigma)
+            glActiveTexture(GL_TEXTURE0)
+            glBindTexture(GL_TEXTURE_2D, source.texture)
+            glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+            source = target
+            sigma *= 0.5
+        glBindVertexArray(0)
+        self.output = source
+
+    def present(self, width, height):
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.output.fbo)
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, 0)
+        glBlitFramebuffer(0, 0, self.width, self.height, 0, 0, width, height, GL_COLOR_BUFFER_BIT, GL_LINEAR)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+    def cleanup(self):
+        super().cleanup()
+        self.gbuffer.cleanup()
+        for target in self.filtered:
+            target.cleanup()
+        glDeleteProgram(self.denoise_shader)
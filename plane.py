@@ -0,0 +1,26 @@
+import numpy as np
+from fields import vector_field, scalar_field
+
+class Plane:
+    # same material layout as a sphere so the plane is the last row of the scene's
+    # material buffer: (point, 0), (color, reflectivity), (0, 0, 0, 0), (ior = 1, normal)
+    __slots__ = ("data",)
+
+    point = vector_field(0)
+    color = vector_field(1)
+    reflectivity = scalar_field(1, 3)
+    normal = vector_field(3, start=1)
+
+    def __init__(self, point, normal, color, reflectivity=0.0):
+        self.data = np.zeros((4, 4), dtype=np.float32)
+        self.data[3, 0] = 1.0
+        self.point = point
+        self.normal = np.asarray(normal, dtype=np.float32) / np.linalg.norm(normal)
+        self.color = color
+        self.reflectivity = reflectivity
+
+    @classmethod
+    def view(cls, data):
+        plane = cls.__new__(cls)
+        plane.data = data
+        return plane
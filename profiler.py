@@ -0,0 +1,118 @@
+import csv
+import json
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+import numpy as np
+
+PERCENTILES = (50, 95, 99)
+
+
+class NullProfiler:
+    def begin_frame(self):
+        pass
+
+    def end_frame(self):
+        pass
+
+    def section(self, name):
+        return nullcontext()
+
+    def current_frame(self):
+        return None
+
+
+class StartupTimer:
+    # Wall-clock phases from `start` (the top of main.py when run from there) to the
+    # first frame
+    def __init__(self, start=None):
+        self.start = time.perf_counter() if start is None else start
+        self.last = self.start
+        self.phases = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, (now - self.last) * 1000.0))
+        self.last = now
+
+    def total_ms(self):
+        return (self.last - self.start) * 1000.0
+
+    def format_report(self):
+        phases = ", ".join(f"{name} {ms:.0f}" for name, ms in self.phases)
+        return f"First frame after {self.total_ms():.0f} ms ({phases})"
+
+
+class FrameProfiler:
+    # Per-frame CPU section timings plus GPU draw time reported by the renderer's timer
+    # queries (see record_gpu). Percentiles are computed over the last `window` frames,
+    # the full trace is kept for dump().
+    def __init__(self, window=300):
+        self.window = window
+        self.frames = []
+        self.current = None
+        self.history = defaultdict(lambda: deque(maxlen=window))
+
+    def begin_frame(self):
+        self.current = {"frame": len(self.frames), "start": time.perf_counter()}
+
+    def end_frame(self):
+        record = self.current
+        record["frame_ms"] = (time.perf_counter() - record.pop("start")) * 1000.0
+        for name, value in record.items():
+            if name != "frame":
+                self.history[name].append(value)
+        self.frames.append(record)
+        self.current = None
+
+    def current_frame(self):
+        return self.current
+
+    def record_gpu(self, frame, elapsed):
+        # GPU results arrive a few frames late and are credited to the frame that issued them
+        if frame is not None:
+            frame["gpu_ms"] = frame.get("gpu_ms", 0.0) + elapsed
+        self.history["gpu_ms"].append(elapsed)
+
+    @contextmanager
+    def section(self, name):
+        if self.current is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000.0
+            self.current[name] = self.current.get(name, 0.0) + elapsed
+
+    def report(self):
+        summary = {}
+        for name, values in self.history.items():
+            values = np.array(values)
+            stats = {f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES}
+            stats["mean"] = float(values.mean())
+            stats["count"] = len(values)
+            summary[name] = stats
+        return summary
+
+    def format_report(self):
+        lines = [f"{'section':<16}" + "".join(f"{'p' + str(p):>10}" for p in PERCENTILES) + f"{'mean':>10}   (ms, last {self.window} frames)"]
+        for name, stats in sorted(self.report().items()):
+            lines.append(f"{name:<16}" + "".join(f"{stats['p' + str(p)]:>10.3f}" for p in PERCENTILES) + f"{stats['mean']:>10.3f}")
+        return "\n".join(lines)
+
+    def dump(self, path):
+        ext = os.path.splitext(path)[1].lower()
+        if ext == ".json":
+            with open(path, "w") as f:
+                json.dump({"summary": self.report(), "frames": self.frames}, f, indent=2)
+        elif ext == ".csv":
+            columns = ["frame"] + sorted({name for frame in self.frames for name in frame} - {"frame"})
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=columns)
+                writer.writeheader()
+                writer.writerows(self.frames)
+        else:
+            raise Exception(f"Unsupported trace format: {ext}")
@@ -0,0 +1,116 @@
+from OpenGL.GL import *
+from OpenGL.GL.shaders import compileProgram, compileShader
+from accumulate_shader import ACCUMULATE_SHADER
+from vertex_shader import VERTEX_SHADER
+from render_target import RenderTarget
+
+
+def halton(index, base):
+    result = 0.0
+    f = 1.0
+    while index > 0:
+        f /= base
+        result += f * (index % base)
+        index //= base
+    return result
+
+
+class ProgressiveRenderer:
+    # Accumulates jittered samples into ping-pong float targets while the camera,
+    # lights and scene stay put. Any change restarts the average from one sample.
+    def __init__(self, renderer, width, height, max_samples=256):
+        self.renderer = renderer
+        self.width = width
+        self.height = height
+        self.max_samples = max_samples
+
+        self.sample_target = RenderTarget(width, height)
+        self.accumulation = [RenderTarget(width, height), RenderTarget(width, height)]
+        self.init_shader()
+
+        self.sample_count = 0
+        self.state = None
+
+    def init_shader(self):
+        self.shader = compileProgram(
+            compileShader(VERTEX_SHADER, GL_VERTEX_SHADER),
+            compileShader(ACCUMULATE_SHADER, GL_FRAGMENT_SHADER)
+        )
+        glUseProgram(self.shader)
+        glUniform1i(glGetUniformLocation(self.shader, "sample_color"), 0)
+        glUniform1i(glGetUniformLocation(self.shader, "history"), 1)
+        self.weight_loc = glGetUniformLocation(self.shader, "weight")
+
+    def resize(self, width, height):
+        self.width = width
+        self.height = height
+        self.sample_target.resize(width, height)
+        for target in self.accumulation:
+            target.resize(width, height)
+        self.reset()
+
+    def reset(self):
+        self.sample_count = 0
+
+    def state_key(self, camera, scene):
+        return (camera.position.tobytes(), camera.direction.tobytes(), scene.lights.data.tobytes(), id(scene), scene.version)
+
+    @property
+    def result(self):
+        return self.accumulation[(self.sample_count - 1) % 2]
+
+    @property
+    def converged(self):
+        return self.sample_count >= self.max_samples
+
+    def draw(self, camera, scene, time):
+        state = self.state_key(camera, scene)
+        if state != self.state:
+            self.state = state
+            self.reset()
+        if self.converged:
+            return self.result
+
+        return self.add_sample(camera, scene, time)
+
+    def draw_sample(self, camera, scene, time, jitter):
+        self.renderer.draw(camera, scene, time, self.width, self.height, jitter)
+
+    def add_sample(self, camera, scene, time):
+        # the first sample goes through the pixel centre so a reset frame matches a plain render
+        if self.sample_count == 0:
+            jitter = (0.0, 0.0)
+        else:
+            jitter = (halton(self.sample_count, 2) - 0.5, halton(self.sample_count, 3) - 0.5)
+        self.sample_target.bind()
+        self.draw_sample(camera, scene, time, jitter)
+
+        # the first sample mixes with itself: the other target was never written and
+        # garbage like NaN would survive a weight of 0
+        history = self.sample_target if self.sample_count == 0 else self.accumulation[(self.sample_count - 1) % 2]
+        target = self.accumulation[self.sample_count % 2]
+        target.bind()
+        glUseProgram(self.shader)
+        glUniform1f(self.weight_loc, 1.0 / (self.sample_count + 1))
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D, self.sample_target.texture)
+        glActiveTexture(GL_TEXTURE1)
+        glBindTexture(GL_TEXTURE_2D, history.texture)
+        glBindVertexArray(self.renderer.vao)
+        glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+        glBindVertexArray(0)
+
+        self.sample_count += 1
+        return target
+
+    def present(self, width, height):
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.result.fbo)
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, 0)
+        glBlitFramebuffer(0, 0, self.width, self.height, 0, 0, width, height, GL_COLOR_BUFFER_BIT, GL_LINEAR)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+    def cleanup(self):
+        self.sample_target.cleanup()
+        for target in self.accumulation:
+            target.cleanup()
+        glDeleteProgram(self.shader)
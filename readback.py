@@ -0,0 +1,59 @@
+import ctypes
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.raw.GL.VERSION.GL_1_0 import glReadPixels as glReadPixelsRaw
+
+
+class PixelReader:
+    # Asynchronous readback through two pixel pack buffers: read() starts copying the
+    # bound framebuffer into one buffer and maps the other, which holds the previous
+    # frame. The copy runs on the GPU while the next frame is drawn; only the final
+    # memcpy out of the mapped buffer happens on the render thread.
+    def __init__(self):
+        self.pixel_buffers = glGenBuffers(2)
+        self.size = 0
+        self.count = 0
+        self.pending = None
+
+    def start(self, width, height, dtype=np.uint8):
+        size = width * height * 4 * np.dtype(dtype).itemsize
+        if size != self.size:
+            for pbo in self.pixel_buffers:
+                glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+                glBufferData(GL_PIXEL_PACK_BUFFER, size, None, GL_STREAM_READ)
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+            self.size = size
+        self.shape = (height, width)
+        self.dtype = dtype
+        self.pending = None
+
+    def read(self):
+        # queues the current frame and returns the previous one (None on the first call)
+        height, width = self.shape
+        gl_type = GL_UNSIGNED_BYTE if self.dtype == np.uint8 else GL_FLOAT
+        pbo = self.pixel_buffers[self.count % 2]
+        self.count += 1
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        glReadPixelsRaw(0, 0, width, height, GL_RGBA, gl_type, ctypes.c_void_p(0))
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+
+        previous, self.pending = self.pending, pbo
+        return self.map(previous) if previous is not None else None
+
+    def flush(self):
+        # the last queued frame, if any
+        previous, self.pending = self.pending, None
+        return self.map(previous) if previous is not None else None
+
+    def map(self, pbo):
+        height, width = self.shape
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        ptr = glMapBufferRange(GL_PIXEL_PACK_BUFFER, 0, self.size, GL_MAP_READ_BIT)
+        data = ctypes.cast(ptr, ctypes.POINTER(ctypes.c_ubyte * self.size)).contents
+        pixels = np.frombuffer(data, dtype=self.dtype).reshape(height, width, 4)[::-1, :, :3].copy()
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        return pixels
+
+    def cleanup(self):
+        glDeleteBuffers(2, self.pixel_buffers)
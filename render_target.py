@@ -0,0 +1,45 @@
+from OpenGL.GL import *
+
+# pixel transfer type of the integer formats, they take GL_RGBA_INTEGER data
+INTEGER_FORMATS = {GL_RGBA32I: GL_INT, GL_RGBA32UI: GL_UNSIGNED_INT}
+
+class RenderTarget:
+    def __init__(self, width, height, internal_format=GL_RGBA32F, filtering=GL_NEAREST):
+        self.width = width
+        self.height = height
+        self.internal_format = internal_format
+        self.filtering = filtering
+
+        self.texture = glGenTextures(1)
+        self.fbo = glGenFramebuffers(1)
+        self.resize(width, height)
+
+    def resize(self, width, height):
+        self.width = width
+        self.height = height
+
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        if self.internal_format in INTEGER_FORMATS:
+            pixel_format, pixel_type = GL_RGBA_INTEGER, INTEGER_FORMATS[self.internal_format]
+        else:
+            pixel_format, pixel_type = GL_RGBA, GL_FLOAT
+        glTexImage2D(GL_TEXTURE_2D, 0, self.internal_format, width, height, 0, pixel_format, pixel_type, None)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, self.filtering)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, self.filtering)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.texture, 0)
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+            raise Exception("Framebuffer is incomplete")
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+    def bind(self):
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glViewport(0, 0, self.width, self.height)
+
+    def cleanup(self):
+        glDeleteFramebuffers(1, [self.fbo])
+        glDeleteTextures(1, [self.texture])
@@ -0,0 +1,99 @@
+REPROJECT_SHADER = """
+#version 330 core
+out vec4 FragColor;
+
+uniform sampler2D sample_color; // sparse trace: color, hit distance per traced pixel
+uniform sampler2D history;      // previous output: color, hit distance
+uniform int history_valid;
+uniform vec2 resolution;
+uniform vec3 camera_pos;
+uniform vec3 camera_dir;
+uniform vec3 previous_camera_pos;
+uniform vec3 previous_camera_dir;
+uniform ivec2 trace_stride;
+uniform ivec2 trace_offset;
+uniform int trace_row_shift;
+uniform float depth_tolerance; // relative
+
+float focal = tan(radians(45.0) / 2.0);
+
+// same pattern as pixelCoord() in the ray tracing shader
+bool traced(ivec2 p) {
+    int row = p.y / trace_stride.y;
+    return p.y % trace_stride.y == trace_offset.y
+        && p.x % trace_stride.x == (trace_offset.x + trace_row_shift * row) % trace_stride.x;
+}
+
+vec4 tracedSample(ivec2 p) {
+    return texelFetch(sample_color, p / trace_stride, 0);
+}
+
+vec3 rayDirection(vec3 dir, vec2 pixel) {
+    vec2 uv = (pixel / resolution) * 2.0 - 1.0;
+    uv.x *= resolution.x / resolution.y;
+    return normalize(dir + vec3(uv * focal, 0.0));
+}
+
+// Inverse of rayDirection() for the previous camera. The ray direction is
+// dir + (u, v, 0) scaled by some k > 0, the z component fixes k.
+bool projectPrevious(vec3 point, out vec2 pixel) {
+    vec3 d = point - previous_camera_pos;
+    float k = previous_camera_dir.z / d.z;
+    if (!(k > 0.0)) {
+        return false;
+    }
+    vec2 uv = (k * d.xy - previous_camera_dir.xy) / focal;
+    uv.x /= resolution.x / resolution.y;
+    pixel = (uv + 1.0) * 0.5 * resolution;
+    return all(greaterThanEqual(pixel, vec2(0.0))) && all(lessThan(pixel, resolution));
+}
+
+void main() {
+    ivec2 p = ivec2(gl_FragCoord.xy);
+    if (traced(p)) {
+        FragColor = tracedSample(p);
+        return;
+    }
+
+    // Pixels traced this frame around p: their average is the fallback, their range
+    // clamps the history and the nearest one gives the depth used for reprojection.
+    // Their depth range also bounds where the surface seen by the history may be.
+    vec3 lo = vec3(1e30);
+    vec3 hi = vec3(-1e30);
+    vec3 sum = vec3(0.0);
+    float count = 0.0;
+    float depth = 1e30;
+    float far = 0.0;
+    for (int dy = -1; dy <= 1; dy++) {
+        for (int dx = -1; dx <= 1; dx++) {
+            ivec2 q = p + ivec2(dx, dy);
+            if (any(lessThan(q, ivec2(0))) || any(greaterThanEqual(q, ivec2(resolution))) || !traced(q)) {
+                continue;
+            }
+            vec4 s = tracedSample(q);
+            lo = min(lo, s.rgb);
+            hi = max(hi, s.rgb);
+            sum += s.rgb;
+            count += 1.0;
+            depth = min(depth, s.a);
+            far = max(far, s.a);
+        }
+    }
+    vec3 color = sum / max(count, 1.0);
+
+    vec3 point = camera_pos + rayDirection(camera_dir, gl_FragCoord.xy) * depth;
+    vec2 pixel;
+    if (history_valid != 0 && projectPrevious(point, pixel)) {
+        // bilinear, nearest texels break up edges as soon as the camera moves
+        vec4 previous = texture(history, pixel / resolution);
+        // the surface the history shows has to lie within the depth range of the
+        // neighbours, otherwise p was disoccluded
+        vec3 seen = previous_camera_pos + rayDirection(previous_camera_dir, pixel) * previous.a;
+        float d = distance(seen, camera_pos);
+        if (d >= depth * (1.0 - depth_tolerance) && d <= far * (1.0 + depth_tolerance)) {
+            color = clamp(previous.rgb, lo, hi);
+        }
+    }
+    FragColor = vec4(color, depth);
+}
+"""
@@ -0,0 +1,215 @@
+import numpy as np
+from sphere import Sphere
+from plane import Plane
+from light import Light, LightArray
+from mesh import DEFAULT_CACHE_DIR
+from bvh import BVH
+
+class Scene:
+    # Geometry and materials live in one (spheres + meshes + 1, 4, 4) float32 buffer:
+    # a row per sphere in the sphere_data texel layout, a material row per mesh and
+    # the plane last. The Sphere, Mesh and Plane objects are views into it, as are the
+    # arrays handed to the renderers. Triangles index the material row of their mesh.
+    def __init__(self, spheres, plane, lights, meshes=()):
+        self.data = None
+        self._bind(list(spheres), plane, list(meshes))
+        self.lights = lights
+        # bumped whenever geometry or materials change so GPU copies know when to re-upload
+        self.version = 0
+        self._bvh = None
+        self._bvh_version = None
+        self._triangles = None
+        self._triangles_version = None
+        # mesh BVHs are slow to build, they are cached on disk next to the meshes
+        self.bvh_cache_dir = DEFAULT_CACHE_DIR
+
+    @classmethod
+    def from_data(cls, data, lights, meshes=()):
+        # adopts a buffer in the layout above without copying it, e.g. one that is
+        # memory-mapped from a compiled scene file; meshes get their material rows
+        scene = cls([], Plane.view(np.array(data[-1])), lights)
+        scene.__setstate__(dict(scene.__getstate__(), data=data, meshes=list(meshes)))
+        return scene
+
+    def _bind(self, spheres, plane, meshes):
+        # the objects passed in become views into the new buffer
+        data = np.empty((len(spheres) + len(meshes) + 1, 4, 4), dtype=np.float32)
+        for i, obj in enumerate(spheres + meshes):
+            data[i] = obj.data
+            obj.data = data[i]
+        data[-1] = plane.data
+        plane.data = data[-1]
+        self.data = data
+        self.spheres = spheres
+        self.meshes = meshes
+        self.plane = plane
+
+    @property
+    def lights(self):
+        return self._lights
+
+    @lights.setter
+    def lights(self, lights):
+        self._lights = lights if isinstance(lights, LightArray) else LightArray(lights)
+
+    def __getstate__(self):
+        # the views are rebuilt from the buffer after unpickling
+        state = dict(self.__dict__)
+        del state["spheres"], state["plane"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        num_spheres = len(self.data) - len(self.meshes) - 1
+        self.spheres = [Sphere.view(row) for row in self.data[:num_spheres]]
+        for mesh, row in zip(self.meshes, self.data[num_spheres:-1]):
+            mesh.data = row
+        self.plane = Plane.view(self.data[-1])
+
+    def mark_dirty(self):
+        self.version += 1
+
+    def add_sphere(self, sphere):
+        self._bind(self.spheres + [sphere], self.plane, self.meshes)
+        self.mark_dirty()
+
+    def add_mesh(self, mesh):
+        self._bind(self.spheres, self.plane, self.meshes + [mesh])
+        self.mark_dirty()
+
+    def use_bvh(self, bvh):
+        # a prebuilt tree over the current primitives, dropped by the next change
+        self._bvh = bvh
+        self._bvh_version = self.version
+
+    def bvh(self):
+        # one tree over all primitives: spheres first, then the triangles of all meshes
+        if self._bvh_version != self.version:
+            centers, radii = self.sphere_arrays()
+            v0, e1, e2, _, _ = self.triangle_arrays()
+            v1, v2 = v0 + e1, v0 + e2
+            bounds_min = np.concatenate([centers - radii[:, None], np.minimum(np.minimum(v0, v1), v2)])
+            bounds_max = np.concatenate([centers + radii[:, None], np.maximum(np.maximum(v0, v1), v2)])
+            if self.meshes and self.bvh_cache_dir:
+                self._bvh = BVH.cached(bounds_min, bounds_max, self.bvh_cache_dir)
+            else:
+                self._bvh = BVH(bounds_min, bounds_max)
+            self._bvh_version = self.version
+        return self._bvh
+
+    def pack_spheres(self):
+        # four RGBA texels per sphere and per mesh material, see the layout in fragment_shader.py
+        return self.data[:-1]
+
+    def pack_meshes(self):
+        # all meshes merged into one vertex buffer (xyz, -) and one triangle buffer
+        # (three vertex indices, material row)
+        vertices = [mesh.vertices for mesh in self.meshes]
+        triangles = []
+        base = 0
+        for i, mesh in enumerate(self.meshes):
+            triangles.append(np.column_stack([mesh.indices + base, np.full(len(mesh.indices), len(self.spheres) + i)]))
+            base += len(mesh.vertices)
+        packed_vertices = np.zeros((base, 4), dtype=np.float32)
+        if vertices:
+            packed_vertices[:, :3] = np.concatenate(vertices)
+        packed_triangles = np.concatenate(triangles).astype(np.int32) if triangles else np.zeros((0, 4), dtype=np.int32)
+        return packed_vertices, packed_triangles
+
+    def sphere_arrays(self):
+        num_spheres = len(self.spheres)
+        return self.data[:num_spheres, 0, :3], self.data[:num_spheres, 0, 3]
+
+    def triangle_arrays(self):
+        # per triangle: first vertex, both edges, unit face normal and material row
+        if self._triangles_version != self.version:
+            vertices, triangles = self.pack_meshes()
+            v0, v1, v2 = (vertices[triangles[:, k], :3] for k in range(3))
+            e1, e2 = v1 - v0, v2 - v0
+            normals = np.cross(e1, e2)
+            length = np.linalg.norm(normals, axis=1, keepdims=True)
+            normals = np.divide(normals, length, out=np.zeros_like(normals), where=length > 0.0)
+            self._triangles = (v0, e1, e2, normals, triangles[:, 3].astype(np.int64))
+            self._triangles_version = self.version
+        return self._triangles
+
+    def material_arrays(self):
+        # one row per sphere, then one per mesh and one for the plane
+        data = self.data
+        return data[:, 1, :3], data[:, 1, 3], data[:, 2, 3], data[:, 3, 0], data[:, 2, :3]
+
+
+def create_random_scene(num_spheres, num_lights=5, seed=0, extent=20.0):
+    rng = np.random.default_rng(seed)
+    spheres = []
+    for _ in range(num_spheres):
+        radius = rng.uniform(0.05, 0.3)
+        center = [rng.uniform(-extent, extent), -1.0 + radius + rng.uniform(0.0, 2.0), rng.uniform(-extent, extent)]
+        transparency = 0.95 if rng.random() < 0.1 else 0.0
+        spheres.append(Sphere(
+            center=center,
+            radius=radius,
+            color=rng.uniform(0.3, 1.0, 3),
+            reflectivity=rng.uniform(0.1, 0.9),
+            transparency=transparency,
+            ior=rng.uniform(1.0, 1.5),
+        ))
+    lights = [
+        Light(position=[rng.uniform(-10, 10), rng.uniform(3, 10), rng.uniform(-10, 10)], color=rng.uniform(0.1, 0.5, 3))
+        for _ in range(num_lights)
+    ]
+    plane = Plane(point=[0.0, -1.0, 0.0], normal=[0.0, 1.0, 0.0], color=[0.32, 0.18, 0.26], reflectivity=0.4)
+    return Scene(spheres, plane, lights)
+
+
+def _hash_noise(i, a, b):
+    # same "randomish" hash the fragment shader used, evaluated in float32
+    x = np.sin(np.float32(i) * np.float32(a)) * np.float32(b)
+    return float(x - np.floor(x))
+
+
+def default_lights():
+    return [
+        Light(position=[5.0, 5.0, -10.0], color=[0.4, 0.4, 0.4]),
+        Light(position=[-5.0, 100.0, 0.0], color=[0.3, 0.5, 0.5]),
+        Light(position=[0.0, 5.0, 0.0], color=[0.5, 0.5, 0.5]),
+        Light(position=[-5.0, 5.0, 0.0], color=[0.2, 0.2, 0.1]),
+        Light(position=[0.0, 5.0, 0.0], color=[0.3, 0.1, 1.0]),
+    ]
+
+
+def animate_lights(lights, time):
+    lights[0].position[0] = 5.0 * np.cos(time)
+    lights[0].position[2] = 5.0 * np.sin(time)
+
+
+def create_default_scene():
+    spheres = [
+        Sphere(center=[-1.5, 0.0, 5.0], radius=1.0, color=[1.0, 0.0, 0.0], reflectivity=0.2),
+        Sphere(center=[1.5, 0.0, 6.0], radius=1.0, color=[0.0, 0.0, 1.0], reflectivity=0.8, absorption=[0.02, 0.02, 0.02]),
+        Sphere(center=[0.0, -0.5, 3.0], radius=0.5, color=[0.9, 0.9, 0.9], reflectivity=0.9, transparency=0.95, ior=0.87),
+        Sphere(center=[2.0, -0.3, 3.0], radius=0.7, color=[0.7, 0.6, 0.5], reflectivity=0.9, transparency=0.95, ior=0.87),
+    ]
+
+    # Random spheres on a circle
+    ring_radius = 3.5
+    ring_count = 23
+    for i in range(ring_count):
+        angle = 2.0 * 3.14159 * i / ring_count
+        radius = 0.20 if i % 2 == 0 else 0.15
+        color = [
+            0.3 + 0.7 * _hash_noise(i, 12.345, 9876.543),
+            0.3 + 0.7 * _hash_noise(i, 3.217, 5432.123),
+            0.3 + 0.7 * _hash_noise(i, 5.789, 6543.234),
+        ]
+        spheres.append(Sphere(
+            center=[ring_radius * np.cos(angle), -1.0 + radius, 3.5 + ring_radius * np.sin(angle)],
+            radius=radius,
+            color=color,
+            reflectivity=0.1 + 0.4 * _hash_noise(i, 1.111, 777.0),
+            transparency=0.2 * _hash_noise(i, 2.222, 123.0),
+            ior=1.0 + 0.5 * _hash_noise(i, 4.444, 987.0),
+        ))
+
+    plane = Plane(point=[0.0, -1.0, 0.0], normal=[0.0, 1.0, 0.0], color=[0.32, 0.18, 0.26], reflectivity=0.4)
+    return Scene(spheres, plane, default_lights())
@@ -0,0 +1,73 @@
+import hashlib
+import numpy as np
+from OpenGL.GL import *
+
+# sampler name -> (texture unit, texel format)
+SCENE_TEXTURES = {
+    "sphere_data": (0, GL_RGBA32F),
+    "bvh_bounds": (1, GL_RGBA32F),
+    "bvh_nodes": (2, GL_RGBA32I),
+    "bvh_prims": (3, GL_R32I),
+    "mesh_vertices": (4, GL_RGBA32F),
+    "mesh_triangles": (5, GL_RGBA32I),
+}
+
+class SceneBuffers:
+    def __init__(self):
+        self.buffers = {name: glGenBuffers(1) for name in SCENE_TEXTURES}
+        self.textures = {name: glGenTextures(1) for name in SCENE_TEXTURES}
+        self.scene = None
+        self.version = None
+        self.num_spheres = 0
+        self.num_nodes = 0
+        # content hash per buffer: a new scene or version only re-uploads what differs
+        self.digests = {}
+        self.stats = {"uploaded": 0, "unchanged": 0}
+
+    def update(self, scene):
+        if scene is self.scene and scene.version == self.version:
+            return False
+
+        bvh = scene.bvh()
+        bounds, links, prims = bvh.pack()
+        vertices, triangles = scene.pack_meshes()
+        self.upload("sphere_data", scene.pack_spheres())
+        self.upload("bvh_bounds", bounds)
+        self.upload("bvh_nodes", links)
+        self.upload("bvh_prims", prims)
+        self.upload("mesh_vertices", vertices)
+        self.upload("mesh_triangles", triangles)
+
+        self.scene = scene
+        self.version = scene.version
+        self.num_spheres = len(scene.spheres)
+        self.num_nodes = bvh.node_count
+        return True
+
+    def upload(self, name, data):
+        data = np.ascontiguousarray(data)
+        digest = hashlib.sha1(data).digest() + repr((data.dtype, data.shape)).encode()
+        if self.digests.get(name) == digest:
+            self.stats["unchanged"] += 1
+            return
+        self.digests[name] = digest
+        self.stats["uploaded"] += 1
+
+        _, texel_format = SCENE_TEXTURES[name]
+        glBindBuffer(GL_TEXTURE_BUFFER, self.buffers[name])
+        # an empty buffer cannot back a texture, keep at least one texel around
+        glBufferData(GL_TEXTURE_BUFFER, max(data.nbytes, 16), data if data.size else None, GL_STATIC_DRAW)
+        glBindBuffer(GL_TEXTURE_BUFFER, 0)
+
+        glBindTexture(GL_TEXTURE_BUFFER, self.textures[name])
+        glTexBuffer(GL_TEXTURE_BUFFER, texel_format, self.buffers[name])
+        glBindTexture(GL_TEXTURE_BUFFER, 0)
+
+    def bind(self):
+        for name, (unit, _) in SCENE_TEXTURES.items():
+            glActiveTexture(GL_TEXTURE0 + unit)
+            glBindTexture(GL_TEXTURE_BUFFER, self.textures[name])
+
+    def cleanup(self):
+        glDeleteTextures(len(self.textures), list(self.textures.values()))
+        glDeleteBuffers(len(self.buffers), list(self.buffers.values()))
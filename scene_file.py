@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import tomllib
+import numpy as np
+from bvh import BVH, CACHED_ARRAYS
+from camera import Camera
+from light import Light, LightArray
+from mesh import Mesh, save_atomic, DEFAULT_CACHE_DIR as MESH_CACHE_DIR
+from plane import Plane
+from scene import Scene
+from sphere import Sphere
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "simple_raytracer", "scenes")
+# part of the cache key, bump it whenever the compiled layout changes
+FORMAT_VERSION = 1
+MATERIAL_FIELDS = ("color", "reflectivity", "transparency", "ior", "absorption")
+
+# Scene description, as JSON or TOML:
+#
+#   camera     {position, yaw, pitch} or {position, look_at}
+#   materials  {name: {color, reflectivity, transparency, ior, absorption}}
+#   spheres    [{center, radius, material or material fields}]
+#   meshes     [{path, position, scale, material or material fields}], paths relative to the file
+#   plane      {point, normal, color, reflectivity}
+#   lights     [{position, color}]
+#
+# Loading compiles the description into a cache entry keyed by a hash of the file and
+# the directory its mesh paths are relative to:
+# the scene buffer, the lights and the BVH as .npy files that later loads memory-map.
+# Meshes come from their own cache (see mesh.py), the entry only records which files
+# it was built from so that edited meshes invalidate it.
+
+
+def parse_description(raw, path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json":
+        return json.loads(raw)
+    if extension == ".toml":
+        return tomllib.loads(raw.decode())
+    raise Exception(f"Unsupported scene format {extension}")
+
+
+def material(entry, materials):
+    # the named material, overridden by fields given on the entry itself
+    name = entry.get("material")
+    if name is not None and name not in materials:
+        raise Exception(f"Unknown material {name}")
+    fields = dict(materials.get(name, {}))
+    fields.update((key, entry[key]) for key in MATERIAL_FIELDS if key in entry)
+    return fields
+
+
+def parse_camera(entry):
+    camera = Camera(position=entry["position"], yaw=entry.get("yaw", 90.0), pitch=entry.get("pitch", 0.0))
+    if "look_at" in entry:
+        camera.look_at(entry["look_at"])
+    return camera
+
+
+def mesh_sources(description, base_dir):
+    # (absolute path, position, scale) per mesh entry
+    return [
+        (os.path.join(base_dir, entry["path"]), list(entry.get("position", (0.0, 0.0, 0.0))), entry.get("scale", 1.0))
+        for entry in description.get("meshes", [])
+    ]
+
+
+def file_stamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def build_scene(description, base_dir, mesh_cache_dir=MESH_CACHE_DIR):
+    materials = description.get("materials", {})
+    spheres = [
+        Sphere(center=entry["center"], radius=entry["radius"], **material(entry, materials))
+        for entry in description.get("spheres", [])
+    ]
+    meshes = [
+        Mesh.load(path, position, scale, mesh_cache_dir, **material(entry, materials))
+        for entry, (path, position, scale) in zip(description.get("meshes", []), mesh_sources(description, base_dir))
+    ]
+    if "plane" not in description:
+        raise Exception("Scene file has no plane")
+    entry = description["plane"]
+    fields = material(entry, materials)
+    plane = Plane(point=entry["point"], normal=entry["normal"], color=fields["color"],
+                  reflectivity=fields.get("reflectivity", 0.0))
+    lights = [Light(position=entry["position"], color=entry["color"]) for entry in description.get("lights", [])]
+    return Scene(spheres, plane, lights, meshes)
+
+
+def load_scene(path, cache_dir=DEFAULT_CACHE_DIR, mesh_cache_dir=MESH_CACHE_DIR):
+    # returns the scene and the camera of the file (None if it has none)
+    with open(path, "rb") as f:
+        raw = f.read()
+    # the same file in another directory refers to other meshes
+    base_dir = os.path.dirname(os.path.abspath(path))
+    digest = hashlib.sha256(raw + f"|{FORMAT_VERSION}|{base_dir}".encode()).hexdigest()
+    entry = os.path.join(cache_dir, digest) if cache_dir else None
+    if entry and os.path.exists(os.path.join(entry, "scene.json")):
+        scene, camera = load_compiled(entry, mesh_cache_dir)
+        if scene is not None:
+            return scene, camera
+
+    description = parse_description(raw, path)
+    scene = build_scene(description, base_dir, mesh_cache_dir)
+    camera = parse_camera(description["camera"]) if "camera" in description else None
+    if entry:
+        save_compiled(entry, scene, camera, mesh_sources(description, base_dir))
+    return scene, camera
+
+
+def save_compiled(entry, scene, camera, meshes):
+    os.makedirs(entry, exist_ok=True)
+    bvh = scene.bvh()
+    for name in CACHED_ARRAYS:
+        save_atomic(os.path.join(entry, f"bvh_{name}.npy"), getattr(bvh, name))
+    save_atomic(os.path.join(entry, "lights.npy"), scene.lights.data)
+    save_atomic(os.path.join(entry, "data.npy"), scene.data)
+    header = {
+        "camera": None if camera is None else {"position": camera.position.tolist(), "yaw": camera.yaw, "pitch": camera.pitch},
+        "meshes": [
+            {"path": path, "position": position, "scale": scale, "stamp": file_stamp(path)}
+            for path, position, scale in meshes
+        ],
+    }
+    # written last, an entry without it is incomplete
+    tmp = os.path.join(entry, f"scene.json.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(header, f)
+    os.replace(tmp, os.path.join(entry, "scene.json"))
+
+
+def load_compiled(entry, mesh_cache_dir=MESH_CACHE_DIR):
+    # (None, None) when a mesh it was built from has changed since
+    with open(os.path.join(entry, "scene.json")) as f:
+        header = json.load(f)
+    for mesh in header["meshes"]:
+        if not os.path.exists(mesh["path"]) or file_stamp(mesh["path"]) != mesh["stamp"]:
+            return None, None
+
+    # the materials are rows of the scene buffer, Scene.from_data points the meshes at them
+    meshes = [Mesh.load(mesh["path"], mesh["position"], mesh["scale"], mesh_cache_dir, color=(0.0, 0.0, 0.0))
+              for mesh in header["meshes"]]
+    # copy-on-write, so the scene can still be edited in memory
+    data = np.load(os.path.join(entry, "data.npy"), mmap_mode="c")
+    lights = LightArray.from_data(np.load(os.path.join(entry, "lights.npy")))
+    scene = Scene.from_data(data, lights, meshes)
+    scene.use_bvh(BVH.from_arrays({
+        name: np.load(os.path.join(entry, f"bvh_{name}.npy"), mmap_mode="r") for name in CACHED_ARRAYS
+    }))
+    camera = header["camera"]
+    return scene, None if camera is None else Camera(position=camera["position"], yaw=camera["yaw"], pitch=camera["pitch"])
+
+
+def save_scene(path, scene, camera=None):
+    # writes a scene without meshes as a JSON description, e.g. to start editing one
+    # that was built in code
+    if scene.meshes:
+        raise Exception("Scenes with meshes cannot be saved")
+
+    def number(value):
+        # shortest text that reads back as the same float32
+        return float(str(np.float32(value)))
+
+    def vector(values):
+        return [number(value) for value in values]
+
+    description = {}
+    if camera is not None:
+        description["camera"] = {"position": vector(camera.position), "yaw": number(camera.yaw), "pitch": number(camera.pitch)}
+    description["spheres"] = [
+        {"center": vector(sphere.center), "radius": number(sphere.radius), "color": vector(sphere.color),
+         "reflectivity": number(sphere.reflectivity), "transparency": number(sphere.transparency),
+         "ior": number(sphere.ior), "absorption": vector(sphere.absorption)}
+        for sphere in scene.spheres
+    ]
+    plane = scene.plane
+    description["plane"] = {"point": vector(plane.point), "normal": vector(plane.normal), "color": vector(plane.color),
+                            "reflectivity": number(plane.reflectivity)}
+    description["lights"] = [{"position": vector(light.position), "color": vector(light.color)} for light in scene.lights]
+    with open(path, "w") as f:
+        json.dump(description, f, indent=2)
+
+
+class SceneWatcher:
+    # Polls a scene file for changes, at most every `interval` seconds
+    def __init__(self, path, interval=0.5):
+        self.path = path
+        self.interval = interval
+        self.stamp = file_stamp(path)
+        self.next_check = 0.0
+
+    def changed(self, now):
+        if now < self.next_check:
+            return False
+        self.next_check = now + self.interval
+        try:
+            stamp = file_stamp(self.path)
+        except FileNotFoundError:
+            # editors that save by renaming remove the file for a moment
+            return False
+        if stamp == self.stamp:
+            return False
+        self.stamp = stamp
+        return True
@@ -0,0 +1,161 @@
+import argparse
+import os
+import queue
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from image_io import save_image, to_uint8
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".mkv", ".webm", ".gif")
+
+
+class ImageSequenceWriter:
+    # Encodes and writes frames on a thread pool. At most max_pending frames are
+    # queued; write() only waits when the encoders fall that far behind, which keeps
+    # memory bounded. zlib and file I/O release the GIL, so the pool runs in parallel
+    # with the render thread.
+    def __init__(self, pattern, workers=4, max_pending=8):
+        self.pattern = pattern
+        self.pool = ThreadPoolExecutor(workers)
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.futures = []
+        self.paths = []
+        directory = os.path.dirname(pattern.format(0))
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def dtype(self):
+        # float readback for formats that keep high dynamic range
+        return np.float32 if self.pattern.lower().endswith((".npy", ".exr")) else np.uint8
+
+    def write(self, index, pixels):
+        self.slots.acquire()
+        path = self.pattern.format(index)
+        future = self.pool.submit(save_image, path, pixels)
+        future.add_done_callback(lambda _: self.slots.release())
+        self.futures.append(future)
+        self.paths.append(path)
+
+    def close(self):
+        self.pool.shutdown()
+        # re-raises the first encoding error, if any
+        for future in self.futures:
+            future.result()
+        return self.paths
+
+
+class FFmpegWriter:
+    # Pipes raw RGB frames into an ffmpeg process. Frames are converted on a thread
+    # pool and written to the pipe in order by a feeder thread, so the render thread
+    # never blocks on the encoder unless max_pending frames are queued.
+    def __init__(self, path, width, height, fps=30.0, workers=2, max_pending=8, ffmpeg="ffmpeg",
+                 codec_args=("-c:v", "libx264", "-pix_fmt", "yuv420p", "-crf", "18")):
+        if shutil.which(ffmpeg) is None:
+            raise Exception(f"{ffmpeg} not found, it is needed to write {path}")
+        self.path = path
+        self.dtype = np.uint8
+        command = [
+            ffmpeg, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+            *codec_args, path,
+        ]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        self.pool = ThreadPoolExecutor(workers)
+        self.frames = queue.Queue(max_pending)
+        self.error = None
+        self.feeder = threading.Thread(target=self.feed, daemon=True)
+        self.feeder.start()
+
+    def write(self, index, pixels):
+        if self.error:
+            raise self.error
+        self.frames.put(self.pool.submit(lambda p: np.ascontiguousarray(to_uint8(p)).tobytes(), pixels))
+
+    def feed(self):
+        while True:
+            future = self.frames.get()
+            if future is None:
+                break
+            try:
+                if self.error is None:
+                    self.process.stdin.write(future.result())
+            except Exception as e:
+                # keep draining so write() never blocks on a dead encoder
+                self.error = e
+
+    def close(self):
+        self.frames.put(None)
+        self.feeder.join()
+        self.pool.shutdown()
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            # ffmpeg is gone already, its exit status below says so
+            pass
+        if self.process.wait() != 0:
+            # the feeder's error, if any, is how the dead encoder showed up
+            raise Exception(f"ffmpeg exited with status {self.process.returncode}") from self.error
+        if self.error:
+            raise self.error
+        return [self.path]
+
+
+def open_writer(output, width, height, fps=30.0, workers=4, max_pending=8):
+    if output.lower().endswith(VIDEO_EXTENSIONS):
+        return FFmpegWriter(output, width, height, fps, workers=min(workers, 2), max_pending=max_pending)
+    return ImageSequenceWriter(output, workers, max_pending)
+
+
+def export_sequence(frames, writer):
+    # frames yields images in order; returns the written paths
+    try:
+        for index, pixels in enumerate(frames):
+            writer.write(index, pixels)
+    finally:
+        paths = writer.close()
+    return paths
+
+
+def main(argv=None):
+    from camera_path import PATHS
+    parser = argparse.ArgumentParser(description="Render a camera path to an image sequence or a video.")
+    parser.add_argument("--path", default="orbit", choices=sorted(PATHS))
+    parser.add_argument("--frames", default=120, type=int)
+    parser.add_argument("--fps", default=30.0, type=float)
+    parser.add_argument("--resolution", default="1200x800")
+    parser.add_argument("--bounces", default=6, type=int)
+    parser.add_argument("--output", default="frames/frame_{:04d}.png",
+                        help="file pattern (.png, .exr, .npy) or a video file (" + ", ".join(VIDEO_EXTENSIONS) + ")")
+    parser.add_argument("--workers", default=4, type=int, help="encoder threads")
+    parser.add_argument("--queue", default=8, type=int, help="frames that may wait for encoding")
+    parser.add_argument("--window", action="store_true", help="render through the interactive application and show the frames")
+    args = parser.parse_args(argv)
+
+    width, height = (int(v) for v in args.resolution.lower().split("x"))
+    # fixed time steps make the output independent of how fast frames are rendered
+    path = PATHS[args.path](args.frames, fps=args.fps)
+    writer = open_writer(args.output, width, height, args.fps, args.workers, args.queue)
+
+    if args.window:
+        from application import Application
+        paths = Application(width, height, "Exporting sequence", export=(path, writer), max_bounces=args.bounces).exported
+    else:
+        from offscreen import OffscreenRenderer
+        offscreen = OffscreenRenderer(width, height, max_bounces=args.bounces)
+        try:
+            cameras, times = zip(*path)
+            paths = export_sequence(offscreen.render_frames(cameras, times, writer.dtype), writer)
+        finally:
+            offscreen.cleanup()
+    if len(paths) > 1:
+        print(f"wrote {len(paths)} frames to {paths[0]} ... {paths[-1]}")
+    elif paths:
+        print(f"wrote {len(path)} frame{'s' if len(path) != 1 else ''} to {paths[0]}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
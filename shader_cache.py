@@ -0,0 +1,159 @@
+import ctypes
+import hashlib
+import os
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.GL.ARB.get_program_binary import glInitGetProgramBinaryARB
+from OpenGL.GL.KHR.parallel_shader_compile import glInitParallelShaderCompileKHR, glMaxShaderCompilerThreadsKHR
+from OpenGL.raw.GL.VERSION.GL_4_1 import glGetProgramBinary, glProgramBinary
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "simple_raytracer", "shaders")
+
+
+def inject_defines(source, defines):
+    # #defines have to follow the #version line, which must stay first
+    version, rest = source.lstrip().split("\n", 1)
+    lines = "".join(f"#define {name} {int(value)}\n" for name, value in sorted(defines.items()))
+    return f"{version}\n{lines}{rest}"
+
+
+def program_binaries_supported():
+    # core since GL 4.1, older contexts need ARB_get_program_binary; without either
+    # the format query itself fails and programs are only cached in memory
+    try:
+        version = (glGetIntegerv(GL_MAJOR_VERSION), glGetIntegerv(GL_MINOR_VERSION))
+        if version < (4, 1) and not glInitGetProgramBinaryARB():
+            return False
+        return glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) > 0
+    except GLError:
+        return False
+
+
+class ShaderCache:
+    # Linked programs per set of #defines. Program binaries are kept on disk, keyed
+    # by a hash of the sources and the driver, so later runs can skip compilation.
+    # request() starts a build without waiting for it and get() waits for the result,
+    # so the CPU can do other work in between; with KHR_parallel_shader_compile the
+    # driver compiles on its own threads meanwhile.
+    def __init__(self, vertex_source, fragment_source, cache_dir=DEFAULT_CACHE_DIR):
+        self.vertex_source = vertex_source
+        self.fragment_source = fragment_source
+        self.cache_dir = cache_dir
+        self.programs = {}
+        # key -> (program, shaders, path) of builds that have been started
+        self.pending = {}
+        self.driver = "|".join(glGetString(name).decode() for name in (GL_VENDOR, GL_RENDERER, GL_VERSION))
+        self.binaries_supported = program_binaries_supported()
+        if glInitParallelShaderCompileKHR():
+            # let the driver pick the number of compiler threads
+            glMaxShaderCompilerThreadsKHR(0xFFFFFFFF)
+        self.stats = {"memory": 0, "disk": 0, "compiled": 0}
+
+    def request(self, defines):
+        key = tuple(sorted(defines.items()))
+        if key in self.programs or key in self.pending:
+            return key
+
+        fragment_source = inject_defines(self.fragment_source, defines)
+        digest = hashlib.sha256("\0".join((self.vertex_source, fragment_source, self.driver)).encode()).hexdigest()
+        path = os.path.join(self.cache_dir, digest + ".bin") if self.cache_dir else None
+
+        program = self.load(path)
+        if program:
+            self.stats["disk"] += 1
+            self.programs[key] = program
+        else:
+            self.stats["compiled"] += 1
+            self.pending[key] = self.build(fragment_source) + (path,)
+        return key
+
+    def get(self, defines):
+        key = tuple(sorted(defines.items()))
+        if key in self.programs:
+            self.stats["memory"] += 1
+            return self.programs[key]
+
+        self.request(defines)
+        if key in self.pending:
+            program, shaders, path = self.pending.pop(key)
+            self.programs[key] = self.finish(program, shaders)
+            self.store(self.programs[key], path)
+        return self.programs[key]
+
+    def build(self, fragment_source):
+        # only issues the commands, finish() checks the results
+        shaders = []
+        for source, shader_type in ((self.vertex_source, GL_VERTEX_SHADER), (fragment_source, GL_FRAGMENT_SHADER)):
+            shader = glCreateShader(shader_type)
+            glShaderSource(shader, source)
+            glCompileShader(shader)
+            shaders.append(shader)
+        program = glCreateProgram()
+        for shader in shaders:
+            glAttachShader(program, shader)
+        if self.binaries_supported:
+            glProgramParameteri(program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+        glLinkProgram(program)
+        return program, shaders
+
+    def finish(self, program, shaders):
+        # blocks until the build is done
+        linked = glGetProgramiv(program, GL_LINK_STATUS) == GL_TRUE
+        logs = [glGetShaderInfoLog(shader) for shader in shaders
+                if glGetShaderiv(shader, GL_COMPILE_STATUS) != GL_TRUE]
+        for shader in shaders:
+            glDetachShader(program, shader)
+            glDeleteShader(shader)
+        if logs:
+            glDeleteProgram(program)
+            raise Exception(f"Shader compile failure: {logs[0]}")
+        if not linked:
+            log = glGetProgramInfoLog(program)
+            glDeleteProgram(program)
+            raise Exception(f"Shader link failure: {log}")
+        return program
+
+    def load(self, path):
+        if not (path and self.binaries_supported and os.path.exists(path)):
+            return None
+        with open(path, "rb") as f:
+            data = f.read()
+        binary_format = int(np.frombuffer(data[:4], dtype=np.uint32)[0])
+        binary = data[4:]
+
+        program = glCreateProgram()
+        glProgramBinary(program, binary_format, binary, len(binary))
+        if glGetProgramiv(program, GL_LINK_STATUS) != GL_TRUE:
+            # rejected by the driver (e.g. after an update), fall back to compiling
+            glDeleteProgram(program)
+            os.remove(path)
+            return None
+        return program
+
+    def store(self, program, path):
+        if not (path and self.binaries_supported):
+            return
+        length = glGetProgramiv(program, GL_PROGRAM_BINARY_LENGTH)
+        if length <= 0:
+            return
+        binary = (ctypes.c_ubyte * length)()
+        written = ctypes.c_int()
+        binary_format = ctypes.c_uint()
+        glGetProgramBinary(program, length, ctypes.byref(written), ctypes.byref(binary_format), binary)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(np.uint32(binary_format.value).tobytes())
+            f.write(bytes(binary)[:written.value])
+        os.replace(tmp_path, path)
+
+    def cleanup(self):
+        for program, shaders, _ in self.pending.values():
+            for shader in shaders:
+                glDeleteShader(shader)
+            glDeleteProgram(program)
+        for program in self.programs.values():
+            glDeleteProgram(program)
+        self.programs = {}
+        self.pending = {}
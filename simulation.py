@@ -0,0 +1,118 @@
+import threading
+import time as clock
+
+
+class SimulationState:
+    # Everything a frame needs from the simulation, copied so the renderer never
+    # sees a step that is half done
+    __slots__ = ("stamp", "time", "position", "yaw", "pitch", "lights")
+
+    def __init__(self, stamp, time, camera, lights):
+        self.stamp = stamp
+        self.time = time
+        self.position = camera.position.copy()
+        self.yaw = camera.yaw
+        self.pitch = camera.pitch
+        self.lights = lights.data.copy()
+
+
+class Simulation:
+    # Moves the camera and animates the lights in fixed steps on its own thread, so
+    # camera speed does not depend on the frame rate and a slow frame does not hold
+    # up the simulation. Input is handed over by the main thread (GLFW only polls
+    # there) and consumed by the next step. Frames interpolate between the last two
+    # states, which puts them one step behind the simulation.
+    def __init__(self, camera, lights, animate=None, rate=60.0):
+        self.camera = camera
+        self.lights = lights
+        self.animate = animate
+        self.step_time = 1.0 / rate
+        self.time = 0.0
+        self.paused = False
+
+        self.keys = frozenset()
+        self.mouse_offset = [0.0, 0.0]
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.animate_lights()
+        now = clock.perf_counter()
+        self.previous = self.current = SimulationState(now, self.time, camera, lights)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="simulation", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def set_keys(self, keys):
+        with self.lock:
+            self.keys = frozenset(keys)
+
+    def add_mouse_offset(self, xoffset, yoffset):
+        with self.lock:
+            self.mouse_offset[0] += xoffset
+            self.mouse_offset[1] += yoffset
+
+    def toggle_pause(self):
+        with self.lock:
+            self.paused = not self.paused
+
+    def run(self):
+        next_step = clock.perf_counter() + self.step_time
+        while not self.stop_event.is_set():
+            delay = next_step - clock.perf_counter()
+            if delay > 0.0:
+                self.stop_event.wait(delay)
+                continue
+            self.step(next_step)
+            next_step += self.step_time
+            # after a stall (suspend, debugger) skip the missed steps instead of racing
+            if clock.perf_counter() - next_step > 0.25:
+                next_step = clock.perf_counter() + self.step_time
+
+    def step(self, stamp):
+        # under the lock as a whole, set_lights() may swap the lights from the main thread
+        with self.lock:
+            xoffset, yoffset = self.mouse_offset
+            self.mouse_offset = [0.0, 0.0]
+            if xoffset or yoffset:
+                self.camera.process_mouse_movement(xoffset, yoffset)
+            self.camera.move(self.keys)
+            if not self.paused:
+                self.time += self.step_time
+                self.animate_lights()
+            self.previous, self.current = self.current, SimulationState(stamp, self.time, self.camera, self.lights)
+
+    def animate_lights(self):
+        if self.animate is not None:
+            self.animate(self.lights, self.time)
+
+    def set_lights(self, lights):
+        # e.g. after the scene was reloaded, frames jump to the new lights without interpolating
+        with self.lock:
+            self.lights = lights
+            self.animate_lights()
+            self.previous = self.current = SimulationState(self.current.stamp, self.time, self.camera, lights)
+
+    def interpolate(self, camera, lights, now=None):
+        # writes the state at now - step_time into camera and lights, returns its time
+        if now is None:
+            now = clock.perf_counter()
+        with self.lock:
+            previous, current = self.previous, self.current
+        alpha = min(1.0, max(0.0, (now - current.stamp) / self.step_time))
+        if previous is current:
+            alpha = 1.0
+
+        camera.position[:] = previous.position + (current.position - previous.position) * alpha
+        camera.yaw = previous.yaw + (current.yaw - previous.yaw) * alpha
+        camera.pitch = previous.pitch + (current.pitch - previous.pitch) * alpha
+        camera.update_direction()
+        lights.data[:] = previous.lights + (current.lights - previous.lights) * alpha
+        return previous.time + (current.time - previous.time) * alpha
@@ -0,0 +1,31 @@
+import numpy as np
+from fields import vector_field, scalar_field
+
+class Sphere:
+    # four RGBA texels, the layout of the sphere_data texture buffer:
+    # (center, radius), (color, reflectivity), (absorption, transparency), (ior, 0, 0, 0)
+    __slots__ = ("data",)
+
+    center = vector_field(0)
+    radius = scalar_field(0, 3)
+    color = vector_field(1)
+    reflectivity = scalar_field(1, 3)
+    absorption = vector_field(2)
+    transparency = scalar_field(2, 3)
+    ior = scalar_field(3, 0)
+
+    def __init__(self, center, radius, color, reflectivity=0.0, transparency=0.0, ior=1.0, absorption=[0.0, 0.0, 0.0]):
+        self.data = np.zeros((4, 4), dtype=np.float32)
+        self.center = center
+        self.radius = radius
+        self.color = color
+        self.reflectivity = reflectivity
+        self.transparency = transparency
+        self.ior = ior
+        self.absorption = absorption
+
+    @classmethod
+    def view(cls, data):
+        sphere = cls.__new__(cls)
+        sphere.data = data
+        return sphere
@@ -0,0 +1,130 @@
+from OpenGL.GL import *
+from OpenGL.GL.shaders import compileProgram, compileShader
+from reproject_shader import REPROJECT_SHADER
+from vertex_shader import VERTEX_SHADER
+from render_target import RenderTarget
+from gl_renderer import sparse_size
+
+# stride and the (offset, row shift) of every frame in the cycle; each pixel is
+# traced once per cycle
+PATTERNS = {
+    "checkerboard": ((2, 1), [((0, 0), 1), ((1, 0), 1)]),
+    "interleaved": ((2, 2), [((0, 0), 0), ((1, 1), 0), ((1, 0), 0), ((0, 1), 0)]),
+}
+# every pixel, used whenever there is no usable history
+FULL_FRAME = ((1, 1), (0, 0), 0)
+
+
+class TemporalReprojection:
+    # Traces a fraction of the pixels each frame (a checkerboard or one pixel per 2x2
+    # block) and fills in the others from the previous frame. Their positions come
+    # from the depth of the traced neighbours and are projected into the previous
+    # camera. History that saw a different surface (disocclusion) is dropped for the
+    # average of the neighbours, and accepted history is clamped to their range.
+    def __init__(self, renderer, width, height, pattern="checkerboard", depth_tolerance=0.1):
+        self.renderer = renderer
+        self.width = width
+        self.height = height
+        self.stride, self.cycle = PATTERNS[pattern]
+        self.depth_tolerance = depth_tolerance
+
+        self.sample_target = RenderTarget(width, height)
+        self.history = [RenderTarget(width, height, filtering=GL_LINEAR), RenderTarget(width, height, filtering=GL_LINEAR)]
+        self.init_shader()
+
+        self.frame = 0
+        self.previous_camera = None
+        self.state = None
+        # pixels traced by the last draw
+        self.traced_pixels = 0
+
+    def init_shader(self):
+        self.shader = compileProgram(
+            compileShader(VERTEX_SHADER, GL_VERTEX_SHADER),
+            compileShader(REPROJECT_SHADER, GL_FRAGMENT_SHADER)
+        )
+        glUseProgram(self.shader)
+        glUniform1i(glGetUniformLocation(self.shader, "sample_color"), 0)
+        glUniform1i(glGetUniformLocation(self.shader, "history"), 1)
+        self.locs = {
+            name: glGetUniformLocation(self.shader, name)
+            for name in ("history_valid", "resolution", "camera_pos", "camera_dir", "previous_camera_pos",
+                         "previous_camera_dir", "trace_stride", "trace_offset", "trace_row_shift", "depth_tolerance")
+        }
+
+    def resize(self, width, height):
+        self.width = width
+        self.height = height
+        self.sample_target.resize(width, height)
+        for target in self.history:
+            target.resize(width, height)
+        self.reset()
+
+    def reset(self):
+        self.previous_camera = None
+
+    def state_key(self, scene):
+        # lights may move, the clamp keeps up with them; geometry changes drop the history
+        return (id(scene), scene.version, self.renderer.max_bounces, self.renderer.shadows, self.renderer.refraction)
+
+    @property
+    def result(self):
+        return self.history[self.frame % 2]
+
+    def draw(self, camera, scene, time):
+        state = self.state_key(scene)
+        if state != self.state:
+            self.state = state
+            self.reset()
+
+        if self.previous_camera is None:
+            pattern = FULL_FRAME
+        else:
+            offset, row_shift = self.cycle[self.frame % len(self.cycle)]
+            pattern = (self.stride, offset, row_shift)
+        size = sparse_size(self.width, self.height, pattern)
+        self.traced_pixels = size[0] * size[1]
+
+        self.sample_target.bind()
+        self.renderer.draw(camera, scene, time, self.width, self.height, pattern=pattern)
+
+        history = self.history[self.frame % 2]
+        self.frame += 1
+        target = self.history[self.frame % 2]
+        target.bind()
+        glUseProgram(self.shader)
+        previous = self.previous_camera or (camera.position, camera.direction)
+        locs = self.locs
+        glUniform1i(locs["history_valid"], self.previous_camera is not None)
+        glUniform2f(locs["resolution"], self.width, self.height)
+        glUniform3f(locs["camera_pos"], *camera.position)
+        glUniform3f(locs["camera_dir"], *camera.direction)
+        glUniform3f(locs["previous_camera_pos"], *previous[0])
+        glUniform3f(locs["previous_camera_dir"], *previous[1])
+        (stride_x, stride_y), (offset_x, offset_y), row_shift = pattern
+        glUniform2i(locs["trace_stride"], stride_x, stride_y)
+        glUniform2i(locs["trace_offset"], offset_x, offset_y)
+        glUniform1i(locs["trace_row_shift"], row_shift)
+        glUniform1f(locs["depth_tolerance"], self.depth_tolerance)
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D, self.sample_target.texture)
+        glActiveTexture(GL_TEXTURE1)
+        glBindTexture(GL_TEXTURE_2D, history.texture)
+        glBindVertexArray(self.renderer.vao)
+        glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+        glBindVertexArray(0)
+
+        self.previous_camera = (camera.position.copy(), camera.direction.copy())
+        return target
+
+    def present(self, width, height):
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.result.fbo)
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, 0)
+        glBlitFramebuffer(0, 0, self.width, self.height, 0, 0, width, height, GL_COLOR_BUFFER_BIT, GL_LINEAR)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+    def cleanup(self):
+        self.sample_target.cleanup()
+        for target in self.history:
+            target.cleanup()
+        glDeleteProgram(self.shader)
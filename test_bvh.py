@@ -0,0 +1,103 @@
+import inspect
+import sys
+import numpy as np
+from bvh import BVH
+from camera import Camera
+from cpu_renderer import CPURenderer, normalize, sphere_intersection, sphere_pair_intersection
+from scene import create_random_scene
+
+
+def random_spheres(count, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(-10.0, 10.0, (count, 3)).astype(np.float32)
+    radii = rng.uniform(0.1, 1.0, count).astype(np.float32)
+    return centers, radii
+
+
+def random_rays(count, seed=1):
+    rng = np.random.default_rng(seed)
+    ro = rng.uniform(-12.0, 12.0, (count, 3)).astype(np.float32)
+    rd = normalize(rng.normal(size=(count, 3)).astype(np.float32))
+    return ro, rd
+
+
+def brute_force(ro, rd, centers, radii):
+    t = sphere_intersection(ro, rd, centers, radii)
+    t = np.where(t > 0.0, t, np.inf)
+    index = np.argmin(t, axis=1)
+    t = t[np.arange(len(ro)), index]
+    return t, np.where(np.isinf(t), -1, index)
+
+
+def test_intersect_matches_brute_force():
+    centers, radii = random_spheres(300)
+    ro, rd = random_rays(2000)
+    bvh = BVH.from_spheres(centers, radii)
+    t, index = bvh.intersect(ro, rd, lambda prims, o, d: sphere_pair_intersection(o, d, centers[prims], radii[prims]))
+    expected_t, expected_index = brute_force(ro, rd, centers, radii)
+    assert (expected_index >= 0).sum() > 100
+    np.testing.assert_array_equal(index, expected_index)
+    np.testing.assert_array_equal(t, expected_t)
+
+
+def test_occluded_matches_brute_force():
+    centers, radii = random_spheres(300)
+    ro, rd = random_rays(2000)
+    t_max = np.random.default_rng(2).uniform(0.5, 20.0, len(ro)).astype(np.float32)
+    bvh = BVH.from_spheres(centers, radii)
+    blocked = bvh.occluded(ro, rd, lambda prims, o, d: sphere_pair_intersection(o, d, centers[prims], radii[prims]), t_max)
+    t = sphere_intersection(ro, rd, centers, radii)
+    expected = ((t > 0.0) & (t < t_max[:, None])).any(axis=1)
+    assert 0 < expected.sum() < len(ro)
+    np.testing.assert_array_equal(blocked, expected)
+
+
+def test_every_primitive_is_in_exactly_one_leaf():
+    centers, radii = random_spheres(157)
+    bvh = BVH.from_spheres(centers, radii, leaf_size=4)
+    leaves = bvh.prim_count > 0
+    prims = np.concatenate([bvh.prim_indices[start:start + count]
+                            for start, count in zip(bvh.prim_start[leaves], bvh.prim_count[leaves])])
+    np.testing.assert_array_equal(np.sort(prims), np.arange(157))
+    assert bvh.prim_count.max() <= 4
+
+
+def test_empty_tree_misses_everything():
+    bvh = BVH.from_spheres(np.zeros((0, 3)), np.zeros(0))
+    ro, rd = random_rays(10)
+    t, index = bvh.intersect(ro, rd, None)
+    assert np.isinf(t).all() and (index == -1).all()
+    assert not bvh.occluded(ro, rd, None).any()
+
+
+def test_renderer_with_and_without_bvh_is_identical():
+    scene = create_random_scene(200, 3, seed=4, extent=6.0)
+    camera = Camera(position=[0.0, 1.0, -9.0], yaw=90.0, pitch=-5.0)
+    with_bvh = CPURenderer(scene, 40, 30, use_bvh=True).render(camera)
+    without = CPURenderer(scene, 40, 30, use_bvh=False).render(camera)
+    np.testing.assert_array_equal(with_bvh, without)
+
+
+def test_bvh_needs_fewer_intersection_tests():
+    scene = create_random_scene(200, 3, seed=4, extent=6.0)
+    camera = Camera(position=[0.0, 1.0, -9.0], yaw=90.0, pitch=-5.0)
+    _, with_bvh = CPURenderer(scene, 40, 30, use_bvh=True).render_counters(camera)
+    _, without = CPURenderer(scene, 40, 30, use_bvh=False).render_counters(camera)
+    assert with_bvh["intersection_tests"].sum() < without["intersection_tests"].sum() / 2
+
+
+def test_build_does_not_recurse_per_level():
+    # geometrically spaced spheres give a tree about 30 levels deep
+    centers = np.zeros((200, 3), dtype=np.float32)
+    centers[:, 0] = 1.5 ** np.arange(200)
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(len(inspect.stack()) + 20)
+    try:
+        bvh = BVH.from_spheres(centers, np.full(200, 0.1), leaf_size=1)
+    finally:
+        sys.setrecursionlimit(limit)
+    depth = np.zeros(bvh.node_count, dtype=np.int64)
+    for node in range(bvh.node_count):
+        depth[node + 1:bvh.skip[node]] += 1
+    assert depth.max() > 20
+    assert bvh.prim_count.sum() == 200
@@ -0,0 +1,66 @@
+import numpy as np
+from camera import Camera
+from camera_path import DEFAULT_POSITION, DEFAULT_YAW, DEFAULT_PITCH
+from cpu_renderer import CPURenderer, COUNTERS
+from scene import create_default_scene
+
+WIDTH, HEIGHT = 48, 32
+
+
+def default_camera():
+    return Camera(position=DEFAULT_POSITION, yaw=DEFAULT_YAW, pitch=DEFAULT_PITCH)
+
+
+def test_render_is_a_finite_color_image():
+    image = CPURenderer(create_default_scene(), WIDTH, HEIGHT).render(default_camera())
+    assert image.shape == (HEIGHT, WIDTH, 3)
+    assert image.dtype == np.float32
+    assert np.isfinite(image).all()
+    assert image.min() >= 0.0
+    # not a blank frame: sky, plane and spheres differ
+    assert len(np.unique(image.reshape(-1, 3), axis=0)) > 10
+
+
+def test_render_is_deterministic():
+    renderer = CPURenderer(create_default_scene(), WIDTH, HEIGHT)
+    np.testing.assert_array_equal(renderer.render(default_camera()), renderer.render(default_camera()))
+
+
+def test_tiles_assemble_into_the_full_frame():
+    renderer = CPURenderer(create_default_scene(), WIDTH, HEIGHT)
+    camera = default_camera()
+    full = renderer.render(camera)
+    tiled = np.zeros_like(full)
+    for y0 in range(0, HEIGHT, 16):
+        for x0 in range(0, WIDTH, 20):
+            x1, y1 = min(x0 + 20, WIDTH), min(y0 + 16, HEIGHT)
+            tiled[y0:y1, x0:x1] = renderer.render_tile(camera, x0, y0, x1, y1)
+    np.testing.assert_array_equal(tiled, full)
+
+
+def test_small_chunks_match_one_chunk():
+    scene = create_default_scene()
+    camera = default_camera()
+    whole = CPURenderer(scene, WIDTH, HEIGHT).render(camera)
+    chunked = CPURenderer(scene, WIDTH, HEIGHT, chunk_size=100).render(camera)
+    np.testing.assert_array_equal(chunked, whole)
+
+
+def test_render_counters_do_not_change_the_image():
+    renderer = CPURenderer(create_default_scene(), WIDTH, HEIGHT)
+    camera = default_camera()
+    image, counters = renderer.render_counters(camera)
+    np.testing.assert_array_equal(image, renderer.render(camera))
+    assert set(counters) == set(COUNTERS)
+    for values in counters.values():
+        assert values.shape == (HEIGHT, WIDTH)
+        assert values.min() >= 0
+
+
+def test_disabling_shadows_only_brightens():
+    scene = create_default_scene()
+    camera = default_camera()
+    shadowed = CPURenderer(scene, WIDTH, HEIGHT).render(camera)
+    unshadowed = CPURenderer(scene, WIDTH, HEIGHT, shadows=False).render(camera)
+    assert (unshadowed >= shadowed - 1e-5).all()
+    assert (unshadowed > shadowed + 1e-3).any()
@@ -0,0 +1,64 @@
+import numpy as np
+from denoise import COLOR_SIGMA, atrous, color_sigma
+
+HEIGHT, WIDTH = 24, 32
+
+
+def wall(depth):
+    # first hits on a wall facing the camera at z = depth
+    y, x = np.mgrid[0:HEIGHT, 0:WIDTH].astype(np.float32) * 0.1
+    position = np.stack([x, y, np.full_like(x, depth), np.full_like(x, depth)], axis=-1)
+    normal = np.zeros((HEIGHT, WIDTH, 3), dtype=np.float32)
+    normal[..., 2] = -1.0
+    return position, normal
+
+
+def noisy(color, seed=0, scale=0.1):
+    return (color + np.random.default_rng(seed).normal(0.0, scale, color.shape)).astype(np.float32)
+
+
+def test_color_sigma_follows_the_noise():
+    assert color_sigma(1) == COLOR_SIGMA
+    assert np.isclose(color_sigma(16), COLOR_SIGMA / 4)
+    assert color_sigma(0) == color_sigma(1)
+
+
+def test_constant_images_are_preserved():
+    position, normal = wall(5.0)
+    color = np.full((HEIGHT, WIDTH, 3), [0.2, 0.4, 0.6], dtype=np.float32)
+    np.testing.assert_allclose(atrous(color, position, normal), color, rtol=1e-5)
+
+
+def test_noise_on_a_flat_wall_is_reduced():
+    position, normal = wall(5.0)
+    color = noisy(np.full((HEIGHT, WIDTH, 3), 0.5, dtype=np.float32))
+    filtered = atrous(color, position, normal)
+    assert filtered.std() < color.std() / 3
+    assert np.isclose(filtered.mean(), color.mean(), atol=0.01)
+
+
+def test_sky_is_left_alone():
+    position, normal = wall(5.0)
+    position[:, :8, 3] = -1.0
+    color = noisy(np.full((HEIGHT, WIDTH, 3), 0.5, dtype=np.float32))
+    np.testing.assert_array_equal(atrous(color, position, normal)[:, :8], color[:, :8])
+
+
+def test_normal_edges_are_not_blurred():
+    position, normal = wall(5.0)
+    normal[:, WIDTH // 2:] = [1.0, 0.0, 0.0]
+    # close enough in color that only the normals keep the halves apart
+    color = np.full((HEIGHT, WIDTH, 3), 0.5, dtype=np.float32)
+    color[:, WIDTH // 2:] = 0.6
+    filtered = atrous(color, position, normal)
+    np.testing.assert_allclose(filtered, color, atol=1e-4)
+
+
+def test_depth_edges_are_not_blurred():
+    near, normal = wall(2.0)
+    far, _ = wall(8.0)
+    position = np.where((np.arange(WIDTH) < WIDTH // 2)[None, :, None], near, far)
+    color = np.full((HEIGHT, WIDTH, 3), 0.5, dtype=np.float32)
+    color[:, WIDTH // 2:] = 0.6
+    filtered = atrous(color, position, normal)
+    np.testing.assert_allclose(filtered, color, atol=1e-4)
@@ -0,0 +1,116 @@
+import struct
+import zlib
+import numpy as np
+import pytest
+from image_io import save_image, to_uint8, write_exr, write_png
+from sequence import FFmpegWriter, ImageSequenceWriter, export_sequence
+
+
+def gradient(height=5, width=7):
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    return np.stack([x / width, y / height, np.full_like(x, 1.5)], axis=2) - np.float32(0.1)
+
+
+def read_png(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    chunks = {}
+    pos = 8
+    while pos < len(data):
+        length, = struct.unpack(">I", data[pos:pos + 4])
+        tag, body = data[pos + 4:pos + 8], data[pos + 8:pos + 8 + length]
+        crc, = struct.unpack(">I", data[pos + 8 + length:pos + 12 + length])
+        assert crc == zlib.crc32(tag + body) & 0xFFFFFFFF
+        chunks[tag] = body
+        pos += 12 + length
+    width, height, depth, color_type = struct.unpack(">IIBB", chunks[b"IHDR"][:10])
+    assert depth == 8 and b"IEND" in chunks
+    channels = {0: 1, 2: 3, 6: 4}[color_type]
+    raw = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), dtype=np.uint8).reshape(height, width * channels + 1)
+    assert (raw[:, 0] == 0).all()
+    return raw[:, 1:].reshape(height, width, channels)
+
+
+def read_exr(path):
+    # only the layout write_exr produces: uncompressed scanlines of half B, G, R rows
+    with open(path, "rb") as f:
+        data = f.read()
+    assert struct.unpack("<ii", data[:8]) == (20000630, 2)
+    pos = 8
+    attributes = {}
+    while data[pos] != 0:
+        name_end = data.index(b"\0", pos)
+        kind_end = data.index(b"\0", name_end + 1)
+        size, = struct.unpack("<i", data[kind_end + 1:kind_end + 5])
+        attributes[data[pos:name_end]] = data[kind_end + 5:kind_end + 5 + size]
+        pos = kind_end + 5 + size
+    assert attributes[b"compression"] == b"\0"
+    x0, y0, x1, y1 = struct.unpack("<iiii", attributes[b"dataWindow"])
+    width, height = x1 - x0 + 1, y1 - y0 + 1
+    offsets = np.frombuffer(data, dtype="<u8", count=height, offset=pos + 1)
+    pixels = np.zeros((height, width, 3), dtype=np.float16)
+    for offset in offsets:
+        y, size = struct.unpack("<ii", data[offset:offset + 8])
+        assert size == width * 3 * 2
+        rows = np.frombuffer(data, dtype="<f2", count=width * 3, offset=offset + 8).reshape(3, width)
+        pixels[y] = rows[::-1].T
+    return pixels
+
+
+@pytest.mark.parametrize("channels", [1, 3, 4])
+def test_png_round_trip(tmp_path, channels):
+    pixels = np.random.default_rng(0).integers(0, 256, (6, 9, channels), dtype=np.uint8)
+    write_png(tmp_path / "image.png", pixels)
+    np.testing.assert_array_equal(read_png(tmp_path / "image.png"), pixels)
+
+
+def test_png_quantizes_float_images(tmp_path):
+    pixels = gradient()
+    save_image(str(tmp_path / "image.png"), pixels)
+    np.testing.assert_array_equal(read_png(tmp_path / "image.png"), to_uint8(pixels))
+    assert to_uint8(np.float32([[[-1.0, 0.5, 2.0]]])).tolist() == [[[0, 128, 255]]]
+
+
+def test_exr_keeps_half_float_values(tmp_path):
+    pixels = gradient()
+    save_image(str(tmp_path / "image.exr"), pixels)
+    np.testing.assert_array_equal(read_exr(tmp_path / "image.exr"), pixels.astype(np.float16))
+
+
+def test_exr_scales_8_bit_images(tmp_path):
+    pixels = np.random.default_rng(1).integers(0, 256, (4, 3, 3), dtype=np.uint8)
+    write_exr(tmp_path / "image.exr", pixels)
+    np.testing.assert_array_equal(read_exr(tmp_path / "image.exr"), (pixels / np.float32(255.0)).astype(np.float16))
+
+
+def test_unknown_extensions_are_rejected(tmp_path):
+    with pytest.raises(Exception, match="Unsupported image format"):
+        save_image(str(tmp_path / "image.bmp"), gradient())
+
+
+def test_sequence_writer_writes_every_frame(tmp_path):
+    frames = [to_uint8(gradient() * k / 4) for k in range(5)]
+    writer = ImageSequenceWriter(str(tmp_path / "frames" / "{:03d}.png"), workers=2, max_pending=2)
+    paths = export_sequence(iter(frames), writer)
+    assert paths == [str(tmp_path / "frames" / f"{k:03d}.png") for k in range(5)]
+    for path, pixels in zip(paths, frames):
+        np.testing.assert_array_equal(read_png(path), pixels)
+
+
+def test_sequence_writer_reraises_encoding_errors(tmp_path):
+    writer = ImageSequenceWriter(str(tmp_path / "{}.bmp"), workers=1)
+    writer.write(0, gradient())
+    with pytest.raises(Exception, match="Unsupported image format"):
+        writer.close()
+
+
+def test_dead_encoder_reports_its_exit_and_the_pipe_error(tmp_path):
+    # `false` exits at once like an ffmpeg that rejected its arguments, the frame then
+    # fails to reach it
+    writer = FFmpegWriter(str(tmp_path / "video.mp4"), 256, 256, ffmpeg="false")
+    writer.process.wait()
+    writer.write(0, np.zeros((256, 256, 3), dtype=np.uint8))
+    with pytest.raises(Exception, match="exited with status 1") as error:
+        writer.close()
+    assert isinstance(error.value.__cause__, BrokenPipeError)
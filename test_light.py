@@ -0,0 +1,67 @@
+import numpy as np
+from camera import Camera
+from cpu_renderer import CPURenderer
+from light import Light, LightArray, light_data, merge_lights
+from plane import Plane
+from scene import Scene
+from sphere import Sphere
+
+
+def lights(*rows):
+    return LightArray([Light(position, color) for position, color in rows])
+
+
+def test_distinct_lights_are_returned_unchanged():
+    array = lights(([0, 5, 0], [1, 1, 1]), ([3, 5, 0], [0.5, 0.2, 0.1]))
+    merged = merge_lights(array)
+    assert merged is array.data
+
+
+def test_lights_at_one_position_are_summed():
+    array = lights(([0, 5, 0], [0.25, 0.5, 0]), ([1, 5, 0], [1, 1, 1]), ([0, 5, 0], [0.25, 0, 0.5]))
+    merged = merge_lights(array)
+    np.testing.assert_array_equal(merged, np.array([
+        [[0, 5, 0], [0.5, 0.5, 0.5]],
+        [[1, 5, 0], [1, 1, 1]],
+    ], dtype=np.float32))
+
+
+def test_black_lights_are_dropped():
+    array = lights(([0, 5, 0], [0, 0, 0]), ([1, 5, 0], [1, 1, 1]))
+    np.testing.assert_array_equal(merge_lights(array), np.array([[[1, 5, 0], [1, 1, 1]]], dtype=np.float32))
+
+
+def test_merged_lights_keep_the_order_of_first_appearance():
+    array = lights(([9, 0, 0], [1, 0, 0]), ([1, 0, 0], [0, 1, 0]), ([9, 0, 0], [0, 0, 1]))
+    np.testing.assert_array_equal(merge_lights(array)[:, 0], [[9, 0, 0], [1, 0, 0]])
+
+
+def test_light_data_accepts_lists_and_arrays():
+    rows = [([0, 5, 0], [1, 1, 1]), ([3, 5, 0], [0.5, 0.2, 0.1])]
+    expected = lights(*rows).data
+    np.testing.assert_array_equal(light_data([Light(p, c) for p, c in rows]), expected)
+    np.testing.assert_array_equal(light_data(expected.reshape(-1)), expected)
+
+
+def test_merging_does_not_change_the_image():
+    def scene(lights):
+        plane = Plane(point=[0, -1, 0], normal=[0, 1, 0], color=[0.5, 0.5, 0.5], reflectivity=0.0)
+        return Scene([Sphere(center=[0, 0, 5], radius=1.0, color=[1, 0, 0])], plane, lights)
+
+    camera = Camera(position=[0, 0, 0], yaw=90.0)
+    split = scene([Light([2, 4, 2], [0.3, 0.3, 0.3]), Light([2, 4, 2], [0.2, 0.1, 0.0])])
+    merged = scene([Light([2, 4, 2], [0.5, 0.4, 0.3])])
+    np.testing.assert_allclose(CPURenderer(split, 32, 24).render(camera), CPURenderer(merged, 32, 24).render(camera),
+                               atol=1e-6)
+
+
+def test_shadow_rays_stop_at_the_light():
+    # a sphere beyond the light must not shadow the point the light is seen from
+    plane = Plane(point=[0, -10, 0], normal=[0, 1, 0], color=[0.5, 0.5, 0.5], reflectivity=0.0)
+    scene = Scene([Sphere(center=[0, 6, 0], radius=1.0, color=[1, 1, 1])], plane, [Light([0, 3, 0], [1, 1, 1])])
+    renderer = CPURenderer(scene, 4, 4)
+    renderer.prepare(scene.lights)
+    origin = np.zeros((2, 3), dtype=np.float32)
+    direction = np.array([[0, 1, 0], [0, 1, 0]], dtype=np.float32)
+    blocked = renderer.occluded(origin, direction, np.array([3.0, 8.0], dtype=np.float32))
+    np.testing.assert_array_equal(blocked, [False, True])
@@ -0,0 +1,54 @@
+import numpy as np
+from camera import Camera
+from camera_path import DEFAULT_POSITION, DEFAULT_YAW, DEFAULT_PITCH
+from cpu_renderer import CPURenderer
+from lighting_cache import LightingCache
+from scene import animate_lights, create_default_scene
+
+WIDTH, HEIGHT = 48, 32
+
+
+def default_camera():
+    return Camera(position=DEFAULT_POSITION, yaw=DEFAULT_YAW, pitch=DEFAULT_PITCH)
+
+
+def test_animated_frames_match_a_full_render():
+    scene = create_default_scene()
+    camera = default_camera()
+    renderer = CPURenderer(scene, WIDTH, HEIGHT)
+    cache = LightingCache(CPURenderer(scene, WIDTH, HEIGHT))
+    for time in np.linspace(0.0, 2.0, 6):
+        animate_lights(scene.lights, time)
+        np.testing.assert_allclose(cache.render(camera), renderer.render(camera), atol=1e-4, err_msg=f"time {time}")
+    # once when all lights look static, once more when the animated light turns dynamic
+    assert cache.rebuilds == 2
+
+
+def test_camera_and_geometry_changes_rebuild():
+    scene = create_default_scene()
+    camera = default_camera()
+    renderer = CPURenderer(scene, WIDTH, HEIGHT)
+    cache = LightingCache(CPURenderer(scene, WIDTH, HEIGHT))
+    cache.render(camera)
+    cache.render(camera)
+    assert cache.rebuilds == 1
+
+    camera.position = camera.position + np.float32([0.5, 0.0, 0.0])
+    np.testing.assert_allclose(cache.render(camera), renderer.render(camera), atol=1e-4)
+    scene.spheres[0].radius = 1.5
+    scene.mark_dirty()
+    np.testing.assert_allclose(cache.render(camera), renderer.render(camera), atol=1e-4)
+    assert cache.rebuilds == 3
+
+
+def test_renderer_keeps_all_lights_after_a_cached_frame():
+    scene = create_default_scene()
+    camera = default_camera()
+    renderer = CPURenderer(scene, WIDTH, HEIGHT)
+    cache = LightingCache(renderer)
+    for time in (0.0, 0.5):
+        animate_lights(scene.lights, time)
+        cache.render(camera)
+    # the shared renderer shades with the whole light set, not the cached subset
+    expected = CPURenderer(scene, WIDTH, HEIGHT).render(camera)
+    np.testing.assert_array_equal(renderer.render_tile(camera, 0, 0, WIDTH, HEIGHT), expected)
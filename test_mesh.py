@@ -0,0 +1,120 @@
+import os
+import numpy as np
+import pytest
+from camera import Camera
+from cpu_renderer import CPURenderer
+from light import Light
+from mesh import Mesh, load_mesh, load_obj, load_ply
+from plane import Plane
+from scene import Scene
+
+# a unit square in the z = 2 plane, as one quad
+VERTICES = np.float32([[-1, -1, 2], [1, -1, 2], [1, 1, 2], [-1, 1, 2]])
+TRIANGLES = np.int32([[0, 1, 2], [0, 2, 3]])
+
+
+def write_ply(path, fmt):
+    header = (f"ply\nformat {fmt} 1.0\ncomment test\nelement vertex 4\nproperty float x\nproperty float y\n"
+              "property float z\nproperty uchar red\nelement face 2\nproperty list uchar int vertex_indices\nend_header\n")
+    with open(path, "wb") as f:
+        f.write(header.encode("ascii"))
+        if fmt == "ascii":
+            for x, y, z in VERTICES:
+                f.write(f"{x} {y} {z} 255\n".encode())
+            f.write(b"3 0 1 2\n3 0 2 3\n")
+        else:
+            order = "<" if fmt == "binary_little_endian" else ">"
+            vertex = np.dtype([("p", order + "f4", 3), ("red", "u1")])
+            f.write(np.array([(v, 255) for v in VERTICES], dtype=vertex).tobytes())
+            face = np.dtype([("n", "u1"), ("i", order + "i4", 3)])
+            f.write(np.array([(3, t) for t in TRIANGLES], dtype=face).tobytes())
+
+
+def test_obj_faces_are_triangulated(tmp_path):
+    path = tmp_path / "quad.obj"
+    path.write_text("# quad\nv -1 -1 2\nv 1 -1 2\nv 1 1 2\nv -1 1 2\nvn 0 0 -1\nvt 0 0\nf 1/1/1 2/1/1 3/1/1 4/1/1\n")
+    vertices, indices = load_obj(path)
+    np.testing.assert_array_equal(vertices, VERTICES)
+    np.testing.assert_array_equal(indices, TRIANGLES)
+
+
+def test_obj_negative_indices_count_back(tmp_path):
+    path = tmp_path / "relative.obj"
+    path.write_text("v 0 0 0\nv 1 0 0\nv 0 1 0\nf -3 -2 -1\nv 5 5 5\nf 1 -1 3\n")
+    _, indices = load_obj(path)
+    np.testing.assert_array_equal(indices, [[0, 1, 2], [0, 3, 2]])
+
+
+@pytest.mark.parametrize("fmt", ["ascii", "binary_little_endian", "binary_big_endian"])
+def test_ply_formats(tmp_path, fmt):
+    path = tmp_path / "quad.ply"
+    write_ply(path, fmt)
+    vertices, indices = load_ply(path)
+    np.testing.assert_array_equal(vertices, VERTICES)
+    np.testing.assert_array_equal(indices, TRIANGLES)
+
+
+def test_ply_polygons_are_triangulated(tmp_path):
+    path = tmp_path / "quad.ply"
+    header = ("ply\nformat binary_little_endian 1.0\nelement vertex 4\nproperty float x\nproperty float y\n"
+              "property float z\nelement face 1\nproperty list uchar int vertex_indices\nend_header\n")
+    path.write_bytes(header.encode() + VERTICES.tobytes() + b"\x04" + np.int32([0, 1, 2, 3]).tobytes())
+    np.testing.assert_array_equal(load_ply(path)[1], TRIANGLES)
+
+
+def test_unsupported_files_are_rejected(tmp_path):
+    (tmp_path / "mesh.stl").write_text("solid")
+    (tmp_path / "mesh.ply").write_text("solid")
+    with pytest.raises(Exception, match="Unsupported mesh format"):
+        load_mesh(str(tmp_path / "mesh.stl"), None)
+    with pytest.raises(Exception, match="Not a PLY file"):
+        load_mesh(str(tmp_path / "mesh.ply"), None)
+
+
+def test_mesh_cache_round_trip(tmp_path):
+    path = tmp_path / "quad.ply"
+    write_ply(path, "ascii")
+    cache_dir = str(tmp_path / "cache")
+    vertices, indices = load_mesh(str(path), cache_dir)
+    assert sorted(os.listdir(cache_dir))[0].endswith(".indices.npy") and len(os.listdir(cache_dir)) == 2
+
+    cached_vertices, cached_indices = load_mesh(str(path), cache_dir)
+    assert isinstance(cached_vertices, np.memmap) and isinstance(cached_indices, np.memmap)
+    np.testing.assert_array_equal(cached_vertices, vertices)
+    np.testing.assert_array_equal(cached_indices, indices)
+
+    # a changed file gets a new entry instead of the stale one
+    write_ply(path, "binary_little_endian")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+    load_mesh(str(path), cache_dir)
+    assert len(os.listdir(cache_dir)) == 4
+
+
+def test_mesh_load_places_the_mesh(tmp_path):
+    path = tmp_path / "quad.obj"
+    path.write_text("v -1 -1 2\nv 1 -1 2\nv 1 1 2\nv -1 1 2\nf 1 2 3 4\n")
+    mesh = Mesh.load(str(path), position=(0, 1, 0), scale=2.0, cache_dir=str(tmp_path / "cache"),
+                     color=[1, 0, 0], reflectivity=0.5)
+    np.testing.assert_array_equal(mesh.vertices, VERTICES * 2 + np.float32([0, 1, 0]))
+    assert mesh.reflectivity == 0.5
+
+
+def test_out_of_range_indices_are_rejected():
+    with pytest.raises(Exception, match="out of range"):
+        Mesh(VERTICES, [[0, 1, 4]], color=[1, 1, 1])
+    with pytest.raises(Exception, match="out of range"):
+        Mesh(VERTICES, [[0, -1, 2]], color=[1, 1, 1])
+
+
+def test_meshes_are_rendered():
+    plane = Plane(point=[0, -5, 0], normal=[0, 1, 0], color=[0.5, 0.5, 0.5])
+    empty = Scene([], plane, [Light([0, 0, -5], [1, 1, 1])])
+    # wound so that the face normal points back at the camera and the light
+    mesh = Mesh(VERTICES, TRIANGLES[:, ::-1], color=[1, 0, 0])
+    scene = Scene([], plane, [Light([0, 0, -5], [1, 1, 1])], [mesh])
+    camera = Camera(position=[0, 0, 0], yaw=90.0)
+    image = CPURenderer(scene, 16, 16).render(camera)
+    background = CPURenderer(empty, 16, 16).render(camera)
+    # the square fills the centre of the view in its own color
+    assert image[8, 8, 0] > image[8, 8, 1] + 0.5
+    assert not np.allclose(image[8, 8], background[8, 8])
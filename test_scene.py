@@ -0,0 +1,76 @@
+import pickle
+import numpy as np
+from camera import Camera
+from cpu_renderer import CPURenderer
+from light import Light, LightArray
+from mesh import Mesh
+from plane import Plane
+from scene import Scene, animate_lights, create_default_scene
+from sphere import Sphere
+
+
+def small_scene():
+    spheres = [
+        Sphere(center=[0, 0, 5], radius=1.0, color=[1, 0, 0], reflectivity=0.2),
+        Sphere(center=[2, 0, 6], radius=0.5, color=[0, 0, 1], transparency=0.9, ior=1.3, absorption=[0.1, 0.2, 0.3]),
+    ]
+    plane = Plane(point=[0, -1, 0], normal=[0, 1, 0], color=[0.5, 0.5, 0.5], reflectivity=0.4)
+    return Scene(spheres, plane, [Light([0, 5, 0], [1, 1, 1]), Light([3, 5, 0], [0.5, 0.2, 0.1])])
+
+
+def test_objects_are_views_into_the_scene_buffer():
+    scene = small_scene()
+    assert scene.data.shape == (3, 4, 4)
+    scene.spheres[1].radius = 0.75
+    scene.spheres[0].color = [0, 1, 0]
+    scene.plane.reflectivity = 0.1
+    assert scene.data[1, 0, 3] == 0.75
+    np.testing.assert_array_equal(scene.data[0, 1, :3], [0, 1, 0])
+    assert scene.data[-1, 1, 3] == np.float32(0.1)
+    centers, radii = scene.sphere_arrays()
+    np.testing.assert_array_equal(centers, [[0, 0, 5], [2, 0, 6]])
+    np.testing.assert_array_equal(radii, [1.0, 0.75])
+
+
+def test_lights_are_views_into_the_light_buffer():
+    scene = small_scene()
+    animate_lights(scene.lights, 0.0)
+    np.testing.assert_array_equal(scene.lights.data[0, 0], [5, 5, 0])
+    scene.lights[1].color = [0, 0, 0]
+    np.testing.assert_array_equal(scene.lights.colors[1], [0, 0, 0])
+
+
+def test_adding_objects_keeps_the_views():
+    scene = small_scene()
+    first = scene.spheres[0]
+    scene.add_sphere(Sphere(center=[-2, 0, 4], radius=0.3, color=[1, 1, 0]))
+    scene.add_mesh(Mesh(np.eye(3, dtype=np.float32), np.array([[0, 1, 2]]), color=[0.2, 0.3, 0.4]))
+    assert scene.data.shape == (5, 4, 4) and scene.version == 2
+    first.radius = 2.0
+    assert scene.data[0, 0, 3] == 2.0
+    np.testing.assert_array_equal(scene.data[3, 1, :3], np.float32([0.2, 0.3, 0.4]))
+    np.testing.assert_array_equal(scene.data[-1], scene.plane.data)
+
+
+def test_pickle_round_trip_keeps_the_layout():
+    scene = small_scene()
+    copy = pickle.loads(pickle.dumps(scene))
+    np.testing.assert_array_equal(copy.data, scene.data)
+    np.testing.assert_array_equal(copy.lights.data, scene.lights.data)
+    assert isinstance(copy.lights, LightArray)
+    copy.spheres[0].radius = 3.0
+    copy.lights[0].position = [1, 2, 3]
+    assert copy.data[0, 0, 3] == 3.0
+    np.testing.assert_array_equal(copy.lights.data[0, 0], [1, 2, 3])
+    assert scene.spheres[0].radius == 1.0
+
+
+def test_from_data_adopts_the_buffer():
+    scene = create_default_scene()
+    copy = Scene.from_data(scene.data.copy(), LightArray.from_data(scene.lights.data))
+    assert len(copy.spheres) == len(scene.spheres)
+    copy.plane.color = [0, 0, 0]
+    np.testing.assert_array_equal(copy.data[-1, 1, :3], [0, 0, 0])
+    camera = Camera(position=[0, 1, -2], yaw=90.0)
+    np.testing.assert_array_equal(CPURenderer(Scene.from_data(scene.data.copy(), scene.lights), 32, 24).render(camera),
+                                  CPURenderer(scene, 32, 24).render(camera))
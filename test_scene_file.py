@@ -0,0 +1,152 @@
+import json
+import os
+import numpy as np
+import pytest
+from bvh import CACHED_ARRAYS
+from camera import Camera
+from cpu_renderer import CPURenderer
+from scene import create_default_scene
+from scene_file import SceneWatcher, load_scene, save_scene
+
+DESCRIPTION = {
+    "camera": {"position": [0.0, 1.0, -4.0], "yaw": 90.0, "pitch": -10.0},
+    "materials": {"glass": {"color": [0.9, 0.9, 0.9], "reflectivity": 0.1, "transparency": 0.95, "ior": 1.4}},
+    "spheres": [
+        {"center": [0.0, 0.0, 3.0], "radius": 1.0, "color": [1.0, 0.0, 0.0], "reflectivity": 0.3},
+        {"center": [1.5, 0.0, 4.0], "radius": 0.5, "material": "glass", "ior": 1.2},
+    ],
+    "plane": {"point": [0.0, -1.0, 0.0], "normal": [0.0, 1.0, 0.0], "color": [0.5, 0.5, 0.5], "reflectivity": 0.2},
+    "lights": [{"position": [2.0, 5.0, 0.0], "color": [1.0, 1.0, 1.0]}],
+}
+
+TOML = """
+camera = { position = [0.0, 1.0, -4.0], yaw = 90.0, pitch = -10.0 }
+plane = { point = [0.0, -1.0, 0.0], normal = [0.0, 1.0, 0.0], color = [0.5, 0.5, 0.5], reflectivity = 0.2 }
+
+[materials.glass]
+color = [0.9, 0.9, 0.9]
+reflectivity = 0.1
+transparency = 0.95
+ior = 1.4
+
+[[spheres]]
+center = [0.0, 0.0, 3.0]
+radius = 1.0
+color = [1.0, 0.0, 0.0]
+reflectivity = 0.3
+
+[[spheres]]
+center = [1.5, 0.0, 4.0]
+radius = 0.5
+material = "glass"
+ior = 1.2
+
+[[lights]]
+position = [2.0, 5.0, 0.0]
+color = [1.0, 1.0, 1.0]
+"""
+
+TRIANGLE = "v -1 0 5\nv 1 0 5\nv 0 {top} 5\nf 1 2 3\n"
+
+
+def write_json(path, description):
+    with open(path, "w") as f:
+        json.dump(description, f)
+    return str(path)
+
+
+def with_mesh(path="triangle.obj"):
+    return dict(DESCRIPTION, meshes=[{"path": path, "position": [0.0, 0.0, 1.0], "color": [0.0, 1.0, 0.0]}])
+
+
+def test_json_and_toml_describe_the_same_scene(tmp_path):
+    scene, camera = load_scene(write_json(tmp_path / "scene.json", DESCRIPTION), None, None)
+    (tmp_path / "scene.toml").write_text(TOML)
+    toml_scene, toml_camera = load_scene(str(tmp_path / "scene.toml"), None, None)
+    np.testing.assert_array_equal(toml_scene.data, scene.data)
+    np.testing.assert_array_equal(toml_scene.lights.data, scene.lights.data)
+    np.testing.assert_array_equal(toml_camera.position, camera.position)
+    # the named material with the entry's own fields on top
+    glass = scene.spheres[1]
+    assert glass.transparency == np.float32(0.95) and glass.ior == np.float32(1.2)
+    assert camera.pitch == -10.0
+
+
+def test_bad_descriptions_are_rejected(tmp_path):
+    with pytest.raises(Exception, match="Unknown material"):
+        load_scene(write_json(tmp_path / "a.json", dict(DESCRIPTION, spheres=[{"center": [0, 0, 0], "radius": 1, "material": "x"}])), None)
+    with pytest.raises(Exception, match="no plane"):
+        load_scene(write_json(tmp_path / "b.json", {"spheres": []}), None)
+    (tmp_path / "c.yaml").write_text("")
+    with pytest.raises(Exception, match="Unsupported scene format"):
+        load_scene(str(tmp_path / "c.yaml"), None)
+
+
+def test_second_load_maps_the_compiled_scene(tmp_path):
+    (tmp_path / "triangle.obj").write_text(TRIANGLE.format(top=1))
+    path = write_json(tmp_path / "scene.json", with_mesh())
+    cache_dir, mesh_cache_dir = str(tmp_path / "scenes"), str(tmp_path / "meshes")
+    scene, camera = load_scene(path, cache_dir, mesh_cache_dir)
+    cached, cached_camera = load_scene(path, cache_dir, mesh_cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+    assert isinstance(cached.data, np.memmap)
+    np.testing.assert_array_equal(cached.data, scene.data)
+    np.testing.assert_array_equal(cached.lights.data, scene.lights.data)
+    np.testing.assert_array_equal(cached.meshes[0].vertices, scene.meshes[0].vertices)
+    np.testing.assert_array_equal(cached.meshes[0].color, [0.0, 1.0, 0.0])
+    for name in CACHED_ARRAYS:
+        np.testing.assert_array_equal(getattr(cached.bvh(), name), getattr(scene.bvh(), name), err_msg=name)
+    np.testing.assert_array_equal(CPURenderer(cached, 32, 24).render(cached_camera), CPURenderer(scene, 32, 24).render(camera))
+
+    # edits stay in memory, the compiled entry is copy-on-write
+    cached.spheres[0].radius = 2.0
+    assert load_scene(path, cache_dir, mesh_cache_dir)[0].spheres[0].radius == 1.0
+
+
+def test_edited_meshes_invalidate_the_compiled_scene(tmp_path):
+    mesh_path = tmp_path / "triangle.obj"
+    mesh_path.write_text(TRIANGLE.format(top=1))
+    path = write_json(tmp_path / "scene.json", with_mesh())
+    cache_dir, mesh_cache_dir = str(tmp_path / "scenes"), str(tmp_path / "meshes")
+    load_scene(path, cache_dir, mesh_cache_dir)
+    mesh_path.write_text(TRIANGLE.format(top=3))
+    os.utime(mesh_path, ns=(0, os.stat(mesh_path).st_mtime_ns + 10 ** 9))
+    scene, _ = load_scene(path, cache_dir, mesh_cache_dir)
+    assert scene.meshes[0].vertices[:, 1].max() == 3.0
+    # the rebuilt entry is used from now on
+    assert load_scene(path, cache_dir, mesh_cache_dir)[0].meshes[0].vertices[:, 1].max() == 3.0
+
+
+def test_same_file_in_another_directory_uses_its_own_meshes(tmp_path):
+    cache_dir, mesh_cache_dir = str(tmp_path / "scenes"), str(tmp_path / "meshes")
+    tops = []
+    for name, top in (("a", 1), ("b", 2)):
+        os.makedirs(tmp_path / name)
+        (tmp_path / name / "triangle.obj").write_text(TRIANGLE.format(top=top))
+        scene, _ = load_scene(write_json(tmp_path / name / "scene.json", with_mesh()), cache_dir, mesh_cache_dir)
+        tops.append(scene.meshes[0].vertices[:, 1].max())
+    assert tops == [1.0, 2.0]
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_saved_scenes_load_back(tmp_path):
+    scene = create_default_scene()
+    camera = Camera(position=[0.5, 1.0, -3.0], yaw=80.0, pitch=-12.5)
+    save_scene(str(tmp_path / "scene.json"), scene, camera)
+    loaded, loaded_camera = load_scene(str(tmp_path / "scene.json"), None)
+    np.testing.assert_array_equal(loaded.data, scene.data)
+    np.testing.assert_array_equal(loaded.lights.data, scene.lights.data)
+    np.testing.assert_array_equal(loaded_camera.position, camera.position)
+    assert (loaded_camera.yaw, loaded_camera.pitch) == (camera.yaw, camera.pitch)
+
+
+def test_watcher_reports_each_change_once(tmp_path):
+    path = write_json(tmp_path / "scene.json", DESCRIPTION)
+    watcher = SceneWatcher(path, interval=1.0)
+    assert not watcher.changed(0.0)
+    write_json(tmp_path / "scene.json", dict(DESCRIPTION, lights=[]))
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+    # not polled again before the interval is up
+    assert not watcher.changed(0.5)
+    assert watcher.changed(1.0)
+    assert not watcher.changed(2.0)
@@ -0,0 +1,84 @@
+import numpy as np
+from camera import Camera, KEY_SPACE, KEY_W
+from light import Light, LightArray
+from scene import animate_lights
+from simulation import Simulation
+
+RATE = 50.0
+STEP = 1.0 / RATE
+
+
+def simulation(animate=animate_lights):
+    camera = Camera(position=[0.0, 0.0, 0.0], yaw=90.0, speed=0.5)
+    lights = LightArray([Light([0.0, 5.0, 0.0], [1.0, 1.0, 1.0]), Light([1.0, 2.0, 3.0], [0.5, 0.5, 0.5])])
+    return Simulation(camera, lights, animate=animate, rate=RATE)
+
+
+def test_steps_advance_by_a_fixed_time():
+    sim = simulation()
+    sim.set_keys({KEY_SPACE})
+    for k in range(1, 11):
+        sim.step(k * STEP)
+    assert np.isclose(sim.time, 10 * STEP)
+    # the camera moves by its speed once per step, whatever the frame rate
+    np.testing.assert_allclose(sim.camera.position, [0.0, 5.0, 0.0], atol=1e-5)
+    np.testing.assert_allclose(sim.lights[0].position, [5.0 * np.cos(sim.time), 5.0, 5.0 * np.sin(sim.time)], atol=1e-5)
+    np.testing.assert_array_equal(sim.lights[1].position, [1.0, 2.0, 3.0])
+
+
+def test_mouse_movement_is_consumed_once_and_pause_stops_the_clock():
+    sim = simulation()
+    sim.add_mouse_offset(100.0, 0.0)
+    sim.add_mouse_offset(50.0, 0.0)
+    sim.step(STEP)
+    sim.step(2 * STEP)
+    assert np.isclose(sim.camera.yaw, 90.0 + 150.0 * sim.camera.sensitivity)
+    sim.toggle_pause()
+    lights = sim.lights.data.copy()
+    sim.step(3 * STEP)
+    assert np.isclose(sim.time, 2 * STEP)
+    np.testing.assert_array_equal(sim.lights.data, lights)
+
+
+def test_frames_interpolate_between_the_last_two_steps():
+    sim = simulation()
+    sim.set_keys({KEY_W})
+    sim.step(1.0)
+    sim.step(1.0 + STEP)
+    previous, current = sim.previous, sim.current
+    camera = Camera(position=[9.0, 9.0, 9.0])
+    lights = LightArray([Light([0, 0, 0], [0, 0, 0]), Light([0, 0, 0], [0, 0, 0])])
+
+    time = sim.interpolate(camera, lights, now=1.0 + 1.5 * STEP)
+    assert np.isclose(time, (previous.time + current.time) / 2)
+    np.testing.assert_allclose(camera.position, (previous.position + current.position) / 2, atol=1e-6)
+    np.testing.assert_allclose(lights.data, (previous.lights + current.lights) / 2, atol=1e-6)
+
+    # clamped to the two states on either side
+    assert sim.interpolate(camera, lights, now=0.0) == previous.time
+    np.testing.assert_array_equal(camera.position, previous.position)
+    assert sim.interpolate(camera, lights, now=5.0) == current.time
+    np.testing.assert_array_equal(lights.data, current.lights)
+
+
+def test_new_lights_are_not_interpolated():
+    sim = simulation(animate=None)
+    sim.step(STEP)
+    replacement = LightArray([Light([4.0, 4.0, 4.0], [1.0, 0.0, 0.0])])
+    sim.set_lights(replacement)
+    lights = LightArray([Light([0, 0, 0], [0, 0, 0])])
+    sim.interpolate(Camera(position=[0, 0, 0]), lights, now=sim.current.stamp)
+    np.testing.assert_array_equal(lights.data, replacement.data)
+
+
+def test_thread_steps_until_stopped():
+    sim = simulation()
+    sim.start()
+    try:
+        sim.stop_event.wait(0.2)
+    finally:
+        sim.stop()
+    assert sim.thread is None
+    time = sim.time
+    assert time > 0.0
+    assert np.isclose(time / STEP, round(time / STEP))
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from bvh import BVH
+from camera import Camera
+from cpu_renderer import CPURenderer
+from plane import Plane
+from scene import Scene
+from tile_culling import bvh_cut, project_bounds
+
+WIDTH, HEIGHT = 40, 30
+
+
+def subtree_prims(bvh, node):
+    # the primitives of the leaves in [node, skip[node])
+    leaves = [n for n in range(node, int(bvh.skip[node])) if bvh.prim_count[n] > 0]
+    return np.concatenate([bvh.prim_indices[bvh.prim_start[n]:bvh.prim_start[n] + bvh.prim_count[n]] for n in leaves])
+
+
+def box_hits(ro, rd, bounds_min, bounds_max):
+    # slab test in double precision, True where the ray enters the box at t >= 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t0 = (bounds_min - ro) / rd
+        t1 = (bounds_max - ro) / rd
+    t0 = np.where(np.isnan(t0), -np.inf, t0)
+    t1 = np.where(np.isnan(t1), np.inf, t1)
+    near = np.minimum(t0, t1).max(axis=1)
+    far = np.maximum(t0, t1).min(axis=1)
+    return (near <= far) & (far >= 0.0)
+
+
+@pytest.mark.parametrize("count", [1, 7, 300])
+@pytest.mark.parametrize("target", [1, 16, 512])
+def test_cut_covers_every_primitive_once(count, target):
+    rng = np.random.default_rng(count)
+    bvh = BVH.from_spheres(rng.uniform(-10, 10, (count, 3)), rng.uniform(0.1, 1.0, count))
+    cut = bvh_cut(bvh, target)
+    prims = np.concatenate([subtree_prims(bvh, node) for node in cut])
+    np.testing.assert_array_equal(np.sort(prims), np.arange(count))
+    if target == 1:
+        np.testing.assert_array_equal(cut, [0])
+
+
+def test_cut_of_an_empty_tree_is_empty():
+    assert len(bvh_cut(BVH.from_spheres(np.zeros((0, 3)), np.zeros(0)))) == 0
+
+
+def boxes():
+    rng = np.random.default_rng(5)
+    lo = rng.uniform(-6.0, 6.0, (200, 3))
+    random = (lo, lo + rng.uniform(0.1, 3.0, (200, 3)))
+    # integer boxes, several with corners exactly on the camera's z plane or axes
+    lo = rng.integers(-3, 3, (200, 3)).astype(np.float64)
+    integer = (lo, lo + rng.integers(1, 3, (200, 3)))
+    single = (np.zeros((1, 3)), np.full((1, 3), 2.0))
+    return [np.concatenate(parts) for parts in zip(random, integer, single)]
+
+
+@pytest.mark.parametrize("position, yaw, pitch", [
+    ([0.0, 1.0, 0.0], 90.0, 0.0),
+    ([0.0, 0.0, -8.0], 90.0, -10.0),
+    ([1.0, 0.5, 2.0], -90.0, 20.0),
+    ([0.0, 0.0, 0.0], 60.0, 0.0),
+])
+def test_projection_covers_every_pixel_that_hits_the_box(position, yaw, pitch):
+    bounds_min, bounds_max = boxes()
+    camera = Camera(position=position, yaw=yaw, pitch=pitch)
+    renderer = CPURenderer(Scene([], Plane(point=[0, -1, 0], normal=[0, 1, 0], color=[0.5, 0.5, 0.5]), []), WIDTH, HEIGHT)
+    ro, rd = renderer.primary_rays(camera)
+    # rows of primary_rays run top to bottom, the rectangles are in gl_FragCoord pixels
+    y, x = np.mgrid[HEIGHT - 1:-1:-1, 0:WIDTH]
+    centre_x, centre_y = x.ravel() + 0.5, y.ravel() + 0.5
+
+    rects, behind = project_bounds(bounds_min, bounds_max, camera, WIDTH, HEIGHT)
+    assert np.isfinite(rects[~behind]).all()
+    checked = 0
+    for box in np.flatnonzero(~behind):
+        hits = box_hits(ro.astype(np.float64), rd.astype(np.float64), bounds_min[box], bounds_max[box])
+        x0, y0, x1, y1 = rects[box]
+        inside = (centre_x >= x0 - 1e-3) & (centre_x <= x1 + 1e-3) & (centre_y >= y0 - 1e-3) & (centre_y <= y1 + 1e-3)
+        assert inside[hits].all(), box
+        checked += hits.sum()
+    assert checked > 0
+
+
+def test_corners_on_the_camera_plane_count_as_behind():
+    # corners with d.z == 0 used to give NaN rectangles that culled the box everywhere
+    camera = Camera(position=[0.0, 1.0, 0.0], yaw=90.0)
+    rects, behind = project_bounds(np.zeros((1, 3)), np.full((1, 3), 2.0), camera, WIDTH, HEIGHT)
+    assert behind[0]
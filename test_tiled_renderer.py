@@ -0,0 +1,48 @@
+from multiprocessing import shared_memory
+import numpy as np
+import pytest
+from camera import Camera
+from camera_path import DEFAULT_POSITION, DEFAULT_YAW, DEFAULT_PITCH
+from cpu_renderer import CPURenderer
+from scene import create_default_scene
+from tiled_renderer import TiledRenderer, split_tiles
+
+
+def default_camera():
+    return Camera(position=DEFAULT_POSITION, yaw=DEFAULT_YAW, pitch=DEFAULT_PITCH)
+
+
+def test_tiles_cover_every_pixel_once():
+    coverage = np.zeros((17, 33), dtype=np.int64)
+    for x0, y0, x1, y1 in split_tiles(33, 17, 8):
+        coverage[y0:y1, x0:x1] += 1
+    assert (coverage == 1).all()
+
+
+def test_tiled_render_matches_the_cpu_renderer():
+    scene = create_default_scene()
+    camera = default_camera()
+    renderer = TiledRenderer(scene, 70, 45, workers=2, tile_size=24, max_bounces=3)
+    try:
+        for width, height in ((70, 45), (33, 17)):
+            if (width, height) != (renderer.width, renderer.height):
+                renderer.resize(width, height)
+            reference = CPURenderer(scene, width, height, max_bounces=3)
+            np.testing.assert_array_equal(renderer.render(camera), reference.render(camera))
+            assert renderer.ray_count == reference.ray_count
+        # the same frame again, after the workers have attached the new framebuffer
+        np.testing.assert_array_equal(renderer.render(camera), reference.render(camera))
+    finally:
+        renderer.cleanup()
+
+
+def test_cleanup_releases_the_framebuffer():
+    renderer = TiledRenderer(create_default_scene(), 16, 8, workers=1)
+    name = renderer.framebuffer_block.name
+    renderer.resize(8, 8)
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+    name = renderer.framebuffer_block.name
+    renderer.cleanup()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from camera import Camera
+from camera_path import DEFAULT_POSITION, DEFAULT_YAW, DEFAULT_PITCH
+from cpu_renderer import CPURenderer
+from scene import create_default_scene, create_random_scene
+from wavefront import WavefrontRenderer
+
+WIDTH, HEIGHT = 48, 32
+
+SCENES = {
+    "default": (create_default_scene, Camera(position=DEFAULT_POSITION, yaw=DEFAULT_YAW, pitch=DEFAULT_PITCH)),
+    # enough spheres for the BVH, some of them transparent
+    "random": (lambda: create_random_scene(150, 3, seed=2, extent=5.0), Camera(position=[0.0, 1.0, -8.0], yaw=90.0, pitch=-8.0)),
+}
+
+
+@pytest.mark.parametrize("name", sorted(SCENES))
+@pytest.mark.parametrize("max_bounces", [1, 6])
+def test_wavefront_matches_the_cpu_renderer(name, max_bounces):
+    create, camera = SCENES[name]
+    scene = create()
+    expected = CPURenderer(scene, WIDTH, HEIGHT, max_bounces=max_bounces).render(camera)
+    image = WavefrontRenderer(scene, WIDTH, HEIGHT, max_bounces=max_bounces).render(camera)
+    np.testing.assert_array_equal(image, expected)
+
+
+@pytest.mark.parametrize("name", sorted(SCENES))
+def test_wavefront_counters_match_the_cpu_renderer(name):
+    create, camera = SCENES[name]
+    scene = create()
+    expected_image, expected = CPURenderer(scene, WIDTH, HEIGHT).render_counters(camera)
+    image, counters = WavefrontRenderer(scene, WIDTH, HEIGHT).render_counters(camera)
+    np.testing.assert_array_equal(image, expected_image)
+    assert set(counters) == set(expected)
+    for key in expected:
+        np.testing.assert_array_equal(counters[key], expected[key], err_msg=key)
+
+
+def test_small_batches_match_one_batch():
+    create, camera = SCENES["random"]
+    scene = create()
+    expected = WavefrontRenderer(scene, WIDTH, HEIGHT).render(camera)
+    np.testing.assert_array_equal(WavefrontRenderer(scene, WIDTH, HEIGHT, chunk_size=97).render(camera), expected)
+
+
+def test_bounce_rays_are_counted_per_depth():
+    create, camera = SCENES["default"]
+    renderer = WavefrontRenderer(create(), WIDTH, HEIGHT, max_bounces=3)
+    renderer.render(camera)
+    bounce_rays = renderer.stats["bounce_rays"]
+    assert bounce_rays[0] == WIDTH * HEIGHT
+    assert (np.diff(bounce_rays) <= 0).all()
@@ -0,0 +1,155 @@
+import numpy as np
+from OpenGL.GL import *
+
+# sampler name -> (texture unit, texel format), the units after the G-buffer
+TILE_TEXTURES = {
+    "tile_ranges": (8, GL_RG32I),
+    "tile_nodes": (9, GL_R32I),
+}
+TILE_SIZE = 16
+# buffer sets cycled through, so that an upload does not wait for the draws still
+# reading the previous lists
+BUFFER_SETS = 3
+# about this many BVH subtrees are binned, small scenes use their leaves
+TARGET_CUT = 512
+# fov of the shader's camera
+FOCAL = np.tan(np.radians(45.0) / 2.0)
+# the eight corners of a box as (x, y, z) picks of its max corner
+CORNERS = np.array([[(i >> axis) & 1 for axis in range(3)] for i in range(8)], dtype=bool)
+
+
+def bvh_cut(bvh, target=TARGET_CUT):
+    # Topmost nodes whose subtrees hold at most 1 / target of the primitives (or are
+    # leaves). Together they cover every primitive exactly once.
+    if bvh.node_count == 0:
+        return np.zeros(0, dtype=np.int64)
+    counts = np.concatenate([[0], np.cumsum(bvh.prim_count)])
+    subtree = counts[bvh.skip] - counts[:-1]
+    limit = max(int(subtree[0]) // target, 1)
+    cut = []
+    node = 0
+    while node < bvh.node_count:
+        if subtree[node] <= limit or bvh.prim_count[node] > 0:
+            cut.append(node)
+            node = int(bvh.skip[node])
+        else:
+            node += 1
+    return np.array(cut, dtype=np.int64)
+
+
+def project_bounds(bounds_min, bounds_max, camera, width, height):
+    # Pixel rectangles (x0, y0, x1, y1) around boxes, inverting the shader's camera
+    # model: a ray is dir + (u, v, 0) scaled by some k > 0. Boxes with a corner on or
+    # behind that image plane are flagged, their rays can come from anywhere.
+    direction = np.asarray(camera.direction, dtype=np.float64)
+    corners = np.where(CORNERS, bounds_max[:, None, :], bounds_min[:, None, :])
+    d = corners - np.asarray(camera.position, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        k = direction[2] / d[..., 2]
+        u = (k * d[..., 0] - direction[0]) / (FOCAL * width / height)
+        v = (k * d[..., 1] - direction[1]) / FOCAL
+    # a corner on the plane (d.z == 0) gives an infinite k and an infinite or NaN u, v
+    behind = ~((k > 0.0) & np.isfinite(u) & np.isfinite(v)).all(axis=1)
+    x = (np.where(behind[:, None], 0.0, u) + 1.0) * 0.5 * width
+    y = (np.where(behind[:, None], 0.0, v) + 1.0) * 0.5 * height
+    return np.stack([x.min(axis=1), y.min(axis=1), x.max(axis=1), y.max(axis=1)], axis=1), behind
+
+
+class TileCuller:
+    # Screen-space culling for primary rays. A cut through the BVH is projected to
+    # the screen every frame and each tile lists the subtrees that overlap it,
+    # nearest first, so a primary ray only walks those. Tiles that see nothing but
+    # sky and plane get empty lists. Secondary and shadow rays start anywhere and
+    # keep using the whole tree.
+    def __init__(self, tile_size=TILE_SIZE):
+        self.tile_size = tile_size
+        self.buffer_sets = [
+            ({name: glGenBuffers(1) for name in TILE_TEXTURES}, {name: glGenTextures(1) for name in TILE_TEXTURES})
+            for _ in range(BUFFER_SETS)
+        ]
+        self.buffer_set = 0
+        self.buffers, self.textures = self.buffer_sets[0]
+        self.cut_state = None
+        self.lists = None
+        # tiles per row and column, (0, 0) turns culling off in the shader
+        self.grid = (0, 0)
+        # subtree entries over all tiles in the last update
+        self.entries = 0
+        self.upload("tile_ranges", np.zeros((0, 2), dtype=np.int32))
+        self.upload("tile_nodes", np.zeros(0, dtype=np.int32))
+
+    def update(self, camera, scene, width, height):
+        state = (id(scene), scene.version)
+        if state != self.cut_state:
+            bvh = scene.bvh()
+            self.cut = bvh_cut(bvh)
+            self.cut_min = bvh.node_min[self.cut].astype(np.float64)
+            self.cut_max = bvh.node_max[self.cut].astype(np.float64)
+            self.cut_state = state
+
+        if abs(camera.direction[2]) < 1e-3:
+            # the image plane is edge-on, nothing projects sensibly
+            self.grid = (0, 0)
+            self.entries = 0
+            return
+
+        tiles_x = -(-width // self.tile_size)
+        tiles_y = -(-height // self.tile_size)
+        rects, behind = project_bounds(self.cut_min, self.cut_max, camera, width, height)
+        # one pixel of slack for jittered samples and float differences with the GPU
+        rects += [-1.0, -1.0, 1.0, 1.0]
+        visible = behind | ((rects[:, 2] >= 0.0) & (rects[:, 0] < width) & (rects[:, 3] >= 0.0) & (rects[:, 1] < height))
+        tx0 = np.where(behind, 0, np.clip(np.floor(rects[:, 0] / self.tile_size), 0, tiles_x - 1)).astype(np.int64)
+        ty0 = np.where(behind, 0, np.clip(np.floor(rects[:, 1] / self.tile_size), 0, tiles_y - 1)).astype(np.int64)
+        tx1 = np.where(behind, tiles_x - 1, np.clip(np.floor(rects[:, 2] / self.tile_size), 0, tiles_x - 1)).astype(np.int64)
+        ty1 = np.where(behind, tiles_y - 1, np.clip(np.floor(rects[:, 3] / self.tile_size), 0, tiles_y - 1)).astype(np.int64)
+
+        # near subtrees first, their hits shorten the walk through the ones behind
+        position = np.asarray(camera.position, dtype=np.float64)
+        distance = np.linalg.norm(np.maximum(np.maximum(self.cut_min - position, position - self.cut_max), 0.0), axis=1)
+        order = np.argsort(distance, kind="stable")
+        order = order[visible[order]]
+
+        # every (tile, subtree) pair, then grouped by tile keeping the distance order
+        columns = (tx1 - tx0 + 1)[order]
+        counts = columns * (ty1 - ty0 + 1)[order]
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        tile_x = np.repeat(tx0[order], counts) + local % np.repeat(columns, counts)
+        tile_y = np.repeat(ty0[order], counts) + local // np.repeat(columns, counts)
+        tile = tile_y * tiles_x + tile_x
+        grouped = np.argsort(tile, kind="stable")
+        nodes = np.repeat(self.cut[order], counts)[grouped].astype(np.int32)
+
+        per_tile = np.bincount(tile, minlength=tiles_x * tiles_y)
+        ranges = np.stack([np.cumsum(per_tile) - per_tile, per_tile], axis=1).astype(np.int32)
+        self.grid = (tiles_x, tiles_y)
+        self.entries = len(nodes)
+        # small camera moves often leave every list as it was
+        if self.lists is not None and all(map(np.array_equal, self.lists, (ranges, nodes))):
+            return
+        self.lists = (ranges, nodes)
+        self.buffer_set = (self.buffer_set + 1) % BUFFER_SETS
+        self.buffers, self.textures = self.buffer_sets[self.buffer_set]
+        self.upload("tile_ranges", ranges)
+        self.upload("tile_nodes", nodes)
+
+    def upload(self, name, data):
+        _, texel_format = TILE_TEXTURES[name]
+        glBindBuffer(GL_TEXTURE_BUFFER, self.buffers[name])
+        # an empty buffer cannot back a texture, keep at least one texel around
+        glBufferData(GL_TEXTURE_BUFFER, max(data.nbytes, 16), data if data.size else None, GL_STREAM_DRAW)
+        glBindBuffer(GL_TEXTURE_BUFFER, 0)
+
+        glBindTexture(GL_TEXTURE_BUFFER, self.textures[name])
+        glTexBuffer(GL_TEXTURE_BUFFER, texel_format, self.buffers[name])
+        glBindTexture(GL_TEXTURE_BUFFER, 0)
+
+    def bind(self):
+        for name, (unit, _) in TILE_TEXTURES.items():
+            glActiveTexture(GL_TEXTURE0 + unit)
+            glBindTexture(GL_TEXTURE_BUFFER, self.textures[name])
+
+    def cleanup(self):
+        for buffers, textures in self.buffer_sets:
+            glDeleteTextures(len(textures), list(textures.values()))
+            glDeleteBuffers(len(buffers), list(buffers.values()))
@@ -0,0 +1,110 @@
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from cpu_renderer import CPURenderer
+
+# per-process state of a pool worker: attached shared memory blocks and the
+# renderer for the frame that is currently being traced
+_worker = {"frame": None, "renderer": None, "camera": None, "blocks": {}}
+
+
+def split_tiles(width, height, tile_size):
+    # (x0, y0, x1, y1) rectangles covering the image, rows counted from the top
+    return [
+        (x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+        for y0 in range(0, height, tile_size)
+        for x0 in range(0, width, tile_size)
+    ]
+
+
+def _attach(name):
+    blocks = _worker["blocks"]
+    if name not in blocks:
+        # drop blocks of earlier frames / framebuffer sizes before attaching new ones
+        for block in blocks.values():
+            block.close()
+        blocks.clear()
+        blocks[name] = shared_memory.SharedMemory(name=name)
+    return blocks[name]
+
+
+def _load_frame(frame, state_name, state_size):
+    # the scene, camera and lights are pickled once per frame into shared memory
+    # and unpickled once per worker, tasks only carry the frame number
+    if _worker["frame"] == frame:
+        return
+    block = shared_memory.SharedMemory(name=state_name)
+    try:
+        scene, camera, lights, width, height, options = pickle.loads(block.buf[:state_size])
+    finally:
+        block.close()
+    renderer = CPURenderer(scene, width, height, **options)
+    renderer.prepare(lights)
+    _worker.update(frame=frame, renderer=renderer, camera=camera)
+
+
+def _render_tile(frame, state_name, state_size, framebuffer_name, x0, y0, x1, y1):
+    _load_frame(frame, state_name, state_size)
+    renderer = _worker["renderer"]
+    framebuffer = np.ndarray((renderer.height, renderer.width, 3), dtype=np.float32,
+                             buffer=_attach(framebuffer_name).buf)
+
+    renderer.ray_count = 0
+    framebuffer[y0:y1, x0:x1] = renderer.render_tile(_worker["camera"], x0, y0, x1, y1)
+    return renderer.ray_count
+
+
+class TiledRenderer:
+    # CPURenderer split into tiles that are traced by a pool of processes. Tiles write
+    # straight into a shared framebuffer, so no pixel data goes through pickling.
+    def __init__(self, scene, width=1200, height=800, workers=None, tile_size=128, **options):
+        self.scene = scene
+        self.tile_size = tile_size
+        self.options = options
+        self.workers = workers or os.cpu_count()
+        self.pool = ProcessPoolExecutor(self.workers)
+        self.frame = 0
+        self.ray_count = 0
+        self.framebuffer_block = None
+        self.resize(width, height)
+
+    def resize(self, width, height):
+        self.width = width
+        self.height = height
+        if self.framebuffer_block is not None:
+            self.framebuffer_block.close()
+            self.framebuffer_block.unlink()
+        self.framebuffer_block = shared_memory.SharedMemory(create=True, size=width * height * 3 * 4)
+        self.framebuffer = np.ndarray((height, width, 3), dtype=np.float32, buffer=self.framebuffer_block.buf)
+
+    def tiles(self):
+        return split_tiles(self.width, self.height, self.tile_size)
+
+    def render(self, camera, lights=None):
+        lights = self.scene.lights if lights is None else lights
+        # built here once instead of in every worker
+        self.scene.bvh()
+        state = pickle.dumps((self.scene, camera, lights, self.width, self.height, self.options),
+                             protocol=pickle.HIGHEST_PROTOCOL)
+        state_block = shared_memory.SharedMemory(create=True, size=len(state))
+        state_block.buf[:len(state)] = state
+        self.frame += 1
+
+        try:
+            futures = [
+                self.pool.submit(_render_tile, self.frame, state_block.name, len(state),
+                                 self.framebuffer_block.name, *tile)
+                for tile in self.tiles()
+            ]
+            self.ray_count = sum(future.result() for future in futures)
+        finally:
+            state_block.close()
+            state_block.unlink()
+        return self.framebuffer.copy()
+
+    def cleanup(self):
+        self.pool.shutdown()
+        self.framebuffer_block.close()
+        self.framebuffer_block.unlink()
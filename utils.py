@@ -12,5 +12,5 @@ def mouse_callback(window, xpos, ypos):
     app.lastX = xpos
     app.lastY = ypos
 
-    app.camera.process_mouse_movement(xoffset, yoffset)
+    app.simulation.add_mouse_offset(xoffset, yoffset)
 
@@ -0,0 +1,153 @@
+import numpy as np
+from cpu_renderer import CPURenderer, EPSILON, sky_color, reflect, refract, fresnel_schlick, dot
+
+# material classes, rays are sorted by them so every spawn stage works on a slice
+DIFFUSE = 0
+REFLECTIVE = 1
+TRANSPARENT = 2
+
+
+class RayQueue:
+    # structure of arrays for the rays in flight; `pixel` maps each ray back to its
+    # row in the color buffer and `depth` counts its bounces
+    def __init__(self, pixel, depth, ro, rd, attenuation):
+        self.pixel = pixel
+        self.depth = depth
+        self.ro = ro
+        self.rd = rd
+        self.attenuation = attenuation
+
+    def __len__(self):
+        return len(self.pixel)
+
+    def take(self, order):
+        return RayQueue(self.pixel[order], self.depth[order], self.ro[order], self.rd[order], self.attenuation[order])
+
+    def extend(self, other):
+        return RayQueue(*(np.concatenate(pair) for pair in zip(
+            (self.pixel, self.depth, self.ro, self.rd, self.attenuation),
+            (other.pixel, other.depth, other.ro, other.rd, other.attenuation))))
+
+
+class Hits:
+    def __init__(self, t, index, position, normal):
+        self.t = t
+        self.index = index
+        self.position = position
+        self.normal = normal
+
+    def take(self, order):
+        return Hits(self.t[order], self.index[order], self.position[order], self.normal[order])
+
+
+class WavefrontRenderer(CPURenderer):
+    # CPURenderer.trace() restructured into stages over one ray queue:
+    # generate -> intersect -> sort/compact -> shade -> spawn.
+    # The queue is streamed: whenever rays terminate, new primary rays fill it back up
+    # to chunk_size, so late bounces do not run on a handful of rays. After sorting
+    # by material, terminated rays are a prefix of the queue and every spawn stage
+    # runs over one contiguous slice instead of masked gathers.
+    def prepare(self, lights):
+        super().prepare(lights)
+        transparent = (self.transparency > 0.0) & self.refraction
+        self.material_class = np.where(transparent, TRANSPARENT, np.where(self.reflectivity > 0.0, REFLECTIVE, DIFFUSE))
+        # rays entering each bounce and number of stage passes, for tuning
+        self.stats = {"bounce_rays": np.zeros(self.max_bounces, dtype=np.int64), "passes": 0}
+
+    def trace_batch(self, ro, rd):
+        color = np.zeros_like(rd)
+        queue = self.generate(ro, rd, 0, 0)
+        generated = 0
+
+        while self.max_bounces > 0:
+            if len(queue) < self.chunk_size and generated < len(rd):
+                count = min(self.chunk_size - len(queue), len(rd) - generated)
+                queue = queue.extend(self.generate(ro, rd, generated, count))
+                generated += count
+            if len(queue) == 0:
+                break
+
+            self.stats["passes"] += 1
+            self.stats["bounce_rays"] += np.bincount(queue.depth, minlength=self.max_bounces)
+            hits = self.intersect(queue)
+            queue, hits, classes = self.sort(queue, hits, color)
+            self.shade(queue, hits, color)
+            queue = self.spawn(queue, hits, classes, color)
+
+        return color
+
+    def trace(self, ro, rd):
+        return self.trace_batch(ro, rd)
+
+    def generate(self, ro, rd, start, count):
+        end = start + count
+        return RayQueue(np.arange(start, end), np.zeros(count, dtype=np.int64), ro[start:end], rd[start:end],
+                        np.ones((count, 3), dtype=np.float32))
+
+    def intersect(self, queue):
+        self.count("bounces", queue.pixel[queue.depth > 0])
+        return Hits(*self.nearest_hit(queue.ro, queue.rd, queue.pixel))
+
+    def sort(self, queue, hits, color):
+        # misses pick up the sky and leave the queue, the rest is ordered by
+        # material class and then object
+        miss = hits.index < 0
+        color[queue.pixel[miss]] += queue.attenuation[miss] * sky_color(queue.rd[miss])
+
+        index = np.where(miss, 0, hits.index)
+        key = np.where(miss, -1, self.material_class[index] * (self.plane_index + 1) + index)
+        order = np.argsort(key, kind='stable')[np.count_nonzero(miss):]
+        queue, hits = queue.take(order), hits.take(order)
+        classes = np.searchsorted(self.material_class[hits.index], [REFLECTIVE, TRANSPARENT])
+        return queue, hits, classes
+
+    def shade(self, queue, hits, color):
+        self.add_lighting(color, queue.pixel, queue.attenuation, hits.position, hits.normal, hits.index, queue.rd)
+
+    def spawn(self, queue, hits, classes, color):
+        reflective, transparent = classes
+        # diffuse rays end here, they are the prefix of the sorted queue
+        queue, hits = queue.take(slice(reflective, None)), hits.take(slice(reflective, None))
+        transparent -= reflective
+
+        rd = queue.rd
+        next_dir = np.empty_like(rd)
+        reflectivity = self.reflectivity[hits.index]
+
+        r = slice(0, transparent)
+        queue.attenuation[r] *= reflectivity[r][:, None]
+        next_dir[r] = reflect(rd[r], hits.normal[r])
+
+        t = slice(transparent, None)
+        if len(queue) > transparent:
+            self.spawn_transparent(queue.take(t), hits.take(t), next_dir[t], color)
+
+        queue.rd = next_dir
+        queue.ro = hits.position + next_dir * EPSILON
+        queue.depth = queue.depth + 1
+        # rays that used up their bounces leave the queue
+        return queue.take(queue.depth < self.max_bounces)
+
+    def spawn_transparent(self, queue, hits, next_dir, color):
+        rd, normal, index = queue.rd, hits.normal, hits.index
+        reflectivity = self.reflectivity[index]
+        transparency = self.transparency[index]
+        ior = self.ior[index]
+        kr, total_internal = fresnel_schlick(rd, normal, np.float32(1.0), ior)
+
+        # partial reflection, traced one level deep like computeReflectionColor()
+        partial = ~total_internal & (kr > 0.0)
+        if partial.any():
+            reflect_dir = reflect(rd[partial], normal[partial])
+            weight = queue.attenuation[partial] * (kr[partial] * reflectivity[partial])[:, None]
+            self.add_reflection(color, queue.pixel[partial], weight, hits.position[partial] + reflect_dir * EPSILON, reflect_dir)
+        kr = np.where(total_internal, np.float32(1.0), kr)
+
+        # refraction with Beer-Lambert absorption, total internal reflection otherwise
+        refracting = kr < 1.0
+        entering = dot(rd, normal) <= 0.0
+        n = np.where(entering[:, None], normal, -normal)
+        eta = np.where(entering, 1.0 / ior, ior).astype(np.float32)
+        absorb = np.exp(-self.absorption[index] * hits.t[:, None]) * ((1.0 - kr) * transparency)[:, None]
+        queue.attenuation *= np.where(refracting[:, None], absorb, reflectivity[:, None])
+        next_dir[:] = np.where(refracting[:, None], refract(rd, n, eta), reflect(rd, normal))